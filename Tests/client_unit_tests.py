@@ -11,11 +11,16 @@ import unittest
 from unittest.mock import patch, Mock
 import sys
 import json
+import pickle
 from io import StringIO
 import os
 import socket
 import configparser
 import inspect
+import threading
+import time
+import tempfile
+import shutil
 from cryptography.fernet import Fernet
 
 currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
@@ -24,7 +29,11 @@ sys.path.insert(0, parentdir)
 
 from simple_client import dict_serialisation, data_encryption, read_file\
 , reading_config, create_socket, connect_server, text_file_process\
-, dictionary_process, send_to_server, main_function
+, dictionary_process, send_to_server, main_function, is_large_file\
+, stream_file, send_file, dictionary_content_type, Client, ConnectionPool\
+, is_alive, cipher_option, codec_option, compress_data, choose_codec\
+, record_chunks, stream_records
+import protocol
 
 
 
@@ -105,18 +114,38 @@ class TestDictionarySerialisation(unittest.TestCase):
         dictionary = "{'Test': 1, 'Data': 2, 'Sample': 3}"
         serialise = True
         data_format = 'binary'
-        exp_output = str(b"\x80\x04\x95'\x00\x00\x00\x00\x00\x00\x00\x8c#\
-{'Test': 1, 'Data': 2, 'Sample': 3}\x94."
-                         )
+        # The pickle is sent as raw bytes, as the only part of the payload
+        exp_output = protocol.pack_parts([b"\x80\x05\x95'\x00\x00\x00\x00\x00\x00\x00\x8c#\
+{'Test': 1, 'Data': 2, 'Sample': 3}\x94."])
         # Test Case
         # Catching print of the function to not show on the console
         with open(os.devnull, 'w', encoding="utf-8") as catch:
             sys.stdout = catch
-            act_output = str(dict_serialisation(dictionary, serialise, data_format))
+            act_output = dict_serialisation(dictionary, serialise, data_format)
             sys.stdout = sys.__stdout__
         self.assertEqual(act_output, exp_output)
 
 
+    def test_dict_serialisation_binary_out_of_band(self):
+        '''
+        Tests that large buffers are sent as out-of-band parts
+        next to the pickle instead of inside it.
+        '''
+        # Assigning test variables
+        block = bytearray(b'x' * 100000)
+        dictionary = {'Test': 1, 'Block': pickle.PickleBuffer(block)}
+        # Test Case
+        # Catching print of the function to not show on the console
+        with open(os.devnull, 'w', encoding="utf-8") as catch:
+            sys.stdout = catch
+            act_output = dict_serialisation(dictionary, True, 'binary')
+            sys.stdout = sys.__stdout__
+        parts = protocol.unpack_parts(act_output)
+        self.assertEqual(len(parts), 2)
+        self.assertEqual(parts[1], block)
+        self.assertLess(len(parts[0]), 100)
+
+
     def test_dict_serialisation_json_serialisation(self):
         '''
         Tests the json serialization of the `dict_serialisation`
@@ -228,6 +257,25 @@ class TestDataEncryption(unittest.TestCase):
         self.assertEqual(act_result, test_data)
 
 
+    def test_data_encryption_aead(self):
+        '''
+        Tests the `data_encryption` function with the AEAD ciphers,
+        which send the raw key followed by the raw ciphertext.
+        '''
+        test_data = "Hello University of Liverpool!"
+
+        for cipher in (protocol.CIPHER_AESGCM, protocol.CIPHER_CHACHA20):
+            with open(os.devnull, 'w', encoding="utf-8") as catch:
+                sys.stdout = catch
+                encrypted_data = data_encryption(test_data, True, cipher)
+                sys.stdout = sys.__stdout__
+
+            key = encrypted_data[:protocol.AEAD_KEY_SIZE]
+            message = encrypted_data[protocol.AEAD_KEY_SIZE:]
+            self.assertIsInstance(encrypted_data, bytes)
+            self.assertEqual(protocol.make_cipher(cipher, key).decrypt(message), test_data.encode())
+
+
     @patch('simple_client.Fernet.generate_key')
     @patch('sys.stdout', new_callable=StringIO)
     def test_data_encryption_failure(self, mock_generate_key, mock_stdout):
@@ -288,6 +336,212 @@ class TestReadFile(unittest.TestCase):
 
 
 
+class TestStreamFile(unittest.TestCase):
+    '''
+    This class performs unit tests of the "is_large_file"
+    and "stream_file" functions in simple_client module.
+    '''
+
+    def setUp(self):
+        '''
+        This function creates a file larger than the buffer size.
+        '''
+        self.content = b'This is a line of a large file.\n' * 1000
+        with open('largefile.txt', 'wb') as myfile:
+            myfile.write(self.content)
+
+
+    def tearDown(self):
+        '''
+        This function deletes the large file.
+        '''
+        os.remove('largefile.txt')
+
+
+    def test_is_large_file(self):
+        '''
+        Tests that only files larger than the buffer are streamed.
+        '''
+        with open('smallfile.txt', 'wb') as myfile:
+            myfile.write(b'This is a small file.')
+
+        self.assertTrue(is_large_file('largefile.txt', 65536))
+        self.assertFalse(is_large_file('smallfile.txt', 4096))
+        self.assertFalse(is_large_file('nofile.txt', 4096))
+        os.remove('smallfile.txt')
+
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_stream_file(self, mock_stdout):
+        '''
+        Tests that the "stream_file" function sends the file
+        in chunks and ends the stream with an empty frame.
+        '''
+        sender, receiver = socket.socketpair()
+        stream_file('largefile.txt', sender, 4096)
+
+        chunks = []
+        flags = protocol.FLAG_MORE
+        while flags & protocol.FLAG_MORE:
+            flags, _, chunk = protocol.recv_frame(receiver)
+            self.assertTrue(flags & protocol.FLAG_FILE)
+            chunks.append(chunk)
+        receiver.close()
+
+        self.assertEqual(len(chunks), 9)
+        self.assertEqual(b''.join(chunks), self.content)
+        self.assertIn('File is streamed to server.', mock_stdout.getvalue())
+
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_stream_file_encrypted(self, mock_stdout):
+        '''
+        Tests that an encrypted stream sends the key first and then
+        one token per chunk holding its sequence number.
+        '''
+        sender, receiver = socket.socketpair()
+        # Send from another thread as the stream is larger than the socket buffer
+        thread = threading.Thread(target=stream_file, args=('largefile.txt', sender, 4096),
+                                  kwargs={'encryption': True})
+        thread.start()
+
+        flags, _, key = protocol.recv_frame(receiver)
+        self.assertEqual(flags, protocol.FLAG_FILE | protocol.FLAG_ENCRYPTED | protocol.FLAG_MORE)
+        fernet = Fernet(bytes(key))
+        chunks = []
+        while flags & protocol.FLAG_MORE:
+            flags, _, token = protocol.recv_frame(receiver)
+            message = fernet.decrypt(bytes(token))
+            sequence, last = protocol.CHUNK_PREFIX.unpack_from(message)
+            self.assertEqual(sequence, len(chunks))
+            self.assertEqual(bool(last), not flags & protocol.FLAG_MORE)
+            chunks.append(message[protocol.CHUNK_PREFIX.size:])
+        thread.join()
+        receiver.close()
+
+        self.assertEqual(len(chunks), 9)
+        self.assertEqual(b''.join(chunks), self.content)
+
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_stream_file_records(self, mock_stdout):
+        '''
+        Tests that a record stream is sent without the file flag
+        and with its content type.
+        '''
+        sender, receiver = socket.socketpair()
+        stream_file('largefile.txt', sender, 16384, protocol.CONTENT_XML, records=True)
+
+        frames = []
+        frame = protocol.recv_frame(receiver)
+        while frame is not None:
+            frames.append(frame)
+            frame = protocol.recv_frame(receiver)
+        receiver.close()
+
+        self.assertEqual([flags for flags, _, _ in frames],
+                         [protocol.FLAG_MORE, protocol.FLAG_MORE, protocol.FLAG_NONE])
+        self.assertTrue(all(content_type == protocol.CONTENT_XML for _, content_type, _ in frames))
+        self.assertEqual(b''.join(chunk for _, _, chunk in frames), self.content)
+
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_send_file(self, mock_stdout):
+        '''
+        Tests that the "send_file" function sends the whole file
+        as one frame announcing the file size.
+        '''
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.bind(('127.0.0.1', 0))
+        server_socket.listen()
+        client_socket = socket.create_connection(server_socket.getsockname())
+        connection, _ = server_socket.accept()
+
+        send_file('largefile.txt', client_socket)
+        flags, content_type, data = protocol.recv_frame(connection)
+        connection.close()
+        server_socket.close()
+
+        self.assertEqual(flags, protocol.FLAG_FILE)
+        self.assertEqual(content_type, protocol.CONTENT_TEXT)
+        self.assertEqual(data, self.content)
+        self.assertIn('File is sent to server.', mock_stdout.getvalue())
+
+
+
+class TestStreamRecords(unittest.TestCase):
+    '''
+    This class performs unit tests of the "record_chunks"
+    and "stream_records" functions in simple_client module.
+    '''
+
+    def test_record_chunks(self):
+        '''
+        Tests that records are cut into chunks of whole json lines
+        and that a dictionary gives one record per item.
+        '''
+        records = [{'Number': number} for number in range(100)]
+
+        chunks = list(record_chunks(records, 200))
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunk.endswith(b'\n') for chunk in chunks))
+        lines = b''.join(chunks).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], records)
+        self.assertEqual(list(record_chunks({'Name': 'Tolga', 'University': 'UoL'})),
+                         [b'{"Name": "Tolga"}\n{"University": "UoL"}\n'])
+
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_stream_records(self, mock_stdout):
+        '''
+        Tests that records are sent as a json lines record stream.
+        '''
+        sender, receiver = socket.socketpair()
+        stream_records(({'Number': number} for number in range(3)), sender)
+
+        frames = []
+        frame = protocol.recv_frame(receiver)
+        while frame is not None:
+            frames.append(frame)
+            frame = protocol.recv_frame(receiver)
+        receiver.close()
+
+        self.assertEqual(frames, [(protocol.FLAG_MORE, protocol.CONTENT_JSONL,
+                                   b'{"Number": 0}\n{"Number": 1}\n{"Number": 2}\n'),
+                                  (protocol.FLAG_NONE, protocol.CONTENT_JSONL, b'')])
+        self.assertIn('Records are streamed to server.', mock_stdout.getvalue())
+
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_stream_records_auto_codec(self, mock_stdout):
+        '''
+        Tests that the auto codec is picked from the first chunk of the records
+        and declared in the flags of every frame.
+        '''
+        sender, receiver = socket.socketpair()
+        records = {'Key{}'.format(number): 'Value' * 20 for number in range(500)}
+        thread = threading.Thread(target=stream_records, args=(records, sender),
+                                  kwargs={'codec': protocol.CODEC_AUTO})
+        thread.start()
+
+        frames = []
+        frame = protocol.recv_frame(receiver)
+        while frame is not None:
+            frames.append(frame)
+            frame = protocol.recv_frame(receiver)
+        thread.join()
+        receiver.close()
+
+        codec = frames[0][0] & protocol.CODEC_MASK
+        self.assertNotEqual(codec, protocol.CODEC_NONE)
+        self.assertTrue(all(flags & protocol.CODEC_MASK == codec for flags, _, _ in frames))
+        lines = b''.join(protocol.decompress(payload, codec) for _, _, payload in frames)
+        self.assertEqual(len(lines.splitlines()), 500)
+        self.assertIn('Records are streamed to server.', mock_stdout.getvalue())
+
+
+
 class TestReadingConfig(unittest.TestCase):
     '''
     This class performs unit tests of the "reading_config"
@@ -508,6 +762,147 @@ class TestDictionaryProcess(unittest.TestCase):
 
 
 
+class TestDictionaryContentType(unittest.TestCase):
+    '''
+    This class performs unit tests of the "dictionary_content_type"
+    function in simple_client module.
+    '''
+
+    def test_dictionary_content_type(self):
+        '''
+        Tests that each pickling format is declared with its content type.
+        '''
+        self.assertEqual(dictionary_content_type('binary'), protocol.CONTENT_PICKLE)
+        self.assertEqual(dictionary_content_type('json'), protocol.CONTENT_JSON)
+        self.assertEqual(dictionary_content_type('xml'), protocol.CONTENT_XML)
+        self.assertEqual(dictionary_content_type('invalid_format'), protocol.CONTENT_DICT)
+
+
+
+class TestCipherOption(unittest.TestCase):
+    '''
+    This class performs unit tests of the "cipher_option"
+    function in simple_client module.
+    '''
+
+    def test_cipher_option(self):
+        '''
+        Tests that each cipher name gives its flag
+        and that an unknown cipher stops the client.
+        '''
+        self.assertEqual(cipher_option('fernet'), protocol.CIPHER_FERNET)
+        self.assertEqual(cipher_option('aesgcm'), protocol.CIPHER_AESGCM)
+        self.assertEqual(cipher_option('chacha20'), protocol.CIPHER_CHACHA20)
+        with patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+            with self.assertRaises(SystemExit):
+                cipher_option('des')
+        self.assertEqual(mock_stdout.getvalue().strip(),
+                         'Error: Please select one of the ciphers: fernet, aesgcm or chacha20.')
+
+
+
+class TestCompressData(unittest.TestCase):
+    '''
+    This class performs unit tests of the "compress_data"
+    and "codec_option" functions in simple_client module.
+    '''
+
+    def test_compress_data(self):
+        '''
+        Tests that data above the threshold is compressed
+        and declared with its codec.
+        '''
+        data = json.dumps({'Name': 'Tolga', 'University': 'UoL'} | {str(n): n for n in range(200)})
+
+        result, codec = compress_data(data, protocol.CODEC_ZLIB, threshold=100)
+
+        self.assertEqual(codec, protocol.CODEC_ZLIB)
+        self.assertLess(len(result), len(data))
+        self.assertEqual(protocol.decompress(result, codec), data.encode())
+
+
+    def test_compress_data_skipped(self):
+        '''
+        Tests that small data and data which does not get smaller
+        are sent as they are.
+        '''
+        random_data = os.urandom(2048)
+
+        self.assertEqual(compress_data('small', protocol.CODEC_ZLIB, threshold=100),
+                         ('small', protocol.CODEC_NONE))
+        self.assertEqual(compress_data(random_data, protocol.CODEC_LZMA),
+                         (random_data, protocol.CODEC_NONE))
+
+
+    def test_compress_data_auto(self):
+        '''
+        Tests that the auto codec compresses text
+        and leaves incompressible data as it is.
+        '''
+        data = json.dumps([{'Name': 'Tolga', 'Number': number} for number in range(200)])
+        random_data = os.urandom(4096)
+
+        result, codec = compress_data(data, protocol.CODEC_AUTO)
+
+        self.assertNotEqual(codec, protocol.CODEC_NONE)
+        self.assertEqual(protocol.decompress(result, codec), data.encode())
+        self.assertEqual(compress_data(random_data, protocol.CODEC_AUTO),
+                         (random_data, protocol.CODEC_NONE))
+
+
+    def test_codec_option(self):
+        '''
+        Tests that each codec name gives its flag
+        and that an unknown codec stops the client.
+        '''
+        self.assertEqual(codec_option('none'), protocol.CODEC_NONE)
+        self.assertEqual(codec_option('zlib'), protocol.CODEC_ZLIB)
+        self.assertEqual(codec_option('lzma'), protocol.CODEC_LZMA)
+        with patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+            with self.assertRaises(SystemExit):
+                codec_option('rar')
+        self.assertEqual(mock_stdout.getvalue().strip(),
+                         'Error: Please select one of the codecs: none, auto, zlib, lzma or zstd.')
+
+
+
+class TestChooseCodec(unittest.TestCase):
+    '''
+    This class performs unit tests of the "choose_codec"
+    function in simple_client module.
+    '''
+
+    def setUp(self):
+        '''
+        This function creates a compressible sample.
+        '''
+        records = [{'name': 'record {}'.format(n), 'value': n * 7, 'university': 'UoL'}
+                   for n in range(500)]
+        self.sample = json.dumps(records).encode()[:protocol.PROBE_SIZE]
+
+
+    def test_choose_codec_incompressible(self):
+        '''
+        Tests that already compressed data is not compressed again.
+        '''
+        self.assertEqual(choose_codec(os.urandom(protocol.PROBE_SIZE)), (protocol.CODEC_NONE, None))
+
+
+    def test_choose_codec_budget(self):
+        '''
+        Tests that the high ratio codec is only used
+        when it is fast enough for the cpu budget.
+        '''
+        fast = choose_codec(self.sample, budget=float('inf'))
+        high = choose_codec(self.sample, budget=0)
+
+        self.assertIn(fast[0], (protocol.CODEC_ZLIB, protocol.CODEC_ZSTD))
+        self.assertNotEqual(high, fast)
+        self.assertLess(len(protocol.compress(self.sample, *high)),
+                        len(protocol.compress(self.sample, *fast)))
+
+
+
 class TestSendtoServer(unittest.TestCase):
     '''
     This class performs unit tests of the "send_to_server"
@@ -549,10 +944,35 @@ class TestSendtoServer(unittest.TestCase):
             sys.stdout = catch
             send_to_server(data2send, self.client_socket)
             sys.stdout = sys.__stdout__
-        # Check that the dictionary was sent successfully. And match with
-        # the excepted result
-        received_data = self.connection.recv(4096).decode()
-        self.assertEqual(received_data.strip(), str(data2send))
+        # Check that the dictionary was sent successfully as one frame.
+        # And match with the excepted result
+        flags, content_type, received_data = protocol.recv_frame(self.connection)
+        self.assertEqual(received_data.decode(), str(data2send))
+        self.assertEqual(flags, protocol.FLAG_NONE)
+        self.assertEqual(content_type, protocol.CONTENT_UNKNOWN)
+
+        # Close sockets
+        self.client_socket.close()
+        self.connection.close()
+        self.server_socket.close()
+
+
+    def test_send_to_server_content_type(self):
+        '''
+        Tests that the "send_to_server" function
+        declares the content type and flags in the frame header.
+        '''
+        data2send = '{"name": "Tolga"}'
+        with open(os.devnull, 'w', encoding="utf-8") as catch:
+            sys.stdout = catch
+            send_to_server(data2send, self.client_socket, protocol.CONTENT_JSON,
+                           protocol.FLAG_ENCRYPTED)
+            sys.stdout = sys.__stdout__
+
+        flags, content_type, received_data = protocol.recv_frame(self.connection)
+        self.assertEqual(received_data.decode(), data2send)
+        self.assertEqual(flags, protocol.FLAG_ENCRYPTED)
+        self.assertEqual(content_type, protocol.CONTENT_JSON)
 
         # Close sockets
         self.client_socket.close()
@@ -586,6 +1006,275 @@ class TestSendtoServer(unittest.TestCase):
 
 
 
+class TestClient(unittest.TestCase):
+    '''
+    This class performs unit tests of the "Client" class
+    in simple_client module.
+    '''
+
+    def setUp(self):
+        '''
+        This function creates a listening server socket.
+        '''
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.bind(('127.0.0.1', 0))
+        self.server_socket.listen()
+
+
+    def tearDown(self):
+        '''
+        This function closes the server socket.
+        '''
+        self.server_socket.close()
+
+
+    def receive_all(self, connection):
+        '''
+        This function reads frames until the client closes the connection.
+        '''
+        frames = []
+        frame = protocol.recv_frame(connection)
+        while frame is not None:
+            frames.append(frame)
+            frame = protocol.recv_frame(connection)
+        connection.close()
+        return frames
+
+
+    def test_client_sends_many_messages(self):
+        '''
+        Tests that the "Client" class sends many small and large
+        messages on one connection, in order.
+        '''
+        large = b'x' * 100000
+        with Client(*self.server_socket.getsockname(), buffer_size=1024) as client:
+            connection, _ = self.server_socket.accept()
+            for number in range(100):
+                client.send('message {}'.format(number), protocol.CONTENT_TEXT)
+            client.send(large, protocol.CONTENT_BINARY)
+            with open(os.devnull, 'w', encoding="utf-8") as catch:
+                sys.stdout = catch
+                client.send_dictionary("{'Name': 'Tolga'}", 'json')
+                sys.stdout = sys.__stdout__
+
+        frames = self.receive_all(connection)
+
+        self.assertEqual(len(frames), 102)
+        self.assertEqual(frames[0], (protocol.FLAG_NONE, protocol.CONTENT_TEXT, b'message 0'))
+        self.assertEqual(frames[99][2], b'message 99')
+        self.assertEqual(frames[100], (protocol.FLAG_NONE, protocol.CONTENT_BINARY, large))
+        self.assertEqual(frames[101][1], protocol.CONTENT_JSON)
+
+
+    def test_client_tunes_socket_before_connecting(self):
+        '''
+        Tests that the socket options are set before the client
+        connects, as the buffer sizes are fixed when connecting.
+        '''
+        connected = []
+        tune = protocol.tune_socket
+
+        def tune_socket(sock, **options):
+            connected.append(self.is_connected(sock))
+            tune(sock, **options)
+
+        with patch('protocol.tune_socket', side_effect=tune_socket):
+            client = Client(*self.server_socket.getsockname(),
+                            socket_options={'rcvbuf': 256 * 1024})
+        connection, _ = self.server_socket.accept()
+
+        self.assertEqual(connected, [False])
+        self.assertGreaterEqual(client.socket_s.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF),
+                                256 * 1024)
+        client.close()
+        connection.close()
+
+
+    @staticmethod
+    def is_connected(sock):
+        '''
+        This function tells whether a socket is connected.
+        '''
+        try:
+            sock.getpeername()
+            return True
+        except OSError:
+            return False
+
+
+    def test_client_buffers_small_messages(self):
+        '''
+        Tests that small messages wait in the buffer
+        until it is flushed.
+        '''
+        client = Client(*self.server_socket.getsockname())
+        connection, _ = self.server_socket.accept()
+        connection.settimeout(0.2)
+        client.send('small message')
+
+        with self.assertRaises(socket.timeout):
+            connection.recv(1)
+        client.flush()
+        connection.settimeout(None)
+        client.close()
+
+        self.assertEqual(self.receive_all(connection),
+                         [(protocol.FLAG_NONE, protocol.CONTENT_UNKNOWN, b'small message')])
+
+
+
+    @unittest.skipUnless(protocol.UNIX_SUPPORTED, 'Unix domain sockets are not available')
+    def test_client_unix_socket(self):
+        '''
+        Tests that the "Client" class sends frames through
+        a Unix domain socket given by its path.
+        '''
+        folder = tempfile.mkdtemp()
+        path = os.path.join(folder, 'server.sock')
+        server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server_socket.bind(path)
+        server_socket.listen()
+
+        with Client(path, 0, family=socket.AF_UNIX, socket_options={'nodelay': True}) as client:
+            connection, _ = server_socket.accept()
+            client.send('over a unix socket', protocol.CONTENT_TEXT)
+
+        self.assertEqual(self.receive_all(connection),
+                         [(protocol.FLAG_NONE, protocol.CONTENT_TEXT, b'over a unix socket')])
+        server_socket.close()
+        shutil.rmtree(folder)
+
+
+
+class TestConnectionPool(unittest.TestCase):
+    '''
+    This class performs unit tests of the "ConnectionPool" class
+    and the "is_alive" function in simple_client module.
+    '''
+
+    def setUp(self):
+        '''
+        This function creates a server socket accepting connections
+        in the background and keeping them.
+        '''
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.bind(('127.0.0.1', 0))
+        self.server_socket.listen()
+        self.connections = []
+        self.accepting = threading.Thread(target=self.accept, daemon=True)
+        self.accepting.start()
+
+
+    def accept(self):
+        '''
+        This function accepts connections until the server socket is closed.
+        '''
+        try:
+            while True:
+                self.connections.append(self.server_socket.accept()[0])
+        except OSError:
+            pass
+
+
+    def tearDown(self):
+        '''
+        This function closes all sockets.
+        '''
+        self.server_socket.close()
+        for connection in self.connections:
+            connection.close()
+
+
+    def test_pool_reuses_connections(self):
+        '''
+        Tests that connections are reused and counted in the statistics.
+        '''
+        with ConnectionPool(*self.server_socket.getsockname(), size=2) as pool:
+            for number in range(10):
+                pool.send('message {}'.format(number))
+            stats = pool.stats()
+
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['acquired'], 10)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertEqual(stats['idle'], 1)
+
+
+    def test_pool_waits_for_free_connection(self):
+        '''
+        Tests that a thread waits when all connections are in use
+        and times out when none becomes free.
+        '''
+        pool = ConnectionPool(*self.server_socket.getsockname(), size=1)
+        client = pool.acquire()
+
+        with self.assertRaises(TimeoutError):
+            pool.acquire(timeout=0.1)
+        # release the connection from another thread while waiting
+        timer = threading.Timer(0.1, pool.release, args=(client,))
+        timer.start()
+        self.assertIs(pool.acquire(timeout=5), client)
+        timer.join()
+        stats = pool.stats()
+        pool.release(client)
+        pool.close()
+
+        self.assertEqual(stats['in_use'], 1)
+        self.assertEqual(stats['waits'], 1)
+        self.assertGreater(stats['wait_time'], 0)
+
+
+    def test_pool_discards_closed_and_idle_connections(self):
+        '''
+        Tests that connections closed by the server and connections
+        idle for too long are not handed out again.
+        '''
+        pool = ConnectionPool(*self.server_socket.getsockname(), size=2, idle_timeout=0.2)
+        first = pool.acquire()
+        pool.release(first)
+        # the server closes the connection
+        time.sleep(0.1)
+        self.connections[0].close()
+        time.sleep(0.1)
+        self.assertFalse(is_alive(first.socket_s))
+        second = pool.acquire()
+        self.assertIsNot(second, first)
+        self.assertTrue(is_alive(second.socket_s))
+        pool.release(second)
+        # the connection stays idle for longer than the idle timeout
+        time.sleep(0.3)
+        third = pool.acquire()
+        self.assertIsNot(third, second)
+        pool.release(third)
+        pool.close()
+
+        self.assertEqual(pool.stats()['discarded'], 2)
+
+
+    def test_pool_reconnects_with_backoff(self):
+        '''
+        Tests that a failed connection attempt is retried.
+        '''
+        pool = ConnectionPool(*self.server_socket.getsockname(), retries=2, backoff=0.01)
+        real_client = Client
+        attempts = []
+
+        def flaky_client(*args):
+            attempts.append(args)
+            if len(attempts) < 3:
+                raise ConnectionRefusedError()
+            return real_client(*args)
+
+        with patch('simple_client.Client', side_effect=flaky_client):
+            client = pool.acquire()
+        pool.release(client)
+        pool.close()
+
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(pool.stats()['created'], 1)
+
+
+
 class TestMainFunction(unittest.TestCase):
     '''
     This class performs unit tests of the "main_function"
@@ -627,9 +1316,13 @@ class TestMainFunction(unittest.TestCase):
         mock_create_socket.assert_called_once()
         mock_connect_server.assert_called_once_with(mock_create_socket.return_value,
                                                     server_host, server_port)
-        mock_text_file_process.assert_called_once_with(userinput, encryption, buffer_size)
+        mock_text_file_process.assert_called_once_with(userinput, encryption, buffer_size,
+                                                       protocol.CIPHER_FERNET,
+                                                       protocol.CODEC_NONE, None)
         mock_send_to_server.assert_called_once_with("This is a text file for testing.",
-                                                    mock_create_socket.return_value)
+                                                    mock_create_socket.return_value,
+                                                    protocol.CONTENT_TEXT,
+                                                    protocol.FLAG_ENCRYPTED)
 
 
     # Defining all mock inputs
@@ -666,9 +1359,39 @@ class TestMainFunction(unittest.TestCase):
         mock_create_socket.assert_called_once()
         mock_connect_server.assert_called_once_with(mock_create_socket.return_value,
                                                     server_host, server_port)
-        mock_dictionary_process.assert_called_once_with(userinput, format_)
+        # the parsed dictionary is serialised, not the text of it
+        mock_dictionary_process.assert_called_once_with({'Name': 'Tolga', 'University': 'UoL'},
+                                                        format_)
         mock_send_to_server.assert_called_once_with({'Name': 'Tolga', 'University': 'UoL'},
-                                                    mock_create_socket.return_value)
+                                                    mock_create_socket.return_value,
+                                                    protocol.CONTENT_XML,
+                                                    protocol.FLAG_NONE)
+
+
+    # Defining all mock inputs
+    @patch('simple_client.reading_config')
+    @patch('simple_client.create_socket')
+    @patch('simple_client.connect_server')
+    @patch('simple_client.send_file')
+    def test_main_function_with_binary_file(self, mock_send_file, mock_connect_server,
+                                            mock_create_socket, mock_reading_config):
+        '''
+        Tests that the "main_function" function
+        sends a binary file as it is.
+        '''
+        # Create a binary file
+        with open('testimage.jpg', 'wb') as myfile:
+            myfile.write(bytes(range(256)))
+        # Define mock return values
+        mock_reading_config.return_value = ('127.0.0.1', 9090, 4096, 'testimage.jpg', False, 'txt')
+
+        # Call the main function
+        main_function()
+        os.remove('testimage.jpg')
+
+        # Assertions
+        mock_send_file.assert_called_once_with('testimage.jpg', mock_create_socket.return_value,
+                                               protocol.CONTENT_BINARY)
 
 
     # Defining all mock inputs
@@ -700,7 +1423,7 @@ class TestMainFunction(unittest.TestCase):
                 main_function()
             # Check that the error message was printed to the console
             self.assertEqual(mock_stdout.getvalue().strip(),
-                             'Error: Input must be a txt file or a dictionary.')
+                             'Error: Input must be a file or a dictionary.')
 
 
 
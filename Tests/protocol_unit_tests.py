@@ -0,0 +1,377 @@
+'''
+This module performs unit tests of the functions in
+"protocol.py" module in the Simple Server Client Project.
+'''
+# Prevent false positive pylint warnings for PEP8 score
+# pylint: disable=E0611
+# pylint: disable=C0413
+
+import unittest
+import sys
+import os
+import socket
+import inspect
+import threading
+import io
+import tempfile
+
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import protocol
+
+
+
+class TestHeader(unittest.TestCase):
+    '''
+    This class performs unit tests of the "pack_header"
+    and "unpack_header" functions in the protocol module.
+    '''
+
+    def test_header_round_trip(self):
+        '''
+        Tests that a packed header gives back the same flags and length.
+        '''
+        header = protocol.pack_header(123456789, protocol.FLAG_ENCRYPTED, protocol.CONTENT_JSON)
+
+        self.assertEqual(len(header), protocol.HEADER.size)
+        self.assertEqual(protocol.unpack_header(header, max_length=123456789),
+                         (protocol.FLAG_ENCRYPTED, protocol.CONTENT_JSON, 123456789))
+
+
+    def test_header_too_long(self):
+        '''
+        Tests that a header announcing more than the limit is rejected,
+        unless the payload is plain file content.
+        '''
+        with self.assertRaises(ValueError):
+            protocol.unpack_header(protocol.pack_header(protocol.MAX_FRAME_SIZE + 1))
+        with self.assertRaises(ValueError):
+            protocol.unpack_header(protocol.pack_header(2 ** 40, protocol.FLAG_FILE
+                                                        | protocol.FLAG_ENCRYPTED))
+        self.assertEqual(protocol.unpack_header(protocol.pack_header(protocol.MAX_FRAME_SIZE))[2],
+                         protocol.MAX_FRAME_SIZE)
+        self.assertEqual(protocol.unpack_header(protocol.pack_header(2 ** 40, protocol.FLAG_FILE))[2],
+                         2 ** 40)
+
+
+    def test_header_wrong_version(self):
+        '''
+        Tests that a header of another protocol version is rejected.
+        '''
+        header = protocol.HEADER.pack(protocol.PROTOCOL_VERSION + 1, 0, 0, 10)
+
+        with self.assertRaises(ValueError):
+            protocol.unpack_header(header)
+
+
+
+class TestParts(unittest.TestCase):
+    '''
+    This class performs unit tests of the "pack_parts"
+    and "unpack_parts" functions in the protocol module.
+    '''
+
+    def test_parts_round_trip(self):
+        '''
+        Tests that the parts come back unchanged as views of the payload.
+        '''
+        parts = [b'pickle', bytearray(b'buffer one'), memoryview(b'buffer two')]
+        payload = protocol.pack_parts(parts)
+
+        result = protocol.unpack_parts(payload)
+
+        self.assertEqual([bytes(part) for part in result], [b'pickle', b'buffer one', b'buffer two'])
+        self.assertIsInstance(result[1], memoryview)
+
+
+    def test_parts_truncated(self):
+        '''
+        Tests that a truncated payload is rejected.
+        '''
+        payload = protocol.pack_parts([b'pickle', b'buffer'])
+
+        with self.assertRaises(ValueError):
+            protocol.unpack_parts(payload[:-1])
+
+
+
+class TestCiphers(unittest.TestCase):
+    '''
+    This class performs unit tests of the "generate_cipher_key"
+    and "make_cipher" functions in the protocol module.
+    '''
+
+    def test_cipher_round_trip(self):
+        '''
+        Tests that every cipher decrypts what it encrypted.
+        '''
+        for cipher in protocol.CIPHERS.values():
+            encryptor = protocol.make_cipher(cipher, protocol.generate_cipher_key(cipher))
+
+            self.assertEqual(encryptor.decrypt(encryptor.encrypt(b'payload')), b'payload')
+
+
+    def test_aead_ciphertext_is_raw(self):
+        '''
+        Tests that the AEAD ciphertext is the nonce, the data and the tag
+        without base64, and that a modified ciphertext is rejected.
+        '''
+        encryptor = protocol.make_cipher(protocol.CIPHER_AESGCM,
+                                         protocol.generate_cipher_key(protocol.CIPHER_AESGCM))
+        token = encryptor.encrypt(b'x' * 100)
+
+        self.assertEqual(len(token), protocol.NONCE_SIZE + 100 + 16)
+        with self.assertRaises(Exception):
+            encryptor.decrypt(token[:-1] + bytes([token[-1] ^ 1]))
+
+
+    def test_unknown_cipher(self):
+        '''
+        Tests that an unknown cipher is rejected.
+        '''
+        with self.assertRaises(ValueError):
+            protocol.make_cipher(0x30, b'key')
+
+
+
+class TestCompression(unittest.TestCase):
+    '''
+    This class performs unit tests of the "compress"
+    and "decompress" functions in the protocol module.
+    '''
+
+    def test_compression_round_trip(self):
+        '''
+        Tests that every available codec restores the data.
+        '''
+        data = b'{"Name": "Tolga", "University": "UoL"}' * 100
+        codecs = [protocol.CODEC_ZLIB, protocol.CODEC_LZMA]
+        if protocol.ZSTD_SUPPORTED:
+            codecs.append(protocol.CODEC_ZSTD)
+
+        for codec in codecs:
+            compressed = protocol.compress(data, codec, 1)
+
+            self.assertLess(len(compressed), len(data) // 5)
+            self.assertEqual(protocol.decompress(compressed, codec), data)
+
+
+    def test_compression_empty_and_none(self):
+        '''
+        Tests that empty data and the none codec leave the data unchanged.
+        '''
+        self.assertEqual(protocol.compress(b'', protocol.CODEC_ZLIB), b'')
+        self.assertEqual(protocol.decompress(b'', protocol.CODEC_ZLIB), b'')
+        self.assertEqual(protocol.compress(b'data', protocol.CODEC_NONE), b'data')
+
+
+    def test_decompression_is_limited(self):
+        '''
+        Tests that data expanding beyond the limit and truncated data are rejected.
+        '''
+        for codec in [protocol.CODEC_ZLIB, protocol.CODEC_LZMA]:
+            bomb = protocol.compress(bytes(64 * 1024 * 1024), codec)
+            data = protocol.compress(b'x' * 4096, codec)
+
+            with self.assertRaises(ValueError):
+                protocol.decompress(bomb, codec)
+            with self.assertRaises(ValueError):
+                protocol.decompress(data, codec, max_length=4095)
+            with self.assertRaises(ValueError):
+                protocol.decompress(data[:-4], codec)
+            self.assertEqual(protocol.decompress(data, codec, max_length=4096), b'x' * 4096)
+
+
+
+class TestSessionKey(unittest.TestCase):
+    '''
+    This class performs unit tests of the "generate_handshake_key"
+    and "derive_session_key" functions in the protocol module.
+    '''
+
+    def test_both_sides_derive_same_key(self):
+        '''
+        Tests that client and server derive the same session key
+        from their own private key and the public key of the other side.
+        '''
+        client_private, client_public = protocol.generate_handshake_key()
+        server_private, server_public = protocol.generate_handshake_key()
+
+        client_key = protocol.derive_session_key(client_private, server_public, b'secret')
+        server_key = protocol.derive_session_key(server_private, client_public, b'secret')
+
+        self.assertEqual(len(client_public), 32)
+        self.assertEqual(client_key, server_key)
+
+
+    def test_pre_shared_key_mismatch(self):
+        '''
+        Tests that different pre-shared keys give different session keys.
+        '''
+        client_private, client_public = protocol.generate_handshake_key()
+        server_private, server_public = protocol.generate_handshake_key()
+
+        self.assertNotEqual(protocol.derive_session_key(client_private, server_public, b'secret'),
+                            protocol.derive_session_key(server_private, client_public, b'other'))
+
+
+
+class TestFrames(unittest.TestCase):
+    '''
+    This class performs unit tests of the "send_frame", "recv_frame"
+    and "recv_exactly" functions in the protocol module.
+    '''
+
+    def setUp(self):
+        '''
+        This function creates a pair of connected sockets.
+        '''
+        self.sender, self.receiver = socket.socketpair()
+
+
+    def tearDown(self):
+        '''
+        This function closes the sockets.
+        '''
+        self.sender.close()
+        self.receiver.close()
+
+
+    def test_frame_larger_than_buffer(self):
+        '''
+        Tests that a payload much larger than one recv call
+        arrives complete and unchanged.
+        '''
+        payload = os.urandom(4 * 1024 * 1024)
+        # Send from another thread as the payload is larger than the socket buffer
+        thread = threading.Thread(target=protocol.send_frame, args=(self.sender, payload))
+        thread.start()
+        flags, content_type, received = protocol.recv_frame(self.receiver)
+        thread.join()
+
+        self.assertEqual(flags, protocol.FLAG_NONE)
+        self.assertEqual(content_type, protocol.CONTENT_UNKNOWN)
+        self.assertEqual(received, payload)
+
+
+    def test_recv_frame_connection_closed_between_frames(self):
+        '''
+        Tests that a connection closed after a complete frame
+        is reported as the end of the messages.
+        '''
+        protocol.send_frame(self.sender, b'last message')
+        self.sender.close()
+
+        self.assertEqual(protocol.recv_frame(self.receiver)[2], b'last message')
+        self.assertIsNone(protocol.recv_frame(self.receiver))
+
+
+    def test_recv_exactly_connection_closed(self):
+        '''
+        Tests that a connection closed in the middle of a payload
+        raises an error instead of returning truncated data.
+        '''
+        self.sender.sendall(protocol.pack_header(100) + b'short')
+        self.sender.close()
+
+        with self.assertRaises(ConnectionError):
+            protocol.recv_frame(self.receiver)
+
+
+    def test_recv_into_file(self):
+        '''
+        Tests that a payload is written to the file through
+        a buffer smaller than the payload.
+        '''
+        payload = b'0123456789' * 10
+        self.sender.sendall(payload)
+        myfile = io.BytesIO()
+
+        written = protocol.recv_into_file(self.receiver, len(payload), myfile, bytearray(16))
+
+        self.assertEqual(written, len(payload))
+        self.assertEqual(myfile.getvalue(), payload)
+
+
+    @unittest.skipUnless(protocol.SPLICE_SUPPORTED, 'os.splice is not available')
+    def test_splice_into_file(self):
+        '''
+        Tests that a payload larger than one pipe is moved
+        from the socket to the file with os.splice.
+        '''
+        payload = os.urandom(3 * protocol.CHUNK_SIZE + 5)
+        thread = threading.Thread(target=self.sender.sendall, args=(payload,))
+        thread.start()
+        with tempfile.TemporaryFile() as myfile:
+            myfile.write(b'head')
+            written = protocol.splice_into_file(self.receiver, len(payload), myfile)
+            thread.join()
+            myfile.seek(0)
+
+            self.assertEqual(written, len(payload))
+            self.assertEqual(myfile.read(), b'head' + payload)
+
+
+
+
+class TestSocketOptions(unittest.TestCase):
+    '''
+    This class performs unit tests of the "tune_socket"
+    function in the protocol module.
+    '''
+
+    def test_options_are_set(self):
+        '''
+        Tests that the given options are set on the socket.
+        '''
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+        protocol.tune_socket(sock, nodelay=True, rcvbuf=256 * 1024, keepalive=True,
+                             reuseaddr=True, keepalive_idle=30)
+
+        self.assertTrue(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+        self.assertTrue(sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+        self.assertTrue(sock.getsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR))
+        self.assertGreaterEqual(sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF), 256 * 1024)
+        if protocol.KEEPALIVE_OPTIONS['keepalive_idle'] is not None:
+            self.assertEqual(sock.getsockopt(socket.IPPROTO_TCP,
+                                             protocol.KEEPALIVE_OPTIONS['keepalive_idle']), 30)
+        sock.close()
+
+
+    @unittest.skipUnless(protocol.UNIX_SUPPORTED, 'Unix domain sockets are not available')
+    def test_unix_socket(self):
+        '''
+        Tests that the address of a Unix domain socket is its path
+        and that the TCP options are not set on it.
+        '''
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        protocol.tune_socket(sock, nodelay=True, keepalive=True, sndbuf=256 * 1024)
+
+        self.assertEqual(protocol.socket_address(sock, '/tmp/server.sock', 9090), '/tmp/server.sock')
+        self.assertGreaterEqual(sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF), 256 * 1024)
+        sock.close()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.assertEqual(protocol.socket_address(sock, '127.0.0.1', 9090), ('127.0.0.1', 9090))
+        sock.close()
+
+
+    def test_unset_options_are_left(self):
+        '''
+        Tests that options which are not given keep their defaults.
+        '''
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        default = sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+
+        protocol.tune_socket(sock, sndbuf=0)
+
+        self.assertEqual(sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF), default)
+        self.assertFalse(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+        sock.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
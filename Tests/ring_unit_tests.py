@@ -0,0 +1,159 @@
+'''
+This module performs unit tests of the classes in
+"ring.py" module in the Simple Server Client Project.
+'''
+# Prevent false positive pylint warnings for PEP8 score
+# pylint: disable=E0611
+# pylint: disable=C0413
+
+import unittest
+import sys
+import os
+import inspect
+import threading
+import tempfile
+import shutil
+
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import protocol
+import ring
+
+
+
+@unittest.skipUnless(ring.RING_SUPPORTED, 'named pipes are not available')
+class TestRing(unittest.TestCase):
+    '''
+    This class performs unit tests of the "RingReader"
+    and "RingWriter" classes in the ring module.
+    '''
+
+    def setUp(self):
+        '''
+        This function creates a small ring and its doorbell in a temporary folder.
+        '''
+        self.folder = tempfile.mkdtemp()
+        self.name = 'ssc_test_{}'.format(os.getpid())
+        self.doorbell = os.path.join(self.folder, 'ring.doorbell')
+        self.reader = ring.RingReader(self.name, self.doorbell, 1024)
+
+
+    def tearDown(self):
+        '''
+        This function removes the ring and the temporary folder.
+        '''
+        self.reader.close()
+        shutil.rmtree(self.folder)
+
+
+    def test_frames_wrap_around(self):
+        '''
+        Tests that many more bytes than the ring holds arrive complete
+        and in order while the frames wrap around the end of the ring.
+        '''
+        payloads = [bytes([number]) * (number * 7 % 300) for number in range(200)]
+
+        def produce():
+            writer = ring.RingWriter(self.name, self.doorbell)
+            for payload in payloads:
+                writer.send_frame(payload, protocol.FLAG_NONE, protocol.CONTENT_BINARY)
+            writer.close()
+
+        thread = threading.Thread(target=produce)
+        thread.start()
+        received = [(content_type, bytes(payload))
+                    for _, content_type, payload in self.reader.frames()]
+        thread.join()
+
+        self.assertEqual(received, [(protocol.CONTENT_BINARY, payload) for payload in payloads])
+        self.assertGreater(self.reader.tail, 1024)
+
+
+    def test_payload_is_a_view_of_the_ring(self):
+        '''
+        Tests that the payload is not copied out of the ring
+        and that its view is released when the next frame is asked for.
+        '''
+        writer = ring.RingWriter(self.name, self.doorbell)
+        writer.send_frame(b'first', protocol.FLAG_ENCRYPTED, protocol.CONTENT_TEXT)
+        writer.send_frame(b'second')
+        writer.close()
+        frames = self.reader.frames()
+
+        flags, content_type, payload = next(frames)
+
+        self.assertIsInstance(payload, memoryview)
+        self.assertEqual((flags, content_type, bytes(payload)),
+                         (protocol.FLAG_ENCRYPTED, protocol.CONTENT_TEXT, b'first'))
+        self.assertEqual(bytes(next(frames)[2]), b'second')
+        with self.assertRaises(ValueError):
+            bytes(payload)
+        self.assertEqual(list(frames), [])
+
+
+    def test_writers_take_turns(self):
+        '''
+        Tests that a second client waits until the first one has finished
+        instead of writing over its frames.
+        '''
+        first = ring.RingWriter(self.name, self.doorbell)
+
+        def produce():
+            second = ring.RingWriter(self.name, self.doorbell)
+            second.send_frame(b'second')
+            second.close()
+
+        thread = threading.Thread(target=produce)
+        thread.start()
+        thread.join(0.2)
+        self.assertTrue(thread.is_alive())
+        first.send_frame(b'first')
+        first.close()
+        thread.join()
+        frames = self.reader.frames(forever=True)
+
+        self.assertEqual([bytes(next(frames)[2]) for _ in range(2)], [b'first', b'second'])
+        frames.close()
+
+
+    def test_running_server_not_taken_over(self):
+        '''
+        Tests that a second server does not remove the ring of a running one.
+        '''
+        with self.assertRaises(FileExistsError):
+            ring.RingReader(self.name, os.path.join(self.folder, 'other.doorbell'), 1024)
+        writer = ring.RingWriter(self.name, self.doorbell)
+        writer.send_frame(b'still served')
+        writer.close()
+
+        self.assertEqual([bytes(payload) for _, _, payload in self.reader.frames()],
+                         [b'still served'])
+
+
+    def test_frame_larger_than_ring(self):
+        '''
+        Tests that a frame which does not fit into the ring is rejected.
+        '''
+        writer = ring.RingWriter(self.name, self.doorbell)
+
+        with self.assertRaises(ValueError):
+            writer.send_frame(b'x' * 2048)
+        writer.close()
+
+
+    def test_server_stopped(self):
+        '''
+        Tests that a client does not attach to the ring of a stopped server.
+        '''
+        self.reader.close()
+
+        with self.assertRaises((ConnectionError, FileNotFoundError)):
+            ring.RingWriter(self.name, self.doorbell)
+        self.reader = ring.RingReader(self.name, self.doorbell, 1024)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
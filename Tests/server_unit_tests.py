@@ -1,4 +1,7 @@
+import asyncio
 import codecs
+import collections
+import concurrent.futures
 from configparser import ConfigParser
 import inspect
 import io
@@ -11,10 +14,19 @@ import unittest
 import xmltodict
 from io import StringIO
 import os
+import unittest.mock
 from unittest.mock import patch
 
-import xml
+import xml.etree.ElementTree
+import threading
+import gzip
+import shutil
+import tempfile
+import time
+import signal
+import subprocess
 from dict2xml import dict2xml
+from cryptography.fernet import Fernet
 
 
 # to allow import of the file from the parent directory
@@ -25,6 +37,8 @@ sys.path.insert(0, parentdir)
 
 import simple_server as SimpleServer
 import simple_client as SimpleClient
+import protocol
+import settings
 
 
 def create_mock_config_file():
@@ -137,6 +151,51 @@ class TestSimpleServer(unittest.TestCase):
         with open('test.xml', 'r') as f:
             self.assertEqual(f.read(), '<root>test</root>')
 
+    def test_save_File_binary(self):
+        data = bytes(range(256))
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            SimpleServer.save_file(data, 'test.jpg')
+            self.assertEqual(fake_output.getvalue().strip(), 'The file in binary format is created.')
+        with open('test.jpg', 'rb') as f:
+            self.assertEqual(f.read(), data)
+        os.remove('test.jpg')
+
+    def test_save_File_native_objects(self):
+        data = {'Name': 'Tolga', 'Modules': ['Networks', 'Security']}
+        with patch('sys.stdout', new=StringIO()):
+            SimpleServer.save_file(data, 'test.json')
+            SimpleServer.save_file(data, 'test.xml')
+            SimpleServer.save_file(data, 'test.pickle')
+        with open('test.json') as f:
+            self.assertEqual(json.load(f), data)
+        with open('test.xml') as f:
+            self.assertEqual(xmltodict.parse(f.read())['root'],
+                             {'Name': 'Tolga', 'Modules': ['Networks', 'Security']})
+        with open('test.pickle', 'rb') as f:
+            self.assertEqual(pickle.load(f), data)
+
+    def test_save_File_json_tuple_keys(self):
+        data = {(1, 2): 'Point', 'Tags': {'a'}}
+        with patch('sys.stdout', new=StringIO()):
+            SimpleServer.save_file(data, 'test.json')
+        with open('test.json') as f:
+            self.assertEqual(json.load(f), str(data))
+        self.assertEqual(SimpleServer.serialise_record(data, 'json'),
+                         (json.dumps(str(data)) + '\n').encode('utf-8'))
+        self.assertEqual(SimpleServer.serialise_record({'Tags': {'a'}}, 'json'),
+                         b'{"Tags": "{\'a\'}"}\n')
+
+    def test_printing_data_native_object(self):
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            SimpleServer.printing_data({'key': 'value'})
+        self.assertEqual(fake_output.getvalue().strip(), "The received data: {'key': 'value'}")
+
+    def test_decode_data_binary(self):
+        data = bytes(range(256))
+        with patch('sys.stdout', new=StringIO()):
+            result = SimpleServer.decode_data(bytearray(data), protocol.CONTENT_BINARY)
+        self.assertEqual(result, data)
+
     def test_save_File_invalid_format(self):
         with patch('sys.stdout', new=StringIO()) as fake_output:
             with self.assertRaises(SystemExit):
@@ -192,6 +251,819 @@ class TestSimpleServer(unittest.TestCase):
         mock_listen.assert_called_once_with(5)
         mock_accept.assert_called_once()
         
+    @patch('socket.socket')
+    def test_connect_client_backlog(self, mock_socket):
+        mock_socket_object = mock_socket.return_value
+        mock_socket_object.accept.return_value = ("mock_client_socket", "mock_address")
+
+        with patch('sys.stdout', new=StringIO()):
+            SimpleServer.connect_client(mock_socket_object, "127.0.0.1", 8080, 512)
+
+        mock_socket_object.listen.assert_called_once_with(512)
+
+    def test_create_listener_options(self):
+        with patch('sys.stdout', new=StringIO()):
+            listener = SimpleServer.create_listener('127.0.0.1', 0, 64, {'nodelay': True,
+                                                                         'reuseaddr': True})
+        self.assertTrue(listener.getsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR))
+        self.assertTrue(listener.getsockopt(socket.SOL_SOCKET, socket.SO_ACCEPTCONN))
+        self.assertFalse(listener.getblocking())
+        listener.close()
+
+    @unittest.skipUnless(protocol.UNIX_SUPPORTED, 'Unix domain sockets are not available')
+    def test_unix_listener_replaces_stale_socket(self):
+        folder = tempfile.mkdtemp()
+        path = os.path.join(folder, 'server.sock')
+        # a socket file left behind by a server which has stopped
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+        with patch('sys.stdout', new=StringIO()):
+            listener = SimpleServer.create_listener(path, 0, 8, {'nodelay': True}, socket.AF_UNIX)
+        self.assertEqual(listener.getsockname(), path)
+        self.assertEqual(SimpleServer.address_text(listener, path, 0), path)
+        # the file of a socket still listening is kept
+        SimpleServer.remove_socket_file(path)
+        self.assertTrue(os.path.exists(path))
+        listener.close()
+        SimpleServer.remove_socket_file(path)
+        self.assertFalse(os.path.exists(path))
+        shutil.rmtree(folder)
+
+    def test_receive_payload(self):
+        sender, receiver = socket.socketpair()
+        protocol.send_frame(sender, self.data.encode())
+
+        flags, content_type, length = SimpleServer.receive_header(receiver)
+        result = SimpleServer.receive_payload(receiver, length)
+
+        self.assertEqual(flags, protocol.FLAG_NONE)
+        self.assertEqual(content_type, protocol.CONTENT_UNKNOWN)
+        self.assertEqual(result.decode(), self.data)
+        sender.close()
+        receiver.close()
+
+    def test_receive_header_closed_connection(self):
+        sender, receiver = socket.socketpair()
+        sender.close()
+        self.assertIsNone(SimpleServer.receive_header(receiver))
+        receiver.close()
+
+    def test_receive_header_truncated(self):
+        sender, receiver = socket.socketpair()
+        sender.sendall(protocol.pack_header(10)[:3])
+        sender.close()
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            with self.assertRaises(SystemExit):
+                SimpleServer.receive_header(receiver)
+            self.assertEqual(fake_output.getvalue().strip(), 'Error: Fail to receive data from the client.')
+        receiver.close()
+
+    def test_receive_header_too_long(self):
+        sender, receiver = socket.socketpair()
+        sender.sendall(protocol.pack_header(2 ** 40))
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            with self.assertRaises(SystemExit):
+                SimpleServer.receive_header(receiver, 1024)
+            self.assertEqual(fake_output.getvalue().strip(), 'Error: Fail to receive data from the client.')
+        sender.close()
+        receiver.close()
+
+    def test_handle_client_frame_too_long(self):
+        async def scenario():
+            reader = asyncio.StreamReader()
+            # a small first chunk of a stream followed by a huge one
+            flags = protocol.FLAG_FILE | protocol.CODEC_ZLIB
+            payload = protocol.compress(b'first', protocol.CODEC_ZLIB)
+            reader.feed_data(protocol.pack_header(len(payload), flags | protocol.FLAG_MORE) + payload)
+            reader.feed_data(protocol.pack_header(2 ** 40, flags))
+            await SimpleServer.handle_client(reader, unittest.mock.Mock(), 1024, False, True,
+                                             'test.txt', max_frame=1024)
+
+        errors = SimpleServer.stats['errors']
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            # the connection ends without waiting for the payload
+            asyncio.run(asyncio.wait_for(scenario(), 5))
+        self.assertIn('Error: Fail to receive data from client', fake_output.getvalue())
+        self.assertEqual(SimpleServer.stats['errors'], errors + 1)
+
+    def test_receive_file_chunks(self):
+        sender, receiver = socket.socketpair()
+        protocol.send_frame(sender, b'first chunk, ', protocol.FLAG_FILE | protocol.FLAG_MORE)
+        protocol.send_frame(sender, b'second chunk', protocol.FLAG_FILE | protocol.FLAG_MORE)
+        protocol.send_frame(sender, b'', protocol.FLAG_FILE)
+
+        flags, _, length = protocol.recv_header(receiver)
+        with patch('sys.stdout', new=StringIO()):
+            total = SimpleServer.receive_file(receiver, flags, length, 'test.txt', True, 4)
+
+        self.assertEqual(total, 25)
+        with open('test.txt', 'rb') as f:
+            self.assertEqual(f.read(), b'first chunk, second chunk')
+        sender.close()
+        receiver.close()
+
+    def test_receive_file_encrypted(self):
+        content = os.urandom(300000)
+        with open('test.bin', 'wb') as f:
+            f.write(content)
+        sender, receiver = socket.socketpair()
+        with patch('sys.stdout', new=StringIO()):
+            thread = threading.Thread(target=SimpleClient.stream_file, args=('test.bin', sender),
+                                      kwargs={'chunk_size': 65536, 'encryption': True})
+            thread.start()
+            flags, _, length = protocol.recv_header(receiver)
+            total = SimpleServer.receive_file(receiver, flags, length, 'test.txt', True, 1024)
+            thread.join()
+
+        self.assertEqual(total, len(content))
+        with open('test.txt', 'rb') as f:
+            self.assertEqual(f.read(), content)
+        receiver.close()
+        os.remove('test.bin')
+
+    def test_stream_decryptor_rejects_reordered_and_truncated_streams(self):
+        key = Fernet.generate_key()
+        fernet = Fernet(key)
+        decryptor = SimpleServer.StreamDecryptor(key)
+        self.assertEqual(bytes(decryptor.decrypt(SimpleClient.encrypt_chunk(fernet, 0, b'first'))), b'first')
+        with self.assertRaises(ValueError):
+            decryptor.decrypt(SimpleClient.encrypt_chunk(fernet, 2, b'third'))
+        with self.assertRaises(ValueError):
+            decryptor.check_complete()
+        decryptor.decrypt(SimpleClient.encrypt_chunk(fernet, 1, b'', True))
+        decryptor.check_complete()
+
+    # Serve one connection sending the (payload, flags) frames, saving to test.txt
+    def run_frames(self, frames):
+        async def scenario():
+            reader = asyncio.StreamReader()
+            for payload, flags in frames:
+                reader.feed_data(protocol.pack_header(len(payload), flags) + payload)
+            reader.feed_eof()
+            await SimpleServer.handle_client(reader, unittest.mock.Mock(), 1024, True, True, 'test.txt')
+
+        with patch('sys.stdout', new=StringIO()):
+            asyncio.run(scenario())
+
+    def test_handle_client_encrypted_stream(self):
+        key = Fernet.generate_key()
+        fernet = Fernet(key)
+        flags = protocol.FLAG_FILE | protocol.FLAG_ENCRYPTED
+        frames = [(key, flags | protocol.FLAG_MORE),
+                  (SimpleClient.encrypt_chunk(fernet, 0, b'encrypted '), flags | protocol.FLAG_MORE),
+                  (SimpleClient.encrypt_chunk(fernet, 1, b'stream'), flags | protocol.FLAG_MORE),
+                  (SimpleClient.encrypt_chunk(fernet, 2, b'', True), flags)]
+        self.run_frames(frames)
+        with open('test.txt', 'rb') as f:
+            self.assertEqual(f.read(), b'encrypted stream')
+
+    def test_handle_client_aead_stream(self):
+        cipher = protocol.CIPHER_CHACHA20
+        key = protocol.generate_cipher_key(cipher)
+        encryptor = protocol.make_cipher(cipher, key)
+        flags = protocol.FLAG_FILE | protocol.FLAG_ENCRYPTED | cipher
+        frames = [(key, flags | protocol.FLAG_MORE),
+                  (SimpleClient.encrypt_chunk(encryptor, 0, b'aead '), flags | protocol.FLAG_MORE),
+                  (SimpleClient.encrypt_chunk(encryptor, 1, b'stream', True), flags)]
+        self.run_frames(frames)
+        with open('test.txt', 'rb') as f:
+            self.assertEqual(f.read(), b'aead stream')
+
+    def test_handle_client_compressed_stream(self):
+        flags = protocol.FLAG_FILE | protocol.CODEC_ZLIB
+        frames = [(protocol.compress(b'compressed ' * 100, protocol.CODEC_ZLIB), flags | protocol.FLAG_MORE),
+                  (protocol.compress(b'stream', protocol.CODEC_ZLIB), flags | protocol.FLAG_MORE),
+                  (b'', flags)]
+        self.run_frames(frames)
+        with open('test.txt', 'rb') as f:
+            self.assertEqual(f.read(), b'compressed ' * 100 + b'stream')
+
+    def test_xml_record_parser(self):
+        document = ('<root><record id="1"><name>Tolga</name><tag>a</tag><tag>b</tag></record>'
+                    '<record id="2"><name>Howard</name><empty/></record><total>2</total></root>').encode()
+        parser = SimpleServer.XmlRecordParser()
+        records = []
+        # fed a few bytes at a time, records come out as soon as they are complete
+        for start in range(0, len(document), 7):
+            records += parser.feed(document[start:start + 7])
+        records += parser.close()
+        expected = xmltodict.parse(document)['root']
+        self.assertEqual(records, [{'record': expected['record'][0]}, {'record': expected['record'][1]},
+                                   {'total': '2'}])
+        # complete records are dropped from the tree
+        self.assertEqual(len(parser.root), 0)
+
+    def test_xml_record_parser_incomplete(self):
+        parser = SimpleServer.XmlRecordParser()
+        parser.feed(b'<root><record>1</record>')
+        with self.assertRaises(xml.etree.ElementTree.ParseError):
+            parser.close()
+
+    def test_json_lines_parser(self):
+        parser = SimpleServer.JsonLinesParser()
+        self.assertEqual(parser.feed(b'{"a": 1}\n{"b"'), [{'a': 1}])
+        self.assertEqual(parser.feed(b': 2}\n\n{"c": 3}'), [{'b': 2}])
+        self.assertEqual(parser.close(), [{'c': 3}])
+
+    def test_receive_records_json_lines(self):
+        sender, receiver = socket.socketpair()
+        records = [{'Number': number, 'Name': 'Tolga'} for number in range(1000)]
+        # encrypted and compressed, sent from another thread as it is larger than the socket buffer
+        thread = threading.Thread(target=SimpleClient.stream_records, args=(records, sender, 1024),
+                                  kwargs={'encryption': True, 'cipher': protocol.CIPHER_AESGCM,
+                                          'codec': protocol.CODEC_ZLIB})
+        with patch('sys.stdout', new=StringIO()):
+            thread.start()
+            flags, content_type, length = SimpleServer.receive_header(receiver)
+            count = SimpleServer.receive_records(receiver, flags, content_type, length,
+                                                 'test.json', False, True)
+            thread.join()
+        receiver.close()
+        self.assertEqual(count, 1000)
+        with open('test.json') as f:
+            self.assertEqual([json.loads(line) for line in f], records)
+
+    def test_record_writer_xml(self):
+        records = [{'record': {'name': 'Tolga'}}, {'record': {'name': 'Howard'}}]
+        with patch('sys.stdout', new=StringIO()):
+            writer = SimpleServer.RecordWriter('test.xml')
+            writer.write(records[:1])
+            writer.write(records[1:])
+            writer.close()
+        with open('test.xml') as f:
+            self.assertEqual(xmltodict.parse(f.read())['root'],
+                             {'record': [{'name': 'Tolga'}, {'name': 'Howard'}]})
+
+    def test_batch_writer_appends_batches(self):
+        if os.path.exists('test_batch.json'):
+            os.remove('test_batch.json')
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            writer = SimpleServer.BatchWriter('test_batch.json', batch_size=20, batch_time=60)
+            writer.write({'a': 1})
+            # nothing is written before the batch is full
+            self.assertEqual(os.path.getsize('test_batch.json'), 0)
+            writer.write({'Name': 'Tolga'})
+            writer.write('text')
+            writer.close()
+            # a second writer appends to the same file
+            writer = SimpleServer.BatchWriter('test_batch.json')
+            writer.write([1, 2])
+            writer.close()
+        self.assertIn('2 messages are saved in json format.', fake_output.getvalue())
+        with open('test_batch.json') as f:
+            self.assertEqual([json.loads(line) for line in f],
+                             [{'a': 1}, {'Name': 'Tolga'}, 'text', [1, 2]])
+        os.remove('test_batch.json')
+
+    def test_handle_client_streams_with_batch_writer(self):
+        for name in ('test_batch.json', 'test_batch-stream.json'):
+            if os.path.exists(name):
+                os.remove(name)
+        frames = [(b'{"m": 1}', 0, protocol.CONTENT_JSON),
+                  (b'{"s": 1}\n', protocol.FLAG_MORE, protocol.CONTENT_JSONL),
+                  (b'', 0, protocol.CONTENT_JSONL),
+                  (b'{"file": true}', protocol.FLAG_FILE, protocol.CONTENT_BINARY),
+                  (b'{"m": 2}', 0, protocol.CONTENT_JSON)]
+
+        async def scenario(batch_writer):
+            reader = asyncio.StreamReader()
+            for payload, flags, content_type in frames:
+                reader.feed_data(protocol.pack_header(len(payload), flags, content_type) + payload)
+            reader.feed_eof()
+            await SimpleServer.handle_client(reader, unittest.mock.Mock(), 1024, False, True,
+                                             'test_batch.json', batch_writer=batch_writer)
+
+        with patch('sys.stdout', new=StringIO()):
+            batch_writer = SimpleServer.BatchWriter('test_batch.json')
+            asyncio.run(scenario(batch_writer))
+            batch_writer.close()
+        # the records of the stream are appended, a streamed file goes next to the batches
+        with open('test_batch.json') as f:
+            self.assertEqual([json.loads(line) for line in f], [{'m': 1}, {'s': 1}, {'m': 2}])
+        with open('test_batch-stream.json') as f:
+            self.assertEqual(f.read(), '{"file": true}')
+        os.remove('test_batch.json')
+        os.remove('test_batch-stream.json')
+
+    def test_batch_writer_fsync_policy(self):
+        with patch('sys.stdout', new=StringIO()), patch('os.fsync') as mock_fsync:
+            writer = SimpleServer.BatchWriter('test_batch.txt', fsync='message')
+            writer.write('first')
+            writer.write('second')
+            writer.close()
+        self.assertEqual(mock_fsync.call_count, 2)
+        with open('test_batch.txt') as f:
+            self.assertEqual(f.read().splitlines()[-2:], ['first', 'second'])
+        os.remove('test_batch.txt')
+        with self.assertRaises(ValueError):
+            SimpleServer.BatchWriter('test_batch.txt', fsync='always')
+
+    def test_batch_writer_writes_in_background(self):
+        threads = []
+        with patch('sys.stdout', new=StringIO()), \
+                patch('os.fsync', side_effect=lambda fd: threads.append(threading.current_thread())):
+            writer = SimpleServer.BatchWriter('test_batch.txt', fsync='message')
+            writer.write('first')
+            writer.close()
+        # the event loop only hands the batch over, the disk writer thread syncs it
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+        self.assertFalse(writer.disk.thread.is_alive())
+        os.remove('test_batch.txt')
+
+    def test_batch_writer_due_after_batch_time(self):
+        with patch('sys.stdout', new=StringIO()), patch('time.monotonic', side_effect=[0, 0, 5]):
+            writer = SimpleServer.BatchWriter('test_batch.txt', batch_time=1.0)
+            writer.write('waiting')
+            self.assertTrue(writer.due())
+            writer.close()
+        self.assertFalse(writer.due())
+        os.remove('test_batch.txt')
+
+    def test_rotating_sink_partitions_and_rotates(self):
+        directory = tempfile.mkdtemp()
+        with patch('sys.stdout', new=StringIO()):
+            sink = SimpleServer.RotatingSink(directory, 'received.json', rotate_size=10,
+                                             compress=True, batch_size=1)
+            sink.write({'Name': 'Tolga'}, ('127.0.0.1', 5000))
+            # the first segment is full, the next message starts a new one
+            sink.write({'Name': 'Howard'}, ('127.0.0.1', 5001))
+            sink.write({'Name': 'Tolga'}, ('::1', 5002, 0, 0))
+            sink.close()
+        first = sorted(os.listdir(os.path.join(directory, 'json', '127.0.0.1')))
+        self.assertEqual(len(first), 2)
+        self.assertTrue(all(name.endswith('.json.gz') for name in first))
+        records = []
+        for name in first:
+            with gzip.open(os.path.join(directory, 'json', '127.0.0.1', name), 'rt') as f:
+                records.extend(json.loads(line) for line in f)
+        self.assertCountEqual(records, [{'Name': 'Tolga'}, {'Name': 'Howard'}])
+        self.assertEqual(len(os.listdir(os.path.join(directory, 'json', '__1'))), 1)
+        shutil.rmtree(directory)
+
+    def test_rotating_sink_many_rotations(self):
+        directory = tempfile.mkdtemp()
+        with patch('sys.stdout', new=StringIO()):
+            sink = SimpleServer.RotatingSink(directory, 'received.txt', rotate_size=1,
+                                             compress=True, batch_size=1)
+            for number in range(50):
+                sink.write(number)
+            sink.close()
+        # one thread compresses all segments, no thread is kept per segment
+        self.assertLessEqual(len(sink.compressor._threads), 1)
+        segments = os.listdir(os.path.join(directory, 'txt', 'local'))
+        self.assertEqual(len(segments), 50)
+        self.assertTrue(all(name.endswith('.txt.gz') for name in segments))
+        shutil.rmtree(directory)
+
+    def test_rotating_sink_rotates_by_time(self):
+        directory = tempfile.mkdtemp()
+        with patch('sys.stdout', new=StringIO()):
+            sink = SimpleServer.RotatingSink(directory, 'received.txt', rotate_time=60)
+            sink.write('first')
+            self.assertFalse(sink.due())
+            with patch('time.monotonic', return_value=time.monotonic() + 120):
+                self.assertTrue(sink.due())
+                sink.flush()
+            self.assertEqual(sink.segments, {})
+            sink.close()
+        segments = os.listdir(os.path.join(directory, 'txt', 'local'))
+        with open(os.path.join(directory, 'txt', 'local', segments[0])) as f:
+            self.assertEqual(f.read(), 'first\n')
+        shutil.rmtree(directory)
+
+    def test_handle_client_xml_record_stream(self):
+        document = b'<root>' + b''.join(b'<record><n>%d</n></record>' % n for n in range(100)) + b'</root>'
+        flags = protocol.CODEC_ZLIB
+        chunks = [document[start:start + 100] for start in range(0, len(document), 100)]
+
+        async def scenario():
+            reader = asyncio.StreamReader()
+            for chunk in chunks:
+                payload = protocol.compress(chunk, protocol.CODEC_ZLIB)
+                reader.feed_data(protocol.pack_header(len(payload), flags | protocol.FLAG_MORE,
+                                                      protocol.CONTENT_XML) + payload)
+            reader.feed_data(protocol.pack_header(0, flags, protocol.CONTENT_XML))
+            reader.feed_eof()
+            await SimpleServer.handle_client(reader, unittest.mock.Mock(), 1024, False, True, 'test.json')
+
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            asyncio.run(scenario())
+        self.assertIn('Record stream of 100 records is received.', fake_output.getvalue())
+        with open('test.json') as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(records, [{'record': {'n': str(n)}} for n in range(100)])
+
+    def test_part_name_unique_across_workers(self):
+        reader = object()
+        # forked workers may give their readers the same id
+        with patch('os.getpid', return_value=101):
+            first = SimpleServer.part_name('test.txt', reader)
+        with patch('os.getpid', return_value=102):
+            second = SimpleServer.part_name('test.txt', reader)
+        self.assertNotEqual(first, second)
+        self.assertTrue(first.startswith('test.txt.part'))
+
+    def test_serve_stops_gracefully(self):
+        async def scenario():
+            listener = SimpleServer.create_listener('127.0.0.1', 0)
+            port = listener.getsockname()[1]
+            server = asyncio.create_task(SimpleServer.serve('127.0.0.1', port, 1024, True, False,
+                                                            'test.txt', listener=listener))
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            await asyncio.sleep(0.1)
+            os.kill(os.getpid(), signal.SIGTERM)
+            await asyncio.sleep(0.1)
+            # the connected client may still send before the server stops
+            writer.write(protocol.pack_header(4) + b'last')
+            await writer.drain()
+            writer.close()
+            await asyncio.wait_for(server, 5)
+
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            asyncio.run(scenario())
+        output = fake_output.getvalue()
+        self.assertIn('Waiting for 1 clients to finish.', output)
+        self.assertIn('The received data: last', output)
+
+    def test_watch_settings_keeps_pool_in_use(self):
+        async def scenario(users):
+            old_pool = concurrent.futures.ThreadPoolExecutor(1)
+            options = {'pool': old_pool, 'limit': asyncio.Semaphore(1),
+                       'pool_setting': ('thread', 1, None),
+                       'users': collections.Counter({old_pool: users})}
+            watcher = asyncio.create_task(SimpleServer.watch_settings(options, 0.01))
+            await asyncio.sleep(0.1)
+            watcher.cancel()
+            options['pool'].shutdown()
+            self.assertIsNot(options['pool'], old_pool)
+            return old_pool
+
+        current = settings.Settings(pool='thread', workers=2)
+        with patch('settings.reload_settings', side_effect=[True] + [False] * 100), \
+                patch('settings.get_settings', return_value=current), \
+                patch('sys.stdout', new=StringIO()):
+            # a connected client still decodes its messages in the old pool
+            old_pool = asyncio.run(scenario(1))
+            self.assertEqual(old_pool.submit(sum, [1, 2]).result(), 3)
+            old_pool.shutdown()
+        with patch('settings.reload_settings', side_effect=[True] + [False] * 100), \
+                patch('settings.get_settings', return_value=current), \
+                patch('sys.stdout', new=StringIO()):
+            old_pool = asyncio.run(scenario(0))
+            with self.assertRaises(RuntimeError):
+                old_pool.submit(sum, [1, 2])
+
+    def test_worker_stats(self):
+        stats_file = StringIO()
+        with patch.dict(SimpleServer.stats, {'connections': 2, 'messages': 5}, clear=True):
+            SimpleServer.write_stats(stats_file, 3)
+        line = json.loads(stats_file.getvalue())
+        self.assertEqual(line, {'connections': 2, 'messages': 5, 'worker': 3, 'pid': os.getpid()})
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            SimpleServer.print_stats({line['pid']: line})
+        self.assertEqual(fake_output.getvalue().strip(), 'Worker 3 (pid {}): 2 connections, '
+                         '5 messages, 0 bytes, 0 errors.'.format(os.getpid()))
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'worker processes need os.fork')
+    def test_supervisor_restarts_workers(self):
+        folder = tempfile.mkdtemp()
+        config_file = os.path.join(folder, 'configfile.ini')
+        with open(config_file, 'w') as f:
+            f.write('[setting]\nhost = 127.0.0.1\n')
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        server = subprocess.Popen(
+            [sys.executable, '-u', os.path.join(parentdir, 'simple_server.py'), '--config',
+             config_file, '--port', str(port), '--mode', 'multi', '--processes', '2',
+             '--save', 'False', '--stats-interval', '0.2'],
+            cwd=folder, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        output = []
+        reader = threading.Thread(target=lambda: output.extend(server.stdout))
+        reader.start()
+
+        def wait_for(text, count):
+            deadline = time.monotonic() + 10
+            # the lines of the processes may run into each other
+            while ''.join(output).count(text) < count:
+                self.assertLess(time.monotonic(), deadline, ''.join(output))
+                time.sleep(0.05)
+
+        try:
+            wait_for('The server is listening', 2)
+            server.send_signal(signal.SIGHUP)
+            wait_for('The server is listening', 4)
+            wait_for('The server is stopped.', 2)
+            with socket.create_connection(('127.0.0.1', port)) as client:
+                protocol.send_frame(client, b'after restart', content_type=protocol.CONTENT_TEXT)
+            wait_for('The received data: after restart', 1)
+            server.send_signal(signal.SIGUSR1)
+            wait_for('Worker ', 2)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(10)
+            reader.join()
+            shutil.rmtree(folder)
+        text = ''.join(output)
+        third = text.index('The server is listening', text.index('The workers are restarted.'))
+        # an old worker only stops once a new one accepts clients
+        self.assertLess(third, text.index('The server is stopped.'))
+        self.assertEqual(server.returncode, 0)
+
+    def test_handle_client_concurrent_clients(self):
+        async def scenario():
+            server = await asyncio.start_server(
+                lambda reader, writer: SimpleServer.handle_client(reader, writer, 1024, True, True, 'test.txt'),
+                '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            # open both connections before any of them sends its data
+            first = await asyncio.open_connection('127.0.0.1', port)
+            second = await asyncio.open_connection('127.0.0.1', port)
+            for (_, writer), payload in ((second, b'second client'), (first, b'first client')):
+                writer.write(protocol.pack_header(len(payload)) + payload)
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+            await asyncio.sleep(0.2)
+            server.close()
+            await server.wait_closed()
+
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            asyncio.run(scenario())
+        output = fake_output.getvalue()
+        self.assertIn('The received data: second client', output)
+        self.assertIn('The received data: first client', output)
+
+    def test_handle_client_session_key(self):
+        def send_messages(port, psk):
+            with SimpleClient.Client('127.0.0.1', port, encryption=True, psk=psk) as client:
+                client.send('first secret', protocol.CONTENT_TEXT)
+                client.send('second secret', protocol.CONTENT_TEXT)
+
+        async def scenario(psk):
+            server = await asyncio.start_server(
+                lambda reader, writer: SimpleServer.handle_client(reader, writer, 1024, True, False,
+                                                                  'test.txt', psk=b'shared'),
+                '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            await asyncio.to_thread(send_messages, port, psk)
+            await asyncio.sleep(0.2)
+            server.close()
+            await server.wait_closed()
+
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            asyncio.run(scenario(b'shared'))
+        output = fake_output.getvalue()
+        self.assertEqual(output.count('Session key is established.'), 1)
+        self.assertIn('The received data: first secret', output)
+        self.assertIn('The received data: second secret', output)
+        # a client with another pre-shared key derives another session key
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            asyncio.run(scenario(b'other'))
+        self.assertNotIn('first secret', fake_output.getvalue())
+        self.assertIn('Error: Fail to decrypt data.', fake_output.getvalue())
+
+    def test_decode_data_aead(self):
+        with patch('sys.stdout', new=StringIO()):
+            encryptedData = SimpleClient.data_encryption(self.data, True, protocol.CIPHER_AESGCM)
+            result = SimpleServer.decode_data(encryptedData, protocol.CONTENT_TEXT, True,
+                                              cipher=protocol.CIPHER_AESGCM)
+        self.assertEqual(result, self.data)
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            with self.assertRaises(SystemExit):
+                SimpleServer.decode_data(encryptedData[:-1], protocol.CONTENT_TEXT, True,
+                                         cipher=protocol.CIPHER_AESGCM)
+        self.assertEqual(fake_output.getvalue().strip(), 'Error: Fail to decrypt data.')
+
+    def test_decode_data_compressed(self):
+        data = json.dumps({str(n): n for n in range(100)})
+        with patch('sys.stdout', new=StringIO()):
+            # compressed before it is encrypted, with both kinds of cipher
+            for cipher in (protocol.CIPHER_FERNET, protocol.CIPHER_CHACHA20):
+                payload = SimpleClient.data_encryption(protocol.compress(data.encode(), protocol.CODEC_LZMA),
+                                                       True, cipher)
+                result = SimpleServer.decode_data(payload, protocol.CONTENT_JSON, True,
+                                                  cipher=cipher, codec=protocol.CODEC_LZMA)
+                self.assertEqual(result, json.loads(data))
+
+    def test_decode_data_compression_bomb(self):
+        payload = protocol.compress(bytes(64 * 1024 * 1024), protocol.CODEC_ZLIB)
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            with self.assertRaises(SystemExit):
+                SimpleServer.decode_data(payload, protocol.CONTENT_BINARY, codec=protocol.CODEC_ZLIB)
+        self.assertIn('Error: Fail to decompress data.', fake_output.getvalue())
+
+    def test_decode_data_session_key(self):
+        private_key, public_key = protocol.generate_handshake_key()
+        with patch('sys.stdout', new=StringIO()):
+            server_public_key, session_key = SimpleServer.accept_handshake(public_key)
+        token = Fernet(protocol.derive_session_key(private_key, server_public_key)).encrypt(b'session data')
+        with patch('sys.stdout', new=StringIO()):
+            result = SimpleServer.decode_data(token, protocol.CONTENT_TEXT, True, session_key=session_key)
+        self.assertEqual(result, 'session data')
+
+    def test_create_pool(self):
+        pool = SimpleServer.create_pool('thread', 2)
+        self.assertIsInstance(pool, concurrent.futures.ThreadPoolExecutor)
+        pool.shutdown()
+        self.assertIsNone(SimpleServer.create_pool('none', 2))
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            with self.assertRaises(SystemExit):
+                SimpleServer.create_pool('fork', 2)
+            self.assertEqual(fake_output.getvalue().strip(), 'Error: Please select one of the pools: process, thread or none.')
+
+    def test_decode_in_pool(self):
+        async def scenario(pool):
+            limit = asyncio.Semaphore(1)
+            # more payloads than slots, they wait for their turn
+            return await asyncio.gather(*[SimpleServer.decode_in_pool(pool, limit, json.dumps({'n': n}))
+                                          for n in range(4)])
+
+        for pool in (concurrent.futures.ThreadPoolExecutor(2), concurrent.futures.ProcessPoolExecutor(2)):
+            with pool, patch('sys.stdout', new=StringIO()):
+                result = asyncio.run(scenario(pool))
+            self.assertEqual(result, [{'n': n} for n in range(4)])
+
+    def test_handle_client_many_messages(self):
+        async def scenario():
+            reader = asyncio.StreamReader()
+            for payload, content_type in ((b'first', protocol.CONTENT_TEXT),
+                                          (b'not json', protocol.CONTENT_JSON),
+                                          (b'{"third": 3}', protocol.CONTENT_JSON)):
+                reader.feed_data(protocol.pack_header(len(payload), 0, content_type) + payload)
+            reader.feed_eof()
+            writer = unittest.mock.Mock()
+            await SimpleServer.handle_client(reader, writer, 1024, True, False, 'test.txt')
+
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            asyncio.run(scenario())
+        output = fake_output.getvalue()
+        # a message which fails to decode does not end the connection
+        self.assertIn('The received data: first', output)
+        self.assertIn('Error: Fail to process data from client', output)
+        self.assertIn("The received data: {'third': 3}", output)
+        self.assertNotIn('Error: Fail to receive data', output)
+
+    def test_handle_client_bad_data_keeps_running(self):
+        async def scenario():
+            reader = asyncio.StreamReader()
+            reader.feed_data(protocol.pack_header(0))
+            reader.feed_eof()
+            writer = unittest.mock.Mock()
+            await SimpleServer.handle_client(reader, writer, 1024, True, False, 'test.txt')
+            writer.close.assert_called_once()
+
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            asyncio.run(scenario())
+        self.assertIn('Error: Received no data from client', fake_output.getvalue())
+
+    def test_decode_data_declared_type(self):
+        with patch('sys.stdout', new=StringIO()), \
+             patch('simple_server.is_dictionary_stream') as mock_sniff:
+            result = SimpleServer.decode_data(json.dumps({'key': 'value'}), protocol.CONTENT_JSON)
+        self.assertEqual(result, {'key': 'value'})
+        # the declared type is decoded directly, nothing is sniffed
+        mock_sniff.assert_not_called()
+
+    def test_decode_data_pickle_bytes(self):
+        payload = protocol.pack_parts([pickle.dumps({'key': 'value'}, protocol=5)])
+        with patch('sys.stdout', new=StringIO()):
+            result = SimpleServer.decode_data(payload, protocol.CONTENT_PICKLE)
+        self.assertEqual(result, {'key': 'value'})
+
+    def test_decode_in_process_pool_out_of_band(self):
+        buffers = []
+        data = pickle.dumps({'Block': pickle.PickleBuffer(bytearray(b'x' * 1000))}, protocol=5,
+                            buffer_callback=buffers.append)
+        payload = protocol.pack_parts([data] + [buffer.raw() for buffer in buffers])
+
+        async def scenario(pool):
+            return await SimpleServer.decode_in_pool(pool, asyncio.Semaphore(1), payload,
+                                                     protocol.CONTENT_PICKLE)
+
+        with concurrent.futures.ProcessPoolExecutor(1) as pool, patch('sys.stdout', new=StringIO()):
+            result = asyncio.run(scenario(pool))
+            # the views are copied so the result can leave the worker process
+            self.assertEqual(result, {'Block': b'x' * 1000})
+            SimpleServer.save_file(result, 'test.pickle')
+
+    def test_unpickle_data_out_of_band(self):
+        block = bytearray(b'x' * 1000)
+        buffers = []
+        data = pickle.dumps({'Block': pickle.PickleBuffer(block)}, protocol=5, buffer_callback=buffers.append)
+        payload = protocol.pack_parts([data] + [buffer.raw() for buffer in buffers])
+        result = SimpleServer.unpickle_data(payload)
+        self.assertEqual(bytes(result['Block']), bytes(block))
+
+    def test_serve_ring_decodes_in_place(self):
+        folder = tempfile.mkdtemp()
+        name = 'ssc_server_test_{}'.format(os.getpid())
+        ring_s = SimpleServer.ring.RingReader(name, os.path.join(folder, 'ring.doorbell'), 64 * 1024)
+        buffers = []
+        data = pickle.dumps({'Block': pickle.PickleBuffer(bytearray(b'x' * 1000))}, protocol=5,
+                            buffer_callback=buffers.append)
+        writer = SimpleServer.ring.RingWriter(name, os.path.join(folder, 'ring.doorbell'))
+        writer.send_frame(protocol.pack_parts([data] + [buffer.raw() for buffer in buffers]),
+                          content_type=protocol.CONTENT_PICKLE)
+        writer.send_frame(b"{'Test': 1}", content_type=protocol.CONTENT_DICT)
+        writer.send_frame(b'chunk', protocol.FLAG_FILE | protocol.FLAG_MORE)
+        writer.close()
+        try:
+            with patch('simple_server.deliver_data') as mock_deliver, \
+                    patch('sys.stdout', new=StringIO()) as fake_output:
+                SimpleServer.serve_ring(ring_s, True, False, 'test.txt')
+        finally:
+            ring_s.close()
+            shutil.rmtree(folder)
+        # the out-of-band buffer is copied before its frame is given back
+        self.assertEqual(mock_deliver.call_args_list[0][0][0], {'Block': b'x' * 1000})
+        self.assertIsInstance(mock_deliver.call_args_list[0][0][0]['Block'], bytes)
+        self.assertEqual(mock_deliver.call_args_list[1][0][0], {'Test': 1})
+        self.assertEqual(mock_deliver.call_count, 2)
+        self.assertIn('Error: Streams and sessions can not be sent through the ring.',
+                      fake_output.getvalue())
+
+    def test_serve_ring_skips_bad_data(self):
+        folder = tempfile.mkdtemp()
+        name = 'ssc_server_test_{}'.format(os.getpid())
+        ring_s = SimpleServer.ring.RingReader(name, os.path.join(folder, 'ring.doorbell'), 64 * 1024)
+        writer = SimpleServer.ring.RingWriter(name, os.path.join(folder, 'ring.doorbell'))
+        writer.send_frame(b'{"Test": ', content_type=protocol.CONTENT_JSON)
+        writer.send_frame(b'{"Test": 2}', content_type=protocol.CONTENT_JSON)
+        writer.close()
+        errors = SimpleServer.stats['errors']
+        try:
+            with patch('simple_server.deliver_data') as mock_deliver, \
+                    patch('sys.stdout', new=StringIO()) as fake_output:
+                SimpleServer.serve_ring(ring_s, True, False, 'test.txt')
+        finally:
+            ring_s.close()
+            shutil.rmtree(folder)
+        # a bad message does not stop the server, the next one is delivered
+        self.assertEqual(mock_deliver.call_count, 1)
+        self.assertEqual(mock_deliver.call_args[0][0], {'Test': 2})
+        self.assertEqual(SimpleServer.stats['errors'], errors + 1)
+        self.assertIn('Error: Fail to process data from the ring.', fake_output.getvalue())
+        # a stop is not taken for bad data
+        with self.assertRaises(SimpleServer.ServerStopped):
+            SimpleServer.stop_server(signal.SIGTERM, None)
+
+    def test_client_dictionary_saved_as_dictionary(self):
+        for data_format, file in (('json', 'test.json'), ('xml', 'test.xml'),
+                                  ('binary', 'test.pickle')):
+            client_end, server_end = socket.socketpair()
+            with patch('simple_client.reading_config',
+                       return_value=('127.0.0.1', 9090, 4096, "{'Test':1,'Data':2}", False,
+                                     data_format)), \
+                    patch('simple_client.create_socket', return_value=client_end), \
+                    patch('simple_client.connect_server'), \
+                    patch('sys.stdout', new=StringIO()):
+                SimpleClient.main_function()
+                flags, content_type, length = SimpleServer.receive_header(server_end)
+                data_received = SimpleServer.decode_data(
+                    SimpleServer.receive_payload(server_end, length), content_type, False, False,
+                    None, flags & protocol.CIPHER_MASK, flags & protocol.CODEC_MASK)
+                SimpleServer.save_file(data_received, file)
+            server_end.close()
+            if data_format == 'json':
+                with open(file) as f:
+                    self.assertEqual(json.load(f), {'Test': 1, 'Data': 2})
+            elif data_format == 'xml':
+                with open(file) as f:
+                    # the document received keeps its own root element
+                    self.assertEqual(xmltodict.parse(f.read())['root']['root'],
+                                     {'Test': '1', 'Data': '2'})
+            else:
+                with open(file, 'rb') as f:
+                    self.assertEqual(pickle.load(f), {'Test': 1, 'Data': 2})
+            os.remove(file)
+
+    def test_restricted_unpickler_rejects_globals(self):
+        payload = protocol.pack_parts([pickle.dumps(os.system, protocol=5)])
+        with self.assertRaises(pickle.UnpicklingError):
+            SimpleServer.unpickle_data(payload)
+        self.assertEqual(SimpleServer.restricted_loads(pickle.dumps({1, 2})), {1, 2})
+
+    def test_decode_data_encrypted(self):
+        encryptedData = SimpleClient.data_encryption(self.data, True)
+        with patch('sys.stdout', new=StringIO()):
+            result = SimpleServer.decode_data(encryptedData, protocol.CONTENT_TEXT, True)
+        self.assertEqual(result, self.data)
+
+    def test_decode_data_unknown_type_without_sniffing(self):
+        received = json.dumps({'key': 'value'})
+        with patch('sys.stdout', new=StringIO()):
+            result = SimpleServer.decode_data(received, protocol.CONTENT_UNKNOWN, sniff=False)
+        self.assertEqual(result, received)
+
+    def test_decode_data_wrong_type(self):
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            with self.assertRaises(SystemExit):
+                SimpleServer.decode_data(self.badData, protocol.CONTENT_JSON)
+            self.assertIn('Error: Fail to decode data.', fake_output.getvalue())
+
     def test_receive_from_client_dictionary_stream(self):
         received = {"key": "value"}
         socket_s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -216,7 +1088,7 @@ class TestSimpleServer(unittest.TestCase):
         
         result = SimpleServer.receive_from_client(received, socket_s)
         
-        self.assertEqual(result, received)
+        self.assertEqual(result, {"key": "value"})
         socket_s.close()
 
     def test_receive_from_client_xml_stream(self):
@@ -225,7 +1097,7 @@ class TestSimpleServer(unittest.TestCase):
         
         result = SimpleServer.receive_from_client(received, socket_s)
         
-        self.assertEqual(result, str({"root": {"key": "value"}}))
+        self.assertEqual(result, {"root": {"key": "value"}})
         socket_s.close()
 
     def test_receive_from_client_data_decryption(self):
@@ -257,6 +1129,11 @@ class TestSimpleServer(unittest.TestCase):
         # Assert the printed output matches the expected output
         self.assertEqual(actual_output, expected_output)
 
+    def test_printing_binary_data(self):
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            SimpleServer.printing_data(bytes(10))
+        self.assertEqual(fake_output.getvalue(), 'The received data: 10 bytes of binary data\n')
+
         
 if __name__ == '__main__':
     try:
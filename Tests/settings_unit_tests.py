@@ -0,0 +1,179 @@
+'''
+This module performs unit tests of the functions in
+"settings.py" module in the Simple Server Client Project.
+'''
+# Prevent false positive pylint warnings for PEP8 score
+# pylint: disable=E0611
+# pylint: disable=C0413
+
+import unittest
+import sys
+import os
+import inspect
+import tempfile
+import shutil
+from io import StringIO
+from unittest.mock import patch
+
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import settings
+
+
+CONFIG = '''[setting]
+host = 127.0.0.1
+port = 9090
+buffer = 4096
+
+[client]
+userinput = test2.txt
+encryption = True
+level =
+
+[server]
+print = False
+workers = 4
+batch_time = 0.5
+'''
+
+
+
+class TestLoadSettings(unittest.TestCase):
+    '''
+    This class performs unit tests of the "load_settings"
+    function in the settings module.
+    '''
+
+    def setUp(self):
+        '''
+        This function writes a config file to a temporary folder.
+        '''
+        self.folder = tempfile.mkdtemp()
+        self.filename = os.path.join(self.folder, 'configfile.ini')
+        with open(self.filename, 'w', encoding='utf-8') as config_file:
+            config_file.write(CONFIG)
+
+
+    def tearDown(self):
+        '''
+        This function removes the temporary folder.
+        '''
+        shutil.rmtree(self.folder)
+
+
+    def test_values_are_typed(self):
+        '''
+        Tests that the values are converted to their types
+        and that missing options keep their defaults.
+        '''
+        result = settings.load_settings(self.filename, environ={})
+
+        self.assertEqual(result.port, 9090)
+        self.assertIs(result.encryption, True)
+        self.assertIs(result.enable_print, False)
+        self.assertIsNone(result.level)
+        self.assertEqual(result.batch_time, 0.5)
+        self.assertEqual(result.writer, 'file')
+        with self.assertRaises(AttributeError):
+            result.port = 1
+
+
+    def test_environment_and_overrides(self):
+        '''
+        Tests that environment variables override the file
+        and that command line overrides win over both.
+        '''
+        environ = {'SIMPLE_SERVER_WORKERS': '8', 'SIMPLE_SETTING_PORT': '9191'}
+
+        result = settings.load_settings(self.filename, environ, {'port': '9292'})
+
+        self.assertEqual(result.workers, 8)
+        self.assertEqual(result.port, 9292)
+
+
+    def test_wrong_settings(self):
+        '''
+        Tests that wrong types and values are rejected.
+        '''
+        for overrides in ({'port': 'ninety'}, {'port': '70000'}, {'mode': 'double'},
+                          {'workers': '0'}, {'enable_save': 'maybe'},
+                          {'batch_time': '0'}, {'max_frame': '0'}):
+            with self.assertRaises(ValueError):
+                settings.load_settings(self.filename, {}, overrides)
+
+
+
+class TestReloadSettings(unittest.TestCase):
+    '''
+    This class performs unit tests of the "get_settings",
+    "reload_settings" and "configure" functions in the settings module.
+    '''
+
+    def setUp(self):
+        '''
+        This function writes a config file and points the settings at it.
+        '''
+        self.folder = tempfile.mkdtemp()
+        self.filename = os.path.join(self.folder, 'configfile.ini')
+        with open(self.filename, 'w', encoding='utf-8') as config_file:
+            config_file.write(CONFIG)
+        self.state = dict(settings.state)
+        settings.configure(['--config', self.filename])
+
+
+    def tearDown(self):
+        '''
+        This function restores the settings and removes the folder.
+        '''
+        settings.state.update(self.state)
+        shutil.rmtree(self.folder)
+
+
+    def test_file_read_once(self):
+        '''
+        Tests that the file is only read again after it has changed.
+        '''
+        first = settings.get_settings()
+
+        with patch('settings.load_settings') as mock_load:
+            self.assertFalse(settings.reload_settings())
+            self.assertIs(settings.get_settings(), first)
+            mock_load.assert_not_called()
+
+        with open(self.filename, 'a', encoding='utf-8') as config_file:
+            config_file.write('queue = 16\n')
+        self.assertTrue(settings.reload_settings())
+        self.assertEqual(settings.get_settings().queue, 16)
+
+
+    def test_wrong_change_keeps_settings(self):
+        '''
+        Tests that a wrong change is reported and the last settings are kept.
+        '''
+        first = settings.get_settings()
+        with open(self.filename, 'a', encoding='utf-8') as config_file:
+            config_file.write('mode = double\n')
+
+        with patch('sys.stdout', new=StringIO()) as fake_output:
+            self.assertFalse(settings.reload_settings())
+
+        self.assertIs(settings.get_settings(), first)
+        self.assertIn('Error: Wrong setting, mode must be one of', fake_output.getvalue())
+
+
+    def test_command_line(self):
+        '''
+        Tests that command line flags override the file.
+        '''
+        result = settings.configure(['--config', self.filename, '--batch-size', '4096',
+                                     '--print', 'True'])
+
+        self.assertEqual(result.batch_size, 4096)
+        self.assertIs(result.enable_print, True)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,67 +13,159 @@ Modification(s):
 1. Add server section for server varibles input.
 2. Add client section for client varibles input.
 3. Add printing for easy flow catching.
+4. Write the file only when run, not when imported.
 
 """
 
 import configparser
+import os
+import ast
 
-config = configparser.ConfigParser()
-
-# add the structure to the file
-# common setting
-config.add_section('setting')
-config.set('setting', 'host', '127.0.0.1')
-config.set('setting', 'port', '9090')
-config.set('setting', 'buffer', '4096')
-
-
-# user input for client side
-config.add_section('client')
-#userinput = "{'Test': 1, 'Data': 2, 'Sample': 3}"
-#userinput = "test1.txt" # content is dictionary
-userinput = "test2.txt" # content is string
-#userinput = "test_file_size.txt" # tests the file size
-#userinput = "UoL_logo.jpg"
-config.set('client', 'userinput', userinput)
-config.set('client', 'encryption', 'True')
-pickling_format = 'binary'
-#pickling_format = 'json'
-#pickling_format = 'xml'
-#pickling_format = 'YAML' # for testing
-config.set('client', 'format', pickling_format)
-
-
-# user input for server side
-config.add_section('server')
-config.set('server', 'print', 'True')
-config.set('server', 'save', 'True')
-
-
-'''
-This if clause sets filename variable for the server module.
-'''
-if userinput[-4:]=='.txt':
-    filename = 'received.txt'
-else:
-    try:
-        if isinstance(eval(userinput), dict):
-            if pickling_format=='binary':
-                filename ='received.pickle'
-            elif pickling_format=='json':
-                filename ='received.json'
-            elif pickling_format=='xml':
-                filename ='received.xml'
-            else:
-                filename = 'received.yaml'
-    except:
-        filename = userinput
-
-config.set('server', 'file', filename)
-
-
-# write the new structure to the new file
-filename = 'configfile.ini'
-with open(filename, 'w') as f:
-    config.write(f)
-    print('Succeed to create config file.')
\ No newline at end of file
+
+def create_config(config_file='configfile.ini'):
+    """
+    function to write the settings to configfile.ini
+    """
+    config = configparser.ConfigParser()
+
+    # add the structure to the file
+    # common setting
+    config.add_section('setting')
+    config.set('setting', 'host', '127.0.0.1')
+    config.set('setting', 'port', '9090')
+    config.set('setting', 'buffer', '4096')
+    transport = 'tcp'
+    #transport = 'unix' # Unix domain socket for clients on the same host, faster than tcp
+    #transport = 'shm' # shared memory ring for dictionaries and small text files on the same host
+    config.set('setting', 'transport', transport)
+    config.set('setting', 'path', 'simple_server.sock') # file of the unix socket, host and port are not used
+    config.set('setting', 'ring', 'simple_server_ring') # name of the shared memory ring
+    config.set('setting', 'doorbell', 'simple_server.doorbell') # named pipe waking the server up
+    # pre-shared key mixed into the session key, must be the same on both sides
+    config.set('setting', 'psk', '')
+    # socket options of both sides, 0 keeps the default of the operating system
+    config.set('setting', 'nodelay', 'True') # send small messages at once
+    config.set('setting', 'sndbuf', '0') # kernel send buffer in bytes, larger for fast long links
+    config.set('setting', 'rcvbuf', '0') # kernel receive buffer in bytes
+    config.set('setting', 'keepalive', 'False') # probe idle connections
+    config.set('setting', 'keepalive_idle', '0') # idle seconds before the first probe
+    config.set('setting', 'keepalive_interval', '0') # seconds between probes
+    config.set('setting', 'keepalive_count', '0') # failed probes before the connection is dropped
+
+
+    # user input for client side
+    config.add_section('client')
+    #userinput = "{'Test': 1, 'Data': 2, 'Sample': 3}"
+    #userinput = "test1.txt" # content is dictionary
+    userinput = "test2.txt" # content is string
+    #userinput = "test_file_size.txt" # tests the file size
+    #userinput = "UoL_logo.jpg"
+    config.set('client', 'userinput', userinput)
+    config.set('client', 'encryption', 'True')
+    cipher = 'fernet'
+    #cipher = 'aesgcm' # AES-GCM, fastest on processors with AES instructions
+    #cipher = 'chacha20' # ChaCha20-Poly1305, fast without AES instructions
+    config.set('client', 'cipher', cipher)
+    compression = 'none'
+    #compression = 'auto' # probe each payload and pick none, a fast or a high ratio codec
+    #compression = 'zlib'
+    #compression = 'lzma' # smallest output, slowest
+    #compression = 'zstd' # needs the zstandard package
+    config.set('client', 'compression', compression)
+    config.set('client', 'level', '') # empty for the default level of the codec
+    config.set('client', 'threshold', '1024') # smaller data is not compressed
+    config.set('client', 'budget', '10') # slowest high ratio compression in MB/s for auto
+    pickling_format = 'binary'
+    #pickling_format = 'json'
+    #pickling_format = 'xml'
+    #pickling_format = 'jsonl' # streamed as json lines, one item per line
+    #pickling_format = 'YAML' # for testing
+    config.set('client', 'format', pickling_format)
+
+
+    # user input for server side
+    config.add_section('server')
+    config.set('server', 'print', 'True')
+    config.set('server', 'save', 'True')
+    server_mode = 'single' # serve one client and exit
+    #server_mode = 'multi' # keep serving many clients concurrently
+    config.set('server', 'mode', server_mode)
+    # worker pool decoding the data in multi mode
+    worker_pool = 'process' # one process per core for decryption and deserialisation
+    #worker_pool = 'thread'
+    #worker_pool = 'none' # decode in the event loop
+    config.set('server', 'pool', worker_pool)
+    config.set('server', 'workers', '4')
+    # received payloads allowed to wait for a worker before clients are held back
+    config.set('server', 'queue', '8')
+    # guess the format of data sent without a content type (legacy clients)
+    config.set('server', 'sniff', 'False')
+    # how received messages are saved
+    saving_writer = 'file' # every message overwrites the file
+    #saving_writer = 'batch' # messages are appended to the file in batches
+    #saving_writer = 'rotate' # batches go to rotated files per format and client
+    config.set('server', 'writer', saving_writer)
+    config.set('server', 'batch_size', '65536') # bytes kept before a batch is written
+    config.set('server', 'batch_time', '1.0') # seconds a message may wait to be written
+    fsync_policy = 'none' # the operating system decides when the data reaches the disk
+    #fsync_policy = 'batch' # every batch is on the disk once written
+    #fsync_policy = 'message' # every message is on the disk once received, slowest
+    config.set('server', 'fsync', fsync_policy)
+    # rotate writer: directory/format/client/received-time-number.format
+    config.set('server', 'directory', 'received')
+    config.set('server', 'rotate_size', '67108864') # bytes of a file before the next is started
+    config.set('server', 'rotate_time', '3600') # seconds before the next file is started, 0 never
+    config.set('server', 'rotate_compress', 'False') # gzip the files which are complete
+    # seconds between checks of configfile.ini for changes in multi mode, 0 never
+    config.set('server', 'reload', '0')
+    # connections waiting to be accepted before new ones are refused
+    config.set('server', 'backlog', '128')
+    config.set('server', 'reuseaddr', 'True') # restart at once on the same port
+    config.set('server', 'reuseport', 'False') # let several servers listen on the same port
+    # worker processes of the multi mode server, each with its own event loop
+    config.set('server', 'processes', '1') # more than 1 starts a supervisor forking the workers
+    sharding = 'reuseport' # every worker listens on the port, the kernel shares the clients
+    #sharding = 'inherit' # the workers share the listening socket of the supervisor
+    config.set('server', 'sharding', sharding)
+    config.set('server', 'grace', '10') # seconds clients have to finish when a worker stops
+    config.set('server', 'stats_interval', '10') # seconds between statistics of the workers
+    config.set('server', 'ring_size', str(64 * 1024 * 1024)) # bytes of the shared memory ring, the largest message
+    # bytes of the largest message accepted in one frame, streams come in smaller chunks
+    config.set('server', 'max_frame', str(64 * 1024 * 1024))
+
+
+    '''
+    This if clause sets filename variable for the server module.
+    '''
+    if userinput[-4:]=='.txt':
+        filename = 'received.txt'
+    else:
+        try:
+            # only read the dictionary, never run the input as code
+            if isinstance(ast.literal_eval(userinput), dict):
+                if pickling_format=='binary':
+                    filename ='received.pickle'
+                elif pickling_format=='json':
+                    filename ='received.json'
+                elif pickling_format=='xml':
+                    filename ='received.xml'
+                elif pickling_format=='jsonl':
+                    # the records are saved one json document per line
+                    filename ='received.json'
+                else:
+                    filename = 'received.yaml'
+        except (ValueError, SyntaxError):
+            # other files keep their extension, e.g. received.jpg
+            filename = 'received' + os.path.splitext(userinput)[1]
+
+    config.set('server', 'file', filename)
+
+
+    # write the new structure to the new file
+    with open(config_file, 'w') as f:
+        config.write(f)
+        print('Succeed to create config file.')
+
+
+if __name__ == "__main__":
+    create_config()
@@ -0,0 +1,442 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Protocol
+Code version: 1.0
+
+Description:
+Python3 file for the wire protocol shared by simple server and client.
+Every payload is sent as a frame: a fixed size header followed by the body.
+The header holds the protocol version, flags, the content type and the
+payload length, so the receiver knows exactly how many bytes to read
+whatever the size of the payload or of the TCP segments carrying it,
+and which decoder the payload needs.
+Large files are streamed as a series of frames, one per chunk, so neither
+side has to hold the whole file in memory. Encrypted streams are
+encrypted chunk by chunk for the same reason.
+A client may open an encrypted session with an X25519 handshake, both
+sides then derive the same key and reuse one cipher for the whole connection.
+Encrypted payloads use Fernet or one of the AEAD ciphers AES-GCM and
+ChaCha20-Poly1305, the cipher is declared in the flags of the header.
+Payloads may be compressed with zlib, lzma or zstd before they are
+encrypted, the codec is declared in the flags of the header as well.
+Both sides tune their sockets with the same options: Nagle's algorithm,
+kernel buffer sizes, keepalive and address reuse.
+The frames travel over TCP or, between processes on the same host,
+over Unix domain sockets.
+"""
+
+import os
+import socket
+import struct
+import base64
+import zlib
+import lzma
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.fernet import Fernet
+try:
+    # zstd is optional, it needs the zstandard package
+    import zstandard
+except ImportError:
+    zstandard = None
+
+PROTOCOL_VERSION = 2
+
+# version (1 byte), flags (1 byte), content type (1 byte),
+# payload length (8 bytes), network order
+HEADER = struct.Struct('!BBBQ')
+
+FLAG_NONE = 0x00
+# more frames of the same message follow this one,
+# a message of many frames without the file flag is a record stream
+# which the receiver decodes record by record as the frames arrive
+FLAG_MORE = 0x01
+# the payload is file content to be written to disk as it arrives
+FLAG_FILE = 0x02
+# the payload is encrypted
+FLAG_ENCRYPTED = 0x04
+# the payload is encrypted with the session key of the connection
+FLAG_SESSION = 0x08
+# two bits of the flags select the cipher of an encrypted payload
+CIPHER_MASK = 0x30
+CIPHER_FERNET = 0x00
+CIPHER_AESGCM = 0x10
+CIPHER_CHACHA20 = 0x20
+CIPHERS = {'fernet': CIPHER_FERNET, 'aesgcm': CIPHER_AESGCM, 'chacha20': CIPHER_CHACHA20}
+# two bits of the flags select the codec of a compressed payload
+CODEC_MASK = 0xC0
+CODEC_NONE = 0x00
+CODEC_ZLIB = 0x40
+CODEC_LZMA = 0x80
+CODEC_ZSTD = 0xC0
+CODECS = {'none': CODEC_NONE, 'zlib': CODEC_ZLIB, 'lzma': CODEC_LZMA, 'zstd': CODEC_ZSTD}
+ZSTD_SUPPORTED = zstandard is not None
+# largest payload of one frame the receiver accepts, as the length is given
+# by the sender, streams are sent in chunks much smaller than this and plain
+# file content is written to disk as it arrives, so it is not limited
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+# payloads smaller than this are not worth compressing
+COMPRESS_THRESHOLD = 1024
+# a compressed payload may expand to this many times its size, but at least
+# to the minimum, so a small payload can not fill the memory of the receiver
+DECOMPRESS_RATIO = 64
+DECOMPRESS_MINIMUM = 1024 * 1024
+# with the auto codec the client probes the first block of each payload
+# and picks no compression, the fast codec or the high ratio codec,
+# auto itself is never sent in a header
+CODEC_AUTO = -1
+PROBE_SIZE = 16 * 1024
+# a codec must save at least this share of the size to be used
+MIN_SAVING = 0.1
+# slowest compression speed in MB/s the high ratio codec may have
+CPU_BUDGET = 10.0
+
+# content types, declared by the sender so the receiver does not guess
+# unknown content is only decoded by trying each format in turn
+CONTENT_UNKNOWN = 0
+CONTENT_TEXT = 1
+CONTENT_DICT = 2
+CONTENT_PICKLE = 3
+CONTENT_JSON = 4
+CONTENT_XML = 5
+CONTENT_BINARY = 6
+# public key of one side of the session handshake
+CONTENT_HANDSHAKE = 7
+# json lines, one json document per line
+CONTENT_JSONL = 8
+
+# a pickle payload starts with the number of parts and the length of each part,
+# the first part is the pickle and the others its out-of-band buffers
+PART_COUNT = struct.Struct('!I')
+PART_LENGTH = struct.Struct('!Q')
+
+# every chunk of an encrypted stream starts with its sequence number and
+# a last chunk marker, both encrypted and authenticated with the chunk
+CHUNK_PREFIX = struct.Struct('!QB')
+
+# size of the chunks a streamed file is cut into
+CHUNK_SIZE = 64 * 1024
+
+# AEAD ciphertext is sent as raw bytes: a random nonce followed by
+# the ciphertext and its tag, the keys are raw 256 bit keys
+NONCE_SIZE = 12
+AEAD_KEY_SIZE = 32
+AEAD_CLASSES = {CIPHER_AESGCM: AESGCM, CIPHER_CHACHA20: ChaCha20Poly1305}
+
+# context of the session key derivation, a pre-shared key is used as the salt
+SESSION_INFO = b'simple-server-client session'
+
+# os.splice moves data between file descriptors inside the kernel (Linux only)
+SPLICE_SUPPORTED = hasattr(os, 'splice')
+
+# Unix domain sockets connect processes on the same host without the TCP/IP stack
+UNIX_SUPPORTED = hasattr(socket, 'AF_UNIX')
+
+# several sockets may listen on the same port, the kernel shares the connections
+REUSEPORT_SUPPORTED = hasattr(socket, 'SO_REUSEPORT')
+
+# keepalive timers in seconds and probe count, where the platform has them
+KEEPALIVE_OPTIONS = {'keepalive_idle': getattr(socket, 'TCP_KEEPIDLE', None),
+                     'keepalive_interval': getattr(socket, 'TCP_KEEPINTVL', None),
+                     'keepalive_count': getattr(socket, 'TCP_KEEPCNT', None)}
+
+
+def pack_header(length, flags=FLAG_NONE, content_type=CONTENT_UNKNOWN):
+    """
+    function to build the header of a frame
+    """
+    return HEADER.pack(PROTOCOL_VERSION, flags, content_type, length)
+
+def unpack_header(header, max_length=MAX_FRAME_SIZE):
+    """
+    function to read version, flags, content type and payload length from a header
+    raises ValueError if the payload is longer than max_length bytes,
+    unless it is plain file content
+    """
+    version, flags, content_type, length = HEADER.unpack(header)
+    if version != PROTOCOL_VERSION:
+        raise ValueError('Unsupported protocol version: {}'.format(version))
+    plain_file = flags & FLAG_FILE and not flags & (FLAG_ENCRYPTED | CODEC_MASK)
+    if length > max_length and not plain_file:
+        raise ValueError('Frame of {} bytes is larger than {} bytes.'.format(length, max_length))
+    return flags, content_type, length
+
+def pack_parts(parts):
+    """
+    function to join a pickle and its out-of-band buffers into one payload
+    """
+    views = [memoryview(part).cast('B') for part in parts]
+    lengths = [PART_COUNT.pack(len(views))] + [PART_LENGTH.pack(view.nbytes) for view in views]
+    return b''.join(lengths + views)
+
+def unpack_parts(payload):
+    """
+    function to split a payload into the pickle and its out-of-band buffers
+    the parts are memoryview slices of the payload, nothing is copied
+    """
+    view = memoryview(payload)
+    count = PART_COUNT.unpack_from(view)[0]
+    offset = PART_COUNT.size + count * PART_LENGTH.size
+    parts = []
+    for index in range(count):
+        length = PART_LENGTH.unpack_from(view, PART_COUNT.size + index * PART_LENGTH.size)[0]
+        if offset + length > len(view):
+            raise ValueError('Pickle part {} is truncated.'.format(index))
+        parts.append(view[offset:offset + length])
+        offset += length
+    return parts
+
+class AeadCipher:
+    """
+    AES-GCM or ChaCha20-Poly1305 cipher with the encrypt and decrypt
+    methods of Fernet, so both can be used in the same places
+    """
+
+    def __init__(self, cipher, key):
+        self.aead = AEAD_CLASSES[cipher](bytes(key))
+
+    def encrypt(self, data):
+        """
+        function to encrypt data with a new random nonce
+        """
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + self.aead.encrypt(nonce, bytes(data), None)
+
+    def decrypt(self, token):
+        """
+        function to check and decrypt a nonce and ciphertext
+        """
+        view = memoryview(token)
+        return self.aead.decrypt(view[:NONCE_SIZE], view[NONCE_SIZE:], None)
+
+def generate_cipher_key(cipher=CIPHER_FERNET):
+    """
+    function to create a new key for the given cipher
+    Fernet keys are url-safe base64, the AEAD keys are raw bytes
+    """
+    if cipher == CIPHER_FERNET:
+        return Fernet.generate_key()
+    if cipher == CIPHER_AESGCM:
+        return AESGCM.generate_key(AEAD_KEY_SIZE * 8)
+    return ChaCha20Poly1305.generate_key()
+
+def make_cipher(cipher, key):
+    """
+    function to create the cipher object for a key
+    raises ValueError for an unknown cipher
+    """
+    if cipher == CIPHER_FERNET:
+        return Fernet(bytes(key))
+    if cipher not in AEAD_CLASSES:
+        raise ValueError('Unsupported cipher: {}'.format(cipher))
+    return AeadCipher(cipher, key)
+
+def make_session_cipher(cipher, session_key):
+    """
+    function to create the cipher object for a session key
+    the AEAD ciphers take the raw bytes of the key
+    """
+    if cipher != CIPHER_FERNET:
+        session_key = base64.urlsafe_b64decode(session_key)
+    return make_cipher(cipher, session_key)
+
+def compress(data, codec, level=None):
+    """
+    function to compress data with the given codec
+    level None uses the default level of the codec
+    empty data stays empty
+    """
+    if codec == CODEC_NONE or not data:
+        return data
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, -1 if level is None else level)
+    if codec == CODEC_LZMA:
+        return lzma.compress(data, preset=level)
+    if codec == CODEC_ZSTD and ZSTD_SUPPORTED:
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    raise ValueError('Unsupported codec: {}'.format(codec))
+
+def decompress(data, codec, max_length=None):
+    """
+    function to decompress data compressed with the given codec
+    the output is limited to max_length bytes, by default DECOMPRESS_RATIO
+    times the size of the data, larger or truncated data raises ValueError
+    """
+    if codec == CODEC_NONE or not data:
+        return data
+    if max_length is None:
+        max_length = max(len(data) * DECOMPRESS_RATIO, DECOMPRESS_MINIMUM)
+    if codec == CODEC_ZLIB:
+        decompressor = zlib.decompressobj()
+    elif codec == CODEC_LZMA:
+        decompressor = lzma.LZMADecompressor()
+    elif codec == CODEC_ZSTD and ZSTD_SUPPORTED:
+        try:
+            # the size in the frame header is allocated at once, so it is checked first
+            if zstandard.frame_content_size(data) > max_length:
+                raise ValueError('Decompressed data is larger than {} bytes.'.format(max_length))
+            return zstandard.ZstdDecompressor().decompress(data, max_output_size=max_length)
+        except zstandard.ZstdError as error:
+            raise ValueError(str(error)) from None
+    else:
+        raise ValueError('Unsupported codec: {}'.format(codec))
+    # one byte more than allowed tells a payload at the limit from a larger one
+    result = decompressor.decompress(data, max_length + 1)
+    if len(result) > max_length:
+        raise ValueError('Decompressed data is larger than {} bytes.'.format(max_length))
+    if not decompressor.eof:
+        raise ValueError('Compressed data is truncated.')
+    return result
+
+def generate_handshake_key():
+    """
+    function to create a new X25519 key pair for one session
+    returns the private key and the raw public key to send to the other side
+    """
+    private_key = X25519PrivateKey.generate()
+    public_key = private_key.public_key().public_bytes(serialization.Encoding.Raw,
+                                                       serialization.PublicFormat.Raw)
+    return private_key, public_key
+
+def derive_session_key(private_key, peer_public_key, psk=b''):
+    """
+    function to derive the session key from the X25519 shared secret
+    both sides must use the same pre-shared key to get the same session key
+    the key is returned in the url-safe base64 form Fernet expects
+    """
+    shared = private_key.exchange(X25519PublicKey.from_public_bytes(bytes(peer_public_key)))
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=psk or None, info=SESSION_INFO)
+    return base64.urlsafe_b64encode(hkdf.derive(shared))
+
+def recv_exactly(sock, size):
+    """
+    function to receive exactly size bytes from the socket
+    keeps calling recv_into until the whole payload has arrived
+    the bytearray is returned as it is to avoid another copy
+    """
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError('Connection closed after {} of {} bytes.'.format(received, size))
+        received += count
+    return data
+
+def recv_header(sock, max_length=MAX_FRAME_SIZE):
+    """
+    function to receive the header of the next frame
+    returns None when the connection is closed between two frames
+    raises ValueError if the payload is longer than max_length bytes
+    """
+    header = bytearray(HEADER.size)
+    count = sock.recv_into(header)
+    if count == 0:
+        return None
+    if count < HEADER.size:
+        header[count:] = recv_exactly(sock, HEADER.size - count)
+    return unpack_header(header, max_length)
+
+def recv_frame(sock, max_length=MAX_FRAME_SIZE):
+    """
+    function to receive one complete frame
+    returns the flags, the content type and the payload,
+    or None when the connection is closed between two frames
+    """
+    header = recv_header(sock, max_length)
+    if header is None:
+        return None
+    flags, content_type, length = header
+    return flags, content_type, recv_exactly(sock, length)
+
+def send_frame(sock, payload, flags=FLAG_NONE, content_type=CONTENT_UNKNOWN):
+    """
+    function to send one complete frame
+    header and payload go out in a single sendall call
+    """
+    sock.sendall(pack_header(len(payload), flags, content_type) + payload)
+
+def recv_into_file(sock, length, myfile, buffer):
+    """
+    function to receive a payload of the given length into a file
+    the payload goes through the preallocated buffer chunk by chunk
+    and is never held in memory as a whole
+    """
+    view = memoryview(buffer)
+    remaining = length
+    while remaining > 0:
+        count = sock.recv_into(view[:min(remaining, len(view))])
+        if count == 0:
+            raise ConnectionError('Connection closed with {} bytes missing.'.format(remaining))
+        myfile.write(view[:count])
+        remaining -= count
+    return length
+
+def splice_into_file(sock, length, myfile):
+    """
+    function to receive a payload of the given length into a file
+    with os.splice, the bytes go from the socket to a pipe and from
+    the pipe to the file without being copied into Python
+    """
+    # anything already buffered by the file object goes first
+    myfile.flush()
+    read_fd, write_fd = os.pipe()
+    try:
+        remaining = length
+        while remaining > 0:
+            count = os.splice(sock.fileno(), write_fd, min(remaining, CHUNK_SIZE))
+            if count == 0:
+                raise ConnectionError('Connection closed with {} bytes missing.'.format(remaining))
+            remaining -= count
+            while count > 0:
+                count -= os.splice(read_fd, myfile.fileno(), count)
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+    return length
+
+def socket_address(sock, host, port):
+    """
+    function to get the address to bind or connect a socket to
+    the address of a Unix domain socket is its path, given as the host
+    """
+    if UNIX_SUPPORTED and sock.family == socket.AF_UNIX:
+        return host
+    return (host, port)
+
+def tune_socket(sock, nodelay=False, sndbuf=0, rcvbuf=0, keepalive=False, reuseaddr=False,
+                reuseport=False, **keepalive_timers):
+    """
+    function to set the options of a socket, unset options keep the
+    default of the operating system
+    nodelay sends small messages at once instead of waiting to fill a segment,
+    sndbuf and rcvbuf set the kernel buffer sizes in bytes, keepalive probes
+    idle connections (keepalive_idle, keepalive_interval, keepalive_count),
+    reuseaddr and reuseport allow binding a port in use
+    buffers and reuse options must be set before the socket connects or listens,
+    connections accepted on a listening socket inherit its options
+    the TCP options nodelay and keepalive do not apply to Unix domain sockets
+    """
+    tcp = sock.family in (socket.AF_INET, socket.AF_INET6)
+    if reuseaddr:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuseport:
+        if not REUSEPORT_SUPPORTED:
+            raise OSError('SO_REUSEPORT is not supported on this platform.')
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    if sndbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    if nodelay and tcp:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if keepalive and tcp:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for name, value in keepalive_timers.items():
+            if value and KEEPALIVE_OPTIONS[name] is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, KEEPALIVE_OPTIONS[name], value)
+    return sock
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Ring
+Code version: 1.0
+
+Description:
+Python3 file for the shared memory transport of simple server and client
+on the same host.
+The server creates a ring buffer in shared memory and a doorbell, a named
+pipe next to it. The client writes its frames, the same header and payload
+as on a socket, straight into the ring and rings the doorbell, the server
+wakes up and decodes the payload where it lies in the ring through a
+memoryview, so a message is copied once, by the client, instead of going
+through the kernel twice.
+The ring has one producer and one consumer: a client holds a lock on the
+doorbell while it is attached, so the clients take turns, and the server
+holds a lock on the ring, so a second server does not take it over.
+Every frame must fit into the ring as a whole. Files, record streams and
+encrypted sessions need the socket transports.
+"""
+
+import os
+import time
+import struct
+import select
+import fcntl
+from multiprocessing import shared_memory, resource_tracker
+import protocol
+
+RING_SUPPORTED = hasattr(os, 'mkfifo')
+
+# control block in front of the data: a magic number, the capacity of the
+# ring, the total bytes written and read, and whether the client has finished
+# or the server has stopped, the counters are on their own cache lines
+# as the client only writes the one and the server only the other
+COUNTER = struct.Struct('Q')
+MAGIC = b'SSCRING1'
+CAPACITY = 8
+HEAD = 64
+TAIL = 128
+CLOSED = 192
+STOPPED = 200
+CONTROL_SIZE = 256
+# frames start on 8 byte boundaries
+FRAME_ALIGN = 8
+# content type of the marker which sends the reader back to the start of the ring
+CONTENT_WRAP = 0xFF
+# seconds the client sleeps while the ring is full
+SPACE_WAIT = 0.0001
+# names of the rings created by this process
+owned = set()
+
+
+def frame_size(length):
+    """
+    function to get the space a frame of the given payload length takes in the ring
+    """
+    return (protocol.HEADER.size + length + FRAME_ALIGN - 1) & ~(FRAME_ALIGN - 1)
+
+
+def remove_stale_ring(name):
+    """
+    function to remove a ring left behind by a server which did not stop
+    raises FileExistsError if the server of the ring is still running
+    """
+    stale = shared_memory.SharedMemory(name)
+    try:
+        fcntl.flock(stale._fd, fcntl.LOCK_EX | fcntl.LOCK_NB) # pylint: disable=W0212
+    except BlockingIOError:
+        # the ring stays, the resource tracker must not remove it either
+        if name not in owned:
+            resource_tracker.unregister(stale._name, 'shared_memory') # pylint: disable=W0212
+        stale.close()
+        raise FileExistsError('{} is the ring of a running server.'.format(name)) from None
+    stale.unlink()
+    stale.close()
+
+
+class RingReader:
+    """
+    the server side of the ring, it creates the shared memory and the doorbell
+    and gives the frames in the order they were written
+    """
+
+    def __init__(self, name, doorbell, size):
+        self.doorbell_path = doorbell
+        if not os.path.exists(doorbell):
+            os.mkfifo(doorbell)
+        size = frame_size(size)
+        try:
+            self.memory = shared_memory.SharedMemory(name, create=True, size=CONTROL_SIZE + size)
+        except FileExistsError:
+            remove_stale_ring(name)
+            self.memory = shared_memory.SharedMemory(name, create=True, size=CONTROL_SIZE + size)
+        # held until the process ends, it tells other servers the ring is in use
+        fcntl.flock(self.memory._fd, fcntl.LOCK_EX | fcntl.LOCK_NB) # pylint: disable=W0212
+        owned.add(name)
+        self.name = name
+        self.control = self.memory.buf[:CONTROL_SIZE]
+        self.data = self.memory.buf[CONTROL_SIZE:CONTROL_SIZE + size]
+        self.capacity = size
+        self.tail = 0
+        self.control[:len(MAGIC)] = MAGIC
+        for offset, value in ((CAPACITY, size), (HEAD, 0), (TAIL, 0), (CLOSED, 0), (STOPPED, 0)):
+            COUNTER.pack_into(self.control, offset, value)
+        self.doorbell = os.open(doorbell, os.O_RDONLY | os.O_NONBLOCK)
+        # holding the write end keeps the pipe open between clients
+        self.keep_open = os.open(doorbell, os.O_WRONLY | os.O_NONBLOCK)
+
+    def wait(self):
+        """
+        function to sleep until the client rings the doorbell
+        """
+        select.select([self.doorbell], [], [])
+        try:
+            while os.read(self.doorbell, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def frames(self, forever=False):
+        """
+        function to give flags, content type and payload of every frame
+        the payload is a memoryview of the ring, it is only valid until
+        the next frame is asked for, then its space is given back to the client
+        stops when the client has finished, or never when forever is True
+        """
+        while True:
+            head = COUNTER.unpack_from(self.control, HEAD)[0]
+            if head == self.tail:
+                if COUNTER.unpack_from(self.control, CLOSED)[0]:
+                    if not forever:
+                        return
+                    # the next client starts where the last one finished
+                    COUNTER.pack_into(self.control, CLOSED, 0)
+                    continue
+                self.wait()
+                continue
+            index = self.tail % self.capacity
+            if self.capacity - index < protocol.HEADER.size:
+                self.advance(self.capacity - index)
+                continue
+            flags, content_type, length = protocol.unpack_header(
+                self.data[index:index + protocol.HEADER.size], self.capacity)
+            if content_type == CONTENT_WRAP:
+                self.advance(self.capacity - index)
+                continue
+            start = index + protocol.HEADER.size
+            payload = self.data[start:start + length]
+            try:
+                yield flags, content_type, payload
+            finally:
+                payload.release()
+                self.advance(frame_size(length))
+
+    def advance(self, size):
+        """
+        function to give the space of a read frame back to the client
+        """
+        self.tail += size
+        COUNTER.pack_into(self.control, TAIL, self.tail)
+
+    def close(self):
+        """
+        function to remove the shared memory and the doorbell
+        """
+        COUNTER.pack_into(self.control, STOPPED, 1)
+        os.close(self.doorbell)
+        os.close(self.keep_open)
+        self.control.release()
+        self.data.release()
+        try:
+            self.memory.close()
+        except BufferError:
+            # a payload is still referenced, the memory goes with the process
+            pass
+        self.memory.unlink()
+        owned.discard(self.name)
+        if os.path.exists(self.doorbell_path):
+            os.remove(self.doorbell_path)
+
+
+class RingWriter:
+    """
+    the client side of the ring, it attaches to the shared memory
+    of the server and writes frames into it
+    it waits while another client is attached
+    """
+
+    def __init__(self, name, doorbell):
+        try:
+            self.memory = shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            # before Python 3.13 the memory is tracked, and removed when the client exits,
+            # unless the server runs in the same process
+            self.memory = shared_memory.SharedMemory(name)
+            if name not in owned:
+                resource_tracker.unregister(self.memory._name, 'shared_memory') # pylint: disable=W0212
+        self.control = self.memory.buf[:CONTROL_SIZE]
+        if bytes(self.control[:len(MAGIC)]) != MAGIC or self.stopped():
+            self.control.release()
+            self.memory.close()
+            raise ConnectionError('{} is not the ring of a running server.'.format(name))
+        self.capacity = COUNTER.unpack_from(self.control, CAPACITY)[0]
+        self.data = self.memory.buf[CONTROL_SIZE:CONTROL_SIZE + self.capacity]
+        self.doorbell = os.open(doorbell, os.O_WRONLY | os.O_NONBLOCK)
+        # one client writes at a time, the others wait here for their turn,
+        # the lock goes when the client closes the doorbell
+        fcntl.flock(self.doorbell, fcntl.LOCK_EX)
+        self.head = COUNTER.unpack_from(self.control, HEAD)[0]
+
+    def stopped(self):
+        """
+        function to check if the server has stopped
+        """
+        return COUNTER.unpack_from(self.control, STOPPED)[0] == 1
+
+    def reserve(self, size):
+        """
+        function to wait until the server has read enough frames
+        to free the given number of bytes
+        """
+        while self.capacity - (self.head - COUNTER.unpack_from(self.control, TAIL)[0]) < size:
+            if self.stopped():
+                raise ConnectionError('The server has stopped.')
+            time.sleep(SPACE_WAIT)
+
+    def send_frame(self, payload, flags=protocol.FLAG_NONE, content_type=protocol.CONTENT_UNKNOWN):
+        """
+        function to write one complete frame into the ring and ring the doorbell
+        raises ValueError if the frame is larger than the ring
+        """
+        length = len(payload)
+        size = frame_size(length)
+        if size > self.capacity:
+            raise ValueError('A frame of {} bytes does not fit into the ring.'.format(length))
+        index = self.head % self.capacity
+        if index + size > self.capacity:
+            # the frame is not split, it goes to the start of the ring
+            padding = self.capacity - index
+            self.reserve(padding + size)
+            if padding >= protocol.HEADER.size:
+                protocol.HEADER.pack_into(self.data, index, protocol.PROTOCOL_VERSION,
+                                          protocol.FLAG_NONE, CONTENT_WRAP, 0)
+            self.head += padding
+            index = 0
+        else:
+            self.reserve(size)
+        protocol.HEADER.pack_into(self.data, index, protocol.PROTOCOL_VERSION,
+                                  flags, content_type, length)
+        start = index + protocol.HEADER.size
+        self.data[start:start + length] = payload
+        self.head += size
+        COUNTER.pack_into(self.control, HEAD, self.head)
+        self.ring()
+
+    def ring(self):
+        """
+        function to wake the server up
+        a full doorbell means the server is woken up anyway
+        """
+        try:
+            os.write(self.doorbell, b'\0')
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        """
+        function to tell the server that the client has finished
+        and to detach from the shared memory
+        """
+        COUNTER.pack_into(self.control, CLOSED, 1)
+        self.ring()
+        os.close(self.doorbell)
+        self.control.release()
+        self.data.release()
+        self.memory.close()
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Settings
+Code version: 1.0
+
+Description:
+Python3 file for the settings shared by simple server and client.
+The settings are read from configfile.ini once per process and kept
+in an immutable Settings tuple, so loops and connections read them
+without going to the disk again.
+Every option can be overridden by an environment variable named
+SIMPLE_<SECTION>_<OPTION>, e.g. SIMPLE_SERVER_WORKERS=8, and by a command
+line flag named like the option, e.g. --workers 8 or --batch-size 4096.
+The values are converted to their types and checked when they are read,
+so a wrong setting is reported once, before it is used.
+A long running server may call reload_settings to pick up changes of
+configfile.ini, the file is only read again when its modification time
+or size has changed.
+"""
+
+import sys
+import os
+import socket
+import argparse
+import configparser
+from typing import NamedTuple, Optional
+
+
+def parse_bool(value):
+    """
+    function to read a true or false setting
+    """
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() in ['true', 'yes', 'on', '1']:
+        return True
+    if str(value).strip().lower() in ['false', 'no', 'off', '0']:
+        return False
+    raise ValueError('{} is neither True nor False'.format(value))
+
+def parse_optional_int(value):
+    """
+    function to read a number setting which may be left empty
+    """
+    if value is None or str(value).strip() == '':
+        return None
+    return int(value)
+
+
+class Settings(NamedTuple):
+    """
+    immutable settings of simple server and client
+    """
+    host: str = '127.0.0.1'
+    port: int = 9090
+    buffer_size: int = 4096
+    psk: str = ''
+    transport: str = 'tcp'
+    path: str = 'simple_server.sock'
+    ring: str = 'simple_server_ring'
+    doorbell: str = 'simple_server.doorbell'
+    nodelay: bool = False
+    sndbuf: int = 0
+    rcvbuf: int = 0
+    keepalive: bool = False
+    keepalive_idle: int = 0
+    keepalive_interval: int = 0
+    keepalive_count: int = 0
+    user_input: str = ''
+    encryption: bool = False
+    cipher: str = 'fernet'
+    compression: str = 'none'
+    level: Optional[int] = None
+    threshold: int = 1024
+    budget: float = 10.0
+    data_format: str = 'binary'
+    enable_print: bool = True
+    enable_save: bool = True
+    file: str = 'received.txt'
+    mode: str = 'single'
+    pool: str = 'none'
+    workers: int = os.cpu_count() or 1
+    queue: Optional[int] = None
+    sniff: bool = False
+    writer: str = 'file'
+    batch_size: int = 65536
+    batch_time: float = 1.0
+    fsync: str = 'none'
+    directory: str = 'received'
+    rotate_size: int = 64 * 1024 * 1024
+    rotate_time: float = 3600.0
+    rotate_compress: bool = False
+    reload: float = 0.0
+    backlog: int = 128
+    reuseaddr: bool = True
+    reuseport: bool = False
+    processes: int = 1
+    sharding: str = 'reuseport'
+    grace: float = 10.0
+    stats_interval: float = 10.0
+    ring_size: int = 64 * 1024 * 1024
+    max_frame: int = 64 * 1024 * 1024
+
+
+# setting -> section and option in configfile.ini and the type of the value
+OPTIONS = {
+    'host': ('setting', 'host', str),
+    'port': ('setting', 'port', int),
+    'buffer_size': ('setting', 'buffer', int),
+    'psk': ('setting', 'psk', str),
+    'transport': ('setting', 'transport', str),
+    'path': ('setting', 'path', str),
+    'ring': ('setting', 'ring', str),
+    'doorbell': ('setting', 'doorbell', str),
+    'nodelay': ('setting', 'nodelay', parse_bool),
+    'sndbuf': ('setting', 'sndbuf', int),
+    'rcvbuf': ('setting', 'rcvbuf', int),
+    'keepalive': ('setting', 'keepalive', parse_bool),
+    'keepalive_idle': ('setting', 'keepalive_idle', int),
+    'keepalive_interval': ('setting', 'keepalive_interval', int),
+    'keepalive_count': ('setting', 'keepalive_count', int),
+    'user_input': ('client', 'userinput', str),
+    'encryption': ('client', 'encryption', parse_bool),
+    'cipher': ('client', 'cipher', str),
+    'compression': ('client', 'compression', str),
+    'level': ('client', 'level', parse_optional_int),
+    'threshold': ('client', 'threshold', int),
+    'budget': ('client', 'budget', float),
+    'data_format': ('client', 'format', str),
+    'enable_print': ('server', 'print', parse_bool),
+    'enable_save': ('server', 'save', parse_bool),
+    'file': ('server', 'file', str),
+    'mode': ('server', 'mode', str),
+    'pool': ('server', 'pool', str),
+    'workers': ('server', 'workers', int),
+    'queue': ('server', 'queue', parse_optional_int),
+    'sniff': ('server', 'sniff', parse_bool),
+    'writer': ('server', 'writer', str),
+    'batch_size': ('server', 'batch_size', int),
+    'batch_time': ('server', 'batch_time', float),
+    'fsync': ('server', 'fsync', str),
+    'directory': ('server', 'directory', str),
+    'rotate_size': ('server', 'rotate_size', int),
+    'rotate_time': ('server', 'rotate_time', float),
+    'rotate_compress': ('server', 'rotate_compress', parse_bool),
+    'reload': ('server', 'reload', float),
+    'backlog': ('server', 'backlog', int),
+    'reuseaddr': ('server', 'reuseaddr', parse_bool),
+    'reuseport': ('server', 'reuseport', parse_bool),
+    'processes': ('server', 'processes', int),
+    'sharding': ('server', 'sharding', str),
+    'grace': ('server', 'grace', float),
+    'stats_interval': ('server', 'stats_interval', float),
+    'ring_size': ('server', 'ring_size', int),
+    'max_frame': ('server', 'max_frame', int),
+}
+
+# settings which only take one of a few values
+CHOICES = {
+    'mode': ['single', 'multi'],
+    'pool': ['process', 'thread', 'none'],
+    'writer': ['file', 'batch', 'rotate'],
+    'fsync': ['none', 'batch', 'message'],
+    'sharding': ['reuseport', 'inherit'],
+    'transport': ['tcp', 'unix', 'shm'],
+}
+
+# settings which must be greater than zero, or zero or more
+POSITIVE = ['buffer_size', 'workers', 'backlog', 'processes', 'ring_size', 'batch_time',
+            'max_frame']
+NOT_NEGATIVE = ['threshold', 'budget', 'batch_size', 'rotate_size', 'rotate_time',
+                'reload', 'sndbuf', 'rcvbuf', 'keepalive_idle', 'keepalive_interval',
+                'keepalive_count', 'grace', 'stats_interval']
+
+CONFIG_FILE = 'configfile.ini'
+ENVIRONMENT_PREFIX = 'SIMPLE_'
+
+# file read by get_settings, command line overrides and the settings read last
+state = {'file': CONFIG_FILE, 'overrides': {}, 'stamp': None, 'settings': None}
+
+
+def validate(settings):
+    """
+    function to check that the settings are in their ranges
+    raises ValueError naming the first wrong setting
+    """
+    if not 0 <= settings.port <= 65535:
+        raise ValueError('port must be between 0 and 65535, not {}'.format(settings.port))
+    for name, choices in CHOICES.items():
+        if getattr(settings, name) not in choices:
+            raise ValueError('{} must be one of {}, not {}'.format(
+                OPTIONS[name][1], ', '.join(choices), getattr(settings, name)))
+    if settings.transport == 'unix' and not hasattr(socket, 'AF_UNIX'):
+        raise ValueError('transport unix is not supported on this platform')
+    if settings.transport == 'shm' and not hasattr(os, 'mkfifo'):
+        raise ValueError('transport shm is not supported on this platform')
+    for name in POSITIVE:
+        if getattr(settings, name) <= 0:
+            raise ValueError('{} must be greater than 0'.format(OPTIONS[name][1]))
+    for name in NOT_NEGATIVE:
+        if getattr(settings, name) < 0:
+            raise ValueError('{} must not be negative'.format(OPTIONS[name][1]))
+    return settings
+
+def load_settings(filename=CONFIG_FILE, environ=None, overrides=None):
+    """
+    function to read the settings from the ini file, the environment
+    variables and the overrides, the later ones win
+    settings found nowhere keep their defaults
+    raises ValueError if a setting has a wrong type or value
+    """
+    if environ is None:
+        environ = os.environ
+    config_obj = configparser.ConfigParser()
+    config_obj.read(filename, encoding='utf-8')
+    values = {}
+    for name, (section, option, kind) in OPTIONS.items():
+        value = config_obj.get(section, option, fallback=None)
+        value = environ.get('{}{}_{}'.format(ENVIRONMENT_PREFIX, section, option).upper(), value)
+        value = (overrides or {}).get(name, value)
+        if value is None:
+            continue
+        try:
+            values[name] = kind(value)
+        except ValueError:
+            raise ValueError('{} can not be {}'.format(option, value)) from None
+    return validate(Settings(**values))
+
+def socket_options(settings, listening=False):
+    """
+    function to get the socket options of the settings
+    as keyword arguments of protocol.tune_socket
+    address reuse is only set on listening sockets
+    """
+    options = {'nodelay': settings.nodelay, 'sndbuf': settings.sndbuf,
+               'rcvbuf': settings.rcvbuf, 'keepalive': settings.keepalive,
+               'keepalive_idle': settings.keepalive_idle,
+               'keepalive_interval': settings.keepalive_interval,
+               'keepalive_count': settings.keepalive_count}
+    if listening:
+        options.update(reuseaddr=settings.reuseaddr, reuseport=settings.reuseport)
+    return options
+
+def file_stamp(filename):
+    """
+    function to get the modification time and size of a file
+    None if the file does not exist
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def reload_settings():
+    """
+    function to read the settings again if configfile.ini has changed
+    since they were read, returns True if they were read again
+    on a wrong setting the error is printed and the last settings are kept
+    """
+    filename = os.path.abspath(state['file'])
+    stamp = (filename, file_stamp(filename))
+    if state['settings'] is not None and stamp == state['stamp']:
+        return False
+    try:
+        settings = load_settings(filename, overrides=state['overrides'])
+    except ValueError as error:
+        print('Error: Wrong setting, {}.'.format(error))
+        if state['settings'] is None:
+            raise
+        return False
+    state['settings'] = settings
+    state['stamp'] = stamp
+    return True
+
+def get_settings():
+    """
+    function to get the settings, configfile.ini is only read the first time
+    """
+    if state['settings'] is None:
+        reload_settings()
+    return state['settings']
+
+def configure(argv=None):
+    """
+    function to take the settings given on the command line
+    --config selects another ini file, every other flag is named like
+    the option it overrides, with dashes instead of underscores
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', default=CONFIG_FILE)
+    for name, (_, option, _) in OPTIONS.items():
+        parser.add_argument('--' + option.replace('_', '-'), dest=name)
+    arguments = vars(parser.parse_args(argv))
+    state['file'] = arguments.pop('config')
+    state['overrides'] = {name: value for name, value in arguments.items() if value is not None}
+    state['settings'] = None
+    try:
+        return get_settings()
+    except ValueError:
+        # the wrong setting is already reported
+        sys.exit()
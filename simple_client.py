@@ -11,7 +11,18 @@ Python3 file for Client sending data to Server.
 User can create, fill, serialize, and deliver a dictionary to a server
 or send a text file to a server after creating it.
 The pickling format of the dictionary can be binary, JSON, or XML.
+Large dictionaries can be streamed as JSON Lines, one item per line.
+Binary pickles are sent as raw bytes with pickle protocol 5.
+The Client class keeps one connection open to send many messages
+back to back without waiting for the server between them, and the
+ConnectionPool class shares such connections between many threads.
 The text can be encrypted within a text file.
+Text files larger than the buffer and binary files such as images are
+sent to the server with sendfile, so the kernel copies them to the
+socket without decoding or encoding them. When encrypted they are
+streamed and encrypted chunk by chunk.
+On the same host dictionaries and text files can be handed over to
+the server in its shared memory ring instead of a socket.
 
 Modification(s):
 1. Fix bugs.
@@ -20,12 +31,20 @@ Modification(s):
 import sys
 import os
 import socket
-import configparser
+import select
 import json
 import pickle
 import ast
+import time
+import threading
+import collections
+import itertools
+import contextlib
 from dict2xml import dict2xml
 from cryptography.fernet import Fernet
+import protocol
+import settings
+import ring
 
 
 def dict_serialisation(dictionary, serialise, dataformat):
@@ -37,9 +56,10 @@ def dict_serialisation(dictionary, serialise, dataformat):
     if serialise:
         if dataformat == 'binary':
             try:
-                # serialise data using pickle
-                data = pickle.dumps(dictionary)
-                data2send = str(data)
+                # serialise data using pickle, large buffers are kept out-of-band
+                buffers = []
+                data = pickle.dumps(dictionary, protocol=5, buffer_callback=buffers.append)
+                data2send = protocol.pack_parts([data] + [buffer.raw() for buffer in buffers])
                 print('The dictionary has been serialized in binary')
             except Exception:
                 print('Error: An error occurred while serialization in binary')
@@ -64,29 +84,39 @@ def dict_serialisation(dictionary, serialise, dataformat):
                 sys.exit()
     else:
         data2send = dictionary
+    if isinstance(data2send, bytes):
+        return data2send
     return str(data2send)
 
-def data_encryption(data, encryption):
+def data_encryption(data, encryption, cipher=protocol.CIPHER_FERNET):
     """
     function to perform encryption
     check if the data needs to be encrypted
     if yes, perform encryption
+    the AEAD ciphers send the raw key followed by the raw ciphertext
+    compressed data is given as bytes and encrypted as it is
     """
     try:
+        plain = data if isinstance(data, bytes) else str(data).encode()
+        if encryption and cipher != protocol.CIPHER_FERNET:
+            key = protocol.generate_cipher_key(cipher)
+            message = protocol.make_cipher(cipher, key).encrypt(plain)
+            print('Data is encrypted.')
+            return key + message
         if encryption:
             # encryption label
             encrypted = "<ISENCRYPTED>"
             # perform encryption
             key = Fernet.generate_key()
             fernet = Fernet(key)
-            message = fernet.encrypt(str(data).encode())
+            message = fernet.encrypt(plain)
             # combine the key, encryption label and encrypted message as format of data packet
             data2send = str(key.decode())+encrypted+str(message.decode())
             print('Data is encrypted.')
         else:
             data2send = data
             print('No encryption required')
-        return str(data2send)
+        return data2send if isinstance(data2send, bytes) else str(data2send)
     except Exception:
         print('Error: An error occurred during the encryption.')
         sys.exit()
@@ -96,10 +126,8 @@ def read_file(filename, buffer_size):
     function to read data from text file
     """
     try:
-        # get folder path
-        dir_path = os.path.dirname(os.path.realpath(filename))
         # get file path
-        filepath = dir_path+"\\"+filename
+        filepath = os.path.realpath(filename)
         # check if file exists
         # get the file size
         filesize = os.path.getsize(filepath)
@@ -122,43 +150,75 @@ def read_file(filename, buffer_size):
         print('Error: Txt file can not be found.')
         sys.exit()
 
+def is_large_file(filename, buffer_size):
+    """
+    function to check if a file is too large to be read in one go
+    such a file is streamed to the server in chunks instead
+    """
+    try:
+        filesize = os.path.getsize(filename)
+    except OSError:
+        # read_file reports the missing file
+        return False
+    return filesize >= buffer_size or filesize > 8192
+
 def reading_config():
     """
     function to read configfile.ini file
+    the file is only parsed again when it has changed
     """
-    config_obj = configparser.ConfigParser()
     try:
-        filename = 'configfile.ini'
-        dir_path = os.path.dirname(os.path.realpath(filename))
-        # get file path
-        filepath = dir_path+"\\"+filename
         # check if file exists
         # get the file size
-        filesize = os.path.getsize(filepath)
+        filesize = os.path.getsize(settings.state['file'])
         # continue if file exists
         if filesize > 0:
-            config_obj.read(filepath)
-            param = config_obj["setting"]
-            server_host = param["host"]
-            server_port = int(param["port"])
-            buffer_size = int(param["buffer"])
-            input_ = config_obj["client"]
-            user_input = input_["userinput"]
-            encrypt = ast.literal_eval(input_["encryption"])
-            data_format = input_["format"]
+            settings.reload_settings()
+            current = settings.get_settings()
             print('The config file exists and all the parameters have been assigned.')
-            return server_host, server_port, buffer_size, user_input, encrypt, data_format
+            return (current.host, current.port, current.buffer_size, current.user_input,
+                    current.encryption, current.data_format)
+    except ValueError:
+        # the wrong setting is already reported
+        sys.exit()
     except Exception:
         # prevent input file which does not exist
         print('Error: The config file does not exist')
         sys.exit()
 
-def create_socket():
+def cipher_option(name):
+    """
+    function to get the cipher flag for the cipher name in the config file
+    """
+    if name not in protocol.CIPHERS:
+        print('Error: Please select one of the ciphers: fernet, aesgcm or chacha20.')
+        sys.exit()
+    return protocol.CIPHERS[name]
+
+def codec_option(name):
+    """
+    function to get the codec flag for the compression name in the config file
+    """
+    if name == 'auto':
+        return protocol.CODEC_AUTO
+    if name not in protocol.CODECS:
+        print('Error: Please select one of the codecs: none, auto, zlib, lzma or zstd.')
+        sys.exit()
+    if protocol.CODECS[name] == protocol.CODEC_ZSTD and not protocol.ZSTD_SUPPORTED:
+        print('Error: zstd compression needs the zstandard package.')
+        sys.exit()
+    return protocol.CODECS[name]
+
+def create_socket(options=None, family=socket.AF_INET):
     """
     function to create a client socket
+    options are the socket options of protocol.tune_socket,
+    family socket.AF_UNIX creates a Unix domain socket
     """
     try:
-        socket_s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        socket_s = socket.socket(family, socket.SOCK_STREAM)
+        if options:
+            protocol.tune_socket(socket_s, **options)
         print('A client socket is created.')
         return socket_s
     except Exception:
@@ -168,27 +228,82 @@ def create_socket():
 def connect_server(socket_s, server_host, server_port):
     """
     function to connect to the server
+    the host of a Unix domain socket is the path of the server socket
     """
     try:
-        socket_s.connect((server_host, server_port))
+        socket_s.connect(protocol.socket_address(socket_s, server_host, server_port))
         print('Connected to server.')
     except Exception:
         print('Error: Fail to connect to the server.')
         sys.exit()
 
-def text_file_process(user_input, encryption, buffer_size):
+def text_file_process(user_input, encryption, buffer_size, cipher=protocol.CIPHER_FERNET,
+                      codec=protocol.CODEC_NONE, level=None):
     """
     function to read content of text file
+    compress the data with the given codec
     check if the data needs to be encrypted
     if yes, perform encryption
     """
     data = read_file(user_input, buffer_size)
     if data is not None:
-        data2send = data_encryption(data, encryption)
+        if codec != protocol.CODEC_NONE:
+            data = protocol.compress(data.encode(), codec, level)
+            print('Data is compressed.')
+        data2send = data_encryption(data, encryption, cipher)
         return data2send
     else:
         return None
 
+def choose_codec(sample, budget=protocol.CPU_BUDGET):
+    """
+    function to pick the codec for a payload from a sample of its first block
+    data the fast codec can not shrink, like JPEG images, is not compressed,
+    the high ratio codec is used when it compresses at least budget MB/s
+    and clearly better than the fast codec
+    returns the codec and its level
+    """
+    if protocol.ZSTD_SUPPORTED:
+        fast, high = (protocol.CODEC_ZSTD, 1), (protocol.CODEC_ZSTD, 15)
+    else:
+        fast, high = (protocol.CODEC_ZLIB, 1), (protocol.CODEC_LZMA, 6)
+    fast_size = len(protocol.compress(sample, *fast))
+    if fast_size > len(sample) * (1 - protocol.MIN_SAVING):
+        return protocol.CODEC_NONE, None
+    start = time.perf_counter()
+    high_size = len(protocol.compress(sample, *high))
+    speed = len(sample) / max(time.perf_counter() - start, 1e-9) / 1e6
+    if speed >= budget and high_size < fast_size * (1 - protocol.MIN_SAVING):
+        return high
+    return fast
+
+def probe_file(filename, budget=protocol.CPU_BUDGET):
+    """
+    function to pick the codec for a file from its first block
+    """
+    with open(filename, 'rb') as myfile:
+        return choose_codec(myfile.read(protocol.PROBE_SIZE), budget)
+
+def compress_data(data, codec, level=None, threshold=0, budget=protocol.CPU_BUDGET):
+    """
+    function to compress data before it is encrypted
+    data smaller than the threshold, and data which compression
+    does not make smaller, is sent as it is
+    with the auto codec the codec is picked from the first block of the data
+    returns the data and the codec to declare in the header
+    """
+    payload = data if isinstance(data, bytes) else str(data).encode()
+    if codec == protocol.CODEC_NONE or len(payload) < threshold:
+        return data, protocol.CODEC_NONE
+    if codec == protocol.CODEC_AUTO:
+        codec, level = choose_codec(payload[:protocol.PROBE_SIZE], budget)
+        if codec == protocol.CODEC_NONE:
+            return data, codec
+    compressed = protocol.compress(payload, codec, level)
+    if len(compressed) >= len(payload):
+        return data, protocol.CODEC_NONE
+    return compressed, codec
+
 def dictionary_process(input_, picling_format):
     """
     function to serialise dictionary
@@ -200,12 +315,28 @@ def dictionary_process(input_, picling_format):
     data2send = dict_serialisation(input_, serialise, picling_format)
     return data2send
 
-def send_to_server(data2send, socket_s):
+def dictionary_content_type(picling_format):
+    """
+    function to get the content type declared for a dictionary
+    """
+    content_types = {'binary': protocol.CONTENT_PICKLE,
+                     'json': protocol.CONTENT_JSON,
+                     'xml': protocol.CONTENT_XML}
+    return content_types.get(picling_format, protocol.CONTENT_DICT)
+
+def send_to_server(data2send, socket_s, content_type=protocol.CONTENT_UNKNOWN,
+                   flags=protocol.FLAG_NONE):
     """
     function to send data to server
+    data is sent as one frame so the server can read all of it
+    the content type tells the server how to decode the data
     """
     try:
-        socket_s.send(str(data2send).encode())
+        if isinstance(data2send, bytes):
+            payload = data2send
+        else:
+            payload = str(data2send).encode()
+        protocol.send_frame(socket_s, payload, flags, content_type)
         print('Data is sent to server.')
     except Exception:
         print('Error: An error occurred while sending the data.')
@@ -214,28 +345,545 @@ def send_to_server(data2send, socket_s):
     socket_s.close()
     print('Task Completed. Connection is closed.')
 
+def send_to_ring(user_input, current, encrypt, cipher=protocol.CIPHER_FERNET,
+                 codec=protocol.CODEC_NONE, level=None):
+    """
+    function to send a dictionary or a text file to a server on the same host
+    through its shared memory ring, the data is written as one frame
+    """
+    if user_input[-4:]=='.txt' and not is_large_file(user_input, current.buffer_size):
+        data2send = text_file_process(user_input, encrypt, current.buffer_size, cipher,
+                                      codec, level)
+        content_type = protocol.CONTENT_TEXT
+        flags = protocol.FLAG_ENCRYPTED | cipher if encrypt else protocol.FLAG_NONE
+        flags |= codec
+    else:
+        try:
+            isdictionary = ast.literal_eval(user_input)
+        except Exception:
+            isdictionary = None
+        if not isinstance(isdictionary, dict) or current.data_format == 'jsonl':
+            print('Error: Only dictionaries and small text files are sent through the ring.')
+            sys.exit()
+        data2send, flags = compress_data(dictionary_process(isdictionary, current.data_format),
+                                         codec, level, current.threshold, current.budget)
+        content_type = dictionary_content_type(current.data_format)
+    if not isinstance(data2send, bytes):
+        data2send = str(data2send).encode()
+    try:
+        ring_s = ring.RingWriter(current.ring, current.doorbell)
+    except (OSError, ConnectionError):
+        print('Error: The ring of the server can not be found.')
+        sys.exit()
+    try:
+        ring_s.send_frame(data2send, flags, content_type)
+        print('Data is sent to server.')
+    except (ValueError, ConnectionError) as error:
+        print('Error: {}'.format(error))
+        sys.exit()
+    finally:
+        ring_s.close()
+    print('Task Completed. The ring is closed.')
+
+def encrypt_chunk(cipher, sequence, chunk, last=False):
+    """
+    function to encrypt one chunk of an encrypted stream
+    the sequence number and last chunk marker are encrypted with the chunk,
+    so chunks can not be reordered, dropped or cut off unnoticed
+    """
+    return cipher.encrypt(protocol.CHUNK_PREFIX.pack(sequence, last) + chunk)
+
+def send_chunks(chunks, socket_s, flags, content_type, encryption=False,
+                cipher=protocol.CIPHER_FERNET, codec=protocol.CODEC_NONE, level=None,
+                budget=protocol.CPU_BUDGET):
+    """
+    function to send a stream of chunks to the server, one frame per chunk
+    with compression and encryption each chunk is compressed and encrypted
+    on its own, so the server can restore it before the next chunk arrives
+    with the auto codec the codec is picked from the first chunk
+    a frame without the more flag ends the stream
+    """
+    if codec == protocol.CODEC_AUTO:
+        chunks = iter(chunks)
+        first = next(chunks, b'')
+        codec, level = choose_codec(first[:protocol.PROBE_SIZE], budget) if first \
+            else (protocol.CODEC_NONE, None)
+        chunks = itertools.chain([first] if first else [], chunks)
+    flags |= codec
+    if encryption:
+        flags |= protocol.FLAG_ENCRYPTED | cipher
+        # like data_encryption, the key goes first
+        key = protocol.generate_cipher_key(cipher)
+        encryptor = protocol.make_cipher(cipher, key)
+        protocol.send_frame(socket_s, key, flags | protocol.FLAG_MORE, content_type)
+    sequence = 0
+    for chunk in chunks:
+        chunk = protocol.compress(chunk, codec, level)
+        if encryption:
+            chunk = encrypt_chunk(encryptor, sequence, chunk)
+        protocol.send_frame(socket_s, chunk, flags | protocol.FLAG_MORE, content_type)
+        sequence += 1
+    last = encrypt_chunk(encryptor, sequence, b'', True) if encryption else b''
+    protocol.send_frame(socket_s, last, flags, content_type)
+
+def stream_file(filename, socket_s, chunk_size=protocol.CHUNK_SIZE,
+                content_type=protocol.CONTENT_TEXT, encryption=False,
+                cipher=protocol.CIPHER_FERNET, codec=protocol.CODEC_NONE, level=None,
+                records=False):
+    """
+    function to stream a file to the server
+    each chunk read from disk is sent as its own frame,
+    so memory use does not depend on the file size
+    with records the file is sent as a record stream, which the server
+    decodes record by record instead of saving the file as it is
+    """
+    flags = protocol.FLAG_NONE if records else protocol.FLAG_FILE
+    try:
+        with open(filename, 'rb') as myfile:
+            send_chunks(iter(lambda: myfile.read(chunk_size), b''), socket_s, flags,
+                        content_type, encryption, cipher, codec, level)
+        print('File is streamed to server.')
+    except Exception:
+        print('Error: An error occurred while streaming the file.')
+        sys.exit()
+    # close the socket
+    socket_s.close()
+    print('Task Completed. Connection is closed.')
+
+def record_chunks(records, chunk_size=protocol.CHUNK_SIZE):
+    """
+    generator of json lines chunks of about chunk_size bytes
+    records is an iterable of dictionaries, a dictionary
+    is sent as one record per item
+    """
+    if isinstance(records, dict):
+        records = ({key: value} for key, value in records.items())
+    buffer = bytearray()
+    for record in records:
+        buffer += json.dumps(record).encode()
+        buffer += b'\n'
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+def stream_records(records, socket_s, chunk_size=protocol.CHUNK_SIZE, encryption=False,
+                   cipher=protocol.CIPHER_FERNET, codec=protocol.CODEC_NONE, level=None,
+                   budget=protocol.CPU_BUDGET):
+    """
+    function to stream records to the server as json lines
+    the records are serialised while they are sent, so neither side
+    holds all of them and the server saves them as they arrive
+    """
+    try:
+        send_chunks(record_chunks(records, chunk_size), socket_s, protocol.FLAG_NONE,
+                    protocol.CONTENT_JSONL, encryption, cipher, codec, level, budget)
+        print('Records are streamed to server.')
+    except Exception:
+        print('Error: An error occurred while streaming the records.')
+        sys.exit()
+    # close the socket
+    socket_s.close()
+    print('Task Completed. Connection is closed.')
+
+def send_file(filename, socket_s, content_type=protocol.CONTENT_TEXT):
+    """
+    function to send a file to the server without reading it in Python
+    the header announces the file size and socket.sendfile lets
+    the kernel copy the file content to the socket
+    """
+    try:
+        with open(filename, 'rb') as myfile:
+            filesize = os.fstat(myfile.fileno()).st_size
+            # MSG_MORE keeps the header in the same segment as the file start
+            header = protocol.pack_header(filesize, protocol.FLAG_FILE, content_type)
+            socket_s.sendall(header, getattr(socket, 'MSG_MORE', 0))
+            sent = socket_s.sendfile(myfile, 0, filesize)
+            if sent != filesize:
+                raise OSError('The file changed while it was sent.')
+        print('File is sent to server.')
+    except Exception:
+        print('Error: An error occurred while sending the file.')
+        sys.exit()
+    # close the socket
+    socket_s.close()
+    print('Task Completed. Connection is closed.')
+
+def open_connection(server_host, server_port, options=None, family=socket.AF_INET):
+    """
+    function to open a connection to the server for the Client class
+    the socket is tuned before it connects, as the buffer sizes fix
+    the TCP window scale when the connection is set up
+    every address of the host is tried, errors are raised to the caller
+    """
+    if family == socket.AF_INET:
+        addresses = [(info[0], info[4]) for info in
+                     socket.getaddrinfo(server_host, server_port, type=socket.SOCK_STREAM)]
+    else:
+        addresses = [(family, server_host)]
+    error = None
+    for address_family, address in addresses:
+        socket_s = socket.socket(address_family, socket.SOCK_STREAM)
+        try:
+            if options:
+                protocol.tune_socket(socket_s, **options)
+            socket_s.connect(address)
+            return socket_s
+        except OSError as exception:
+            socket_s.close()
+            error = exception
+        except BaseException:
+            socket_s.close()
+            raise
+    raise error
+
+class Client:
+    """
+    client keeping one connection to the server open for many messages
+    messages are pipelined: they are written back to back without
+    waiting for the server, and small ones are collected in a buffer
+    so that many of them go out in one send call
+    messages larger than the threshold are compressed with the codec
+    with encryption a session key is negotiated once when connecting
+    and every message is encrypted with the same cipher
+    socket_options are the options of protocol.tune_socket, with
+    family socket.AF_UNIX server_host is the path of the server socket
+    errors are raised to the caller instead of exiting
+    """
+
+    def __init__(self, server_host, server_port, buffer_size=protocol.CHUNK_SIZE,
+                 encryption=False, psk=b'', cipher=protocol.CIPHER_FERNET,
+                 codec=protocol.CODEC_NONE, level=None, threshold=protocol.COMPRESS_THRESHOLD,
+                 budget=protocol.CPU_BUDGET, socket_options=None, family=socket.AF_INET):
+        self.socket_s = open_connection(server_host, server_port, socket_options, family)
+        self.buffer_size = buffer_size
+        self.pending = bytearray()
+        self.cipher = cipher
+        self.codec = codec
+        self.level = level
+        self.threshold = threshold
+        self.budget = budget
+        self.session = None
+        if encryption:
+            try:
+                self.handshake(psk)
+            except BaseException:
+                self.socket_s.close()
+                raise
+
+    def handshake(self, psk=b''):
+        """
+        function to negotiate the session key with the server
+        """
+        private_key, public_key = protocol.generate_handshake_key()
+        protocol.send_frame(self.socket_s, public_key, content_type=protocol.CONTENT_HANDSHAKE)
+        reply = protocol.recv_frame(self.socket_s)
+        if reply is None or reply[1] != protocol.CONTENT_HANDSHAKE:
+            raise ConnectionError('The server did not answer the session handshake.')
+        self.session = protocol.make_session_cipher(
+            self.cipher, protocol.derive_session_key(private_key, reply[2], psk))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def send(self, data2send, content_type=protocol.CONTENT_UNKNOWN, flags=protocol.FLAG_NONE):
+        """
+        function to queue one message for the server
+        """
+        if isinstance(data2send, bytes):
+            payload = data2send
+        else:
+            payload = str(data2send).encode()
+        payload, codec = compress_data(payload, self.codec, self.level, self.threshold, self.budget)
+        flags |= codec
+        if self.session is not None:
+            payload = self.session.encrypt(payload)
+            flags |= protocol.FLAG_ENCRYPTED | protocol.FLAG_SESSION | self.cipher
+        header = protocol.pack_header(len(payload), flags, content_type)
+        if len(payload) >= self.buffer_size:
+            # large payloads are not copied into the buffer
+            self.flush()
+            self.socket_s.sendall(header + payload)
+        else:
+            self.pending += header
+            self.pending += payload
+            if len(self.pending) >= self.buffer_size:
+                self.flush()
+
+    def send_dictionary(self, dictionary, picling_format):
+        """
+        function to serialise a dictionary and queue it for the server
+        """
+        data2send = dictionary_process(dictionary, picling_format)
+        self.send(data2send, dictionary_content_type(picling_format))
+
+    def flush(self):
+        """
+        function to send all queued messages
+        """
+        if self.pending:
+            self.socket_s.sendall(self.pending)
+            self.pending.clear()
+
+    def close(self):
+        """
+        function to send the queued messages and close the connection
+        """
+        try:
+            self.flush()
+        finally:
+            self.socket_s.close()
+
+class ConnectionPool:
+    """
+    thread-safe pool of Client connections for producers in many threads
+    up to size connections are opened on demand and reused,
+    idle connections are checked before reuse and closed after idle_timeout,
+    failed connection attempts are retried with exponential backoff
+    """
+
+    def __init__(self, server_host, server_port, size=4, idle_timeout=60.0,
+                 retries=3, backoff=0.1, buffer_size=protocol.CHUNK_SIZE, **client_options):
+        self.server_host = server_host
+        self.server_port = server_port
+        # encryption, psk, cipher and compression options of the connections
+        self.client_options = client_options
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.buffer_size = buffer_size
+        self.condition = threading.Condition()
+        # idle clients with the time they were released, oldest first
+        self.idle = collections.deque()
+        self.in_use = 0
+        self.closed = False
+        self.counters = {'created': 0, 'acquired': 0, 'discarded': 0,
+                         'waits': 0, 'wait_time': 0.0, 'max_wait': 0.0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def connect(self):
+        """
+        function to open a new connection, retrying with backoff
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                client = Client(self.server_host, self.server_port, self.buffer_size,
+                                **self.client_options)
+                with self.condition:
+                    self.counters['created'] += 1
+                return client
+            except OSError:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def evict_idle(self):
+        """
+        function to close connections idle for longer than idle_timeout
+        must be called with the condition held
+        """
+        deadline = time.monotonic() - self.idle_timeout
+        while self.idle and self.idle[0][1] < deadline:
+            client, _ = self.idle.popleft()
+            client.socket_s.close()
+            self.counters['discarded'] += 1
+
+    def acquire(self, timeout=None):
+        """
+        function to take a connection from the pool
+        waits for a free connection when all of them are in use
+        """
+        start = time.monotonic()
+        with self.condition:
+            self.evict_idle()
+            waited = False
+            while not self.idle and self.in_use >= self.size and not self.closed:
+                waited = True
+                remaining = None if timeout is None else timeout - (time.monotonic() - start)
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError('No connection became free in {} seconds.'.format(timeout))
+                self.condition.wait(remaining)
+            if self.closed:
+                raise RuntimeError('The connection pool is closed.')
+            if waited:
+                wait_time = time.monotonic() - start
+                self.counters['waits'] += 1
+                self.counters['wait_time'] += wait_time
+                self.counters['max_wait'] = max(self.counters['max_wait'], wait_time)
+            self.counters['acquired'] += 1
+            self.in_use += 1
+            # reuse the most recently released connection that is still alive
+            while self.idle:
+                client, _ = self.idle.pop()
+                if is_alive(client.socket_s):
+                    return client
+                client.socket_s.close()
+                self.counters['discarded'] += 1
+        # nothing to reuse, open a new connection outside the lock
+        try:
+            return self.connect()
+        except BaseException:
+            with self.condition:
+                self.in_use -= 1
+                self.condition.notify()
+            raise
+
+    def release(self, client, healthy=True):
+        """
+        function to give a connection back to the pool
+        queued messages are sent first, broken connections are closed
+        """
+        if healthy:
+            try:
+                client.flush()
+            except OSError:
+                healthy = False
+        with self.condition:
+            self.in_use -= 1
+            if healthy and not self.closed:
+                self.idle.append((client, time.monotonic()))
+            else:
+                client.socket_s.close()
+                self.counters['discarded'] += 1
+            self.condition.notify()
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        """
+        function to borrow a connection for the duration of a with block
+        """
+        client = self.acquire(timeout)
+        try:
+            yield client
+        except BaseException:
+            self.release(client, healthy=False)
+            raise
+        self.release(client)
+
+    def send(self, data2send, content_type=protocol.CONTENT_UNKNOWN,
+             flags=protocol.FLAG_NONE, timeout=None):
+        """
+        function to send one message on a pooled connection
+        """
+        with self.connection(timeout) as client:
+            client.send(data2send, content_type, flags)
+
+    def stats(self):
+        """
+        function to get the pool statistics for sizing the pool
+        """
+        with self.condition:
+            stats = dict(self.counters)
+            stats['in_use'] = self.in_use
+            stats['idle'] = len(self.idle)
+        return stats
+
+    def close(self):
+        """
+        function to close the idle connections and stop handing out new ones
+        """
+        with self.condition:
+            self.closed = True
+            while self.idle:
+                client, _ = self.idle.popleft()
+                client.close()
+            self.condition.notify_all()
+
+def is_alive(socket_s):
+    """
+    function to check that the server has not closed a connection
+    a readable socket with nothing to peek at has been closed
+    """
+    try:
+        readable, _, _ = select.select([socket_s], [], [], 0)
+        return not readable or socket_s.recv(1, socket.MSG_PEEK) != b''
+    except (OSError, ValueError):
+        return False
+
 def main_function():
     """
     main function to send data to server
     """
     # Read configfile.ini file
     server_host, server_port, buffer_size, user_input, encrypt, data_format = reading_config()
+    current = settings.get_settings()
+    cipher = cipher_option(current.cipher)
+    codec = codec_option(current.compression)
+    level = current.level
+    threshold = current.threshold
+    budget = current.budget
+    if codec != protocol.CODEC_NONE and os.path.isfile(user_input):
+        # files smaller than the threshold are not compressed
+        if os.path.getsize(user_input) < threshold:
+            codec = protocol.CODEC_NONE
+        # files which do not compress still go out with sendfile
+        elif codec == protocol.CODEC_AUTO:
+            codec, level = probe_file(user_input, budget)
+    if current.transport == 'shm':
+        send_to_ring(user_input, current, encrypt, cipher, codec, level)
+        return
+    family = socket.AF_INET
+    if current.transport == 'unix':
+        # the address of a Unix domain socket is its path
+        family, server_host = socket.AF_UNIX, current.path
     # Create a client socket
-    socket_s = create_socket()
+    socket_s = create_socket(settings.socket_options(current), family)
     # Connect to the server
     connect_server(socket_s, server_host, server_port)
     # Check user input first
     if user_input[-4:]=='.txt':
-        data2send = text_file_process(user_input, encrypt, buffer_size)
+        if is_large_file(user_input, buffer_size):
+            if encrypt or codec != protocol.CODEC_NONE:
+                stream_file(user_input, socket_s, encryption=encrypt, cipher=cipher,
+                            codec=codec, level=level)
+            else:
+                send_file(user_input, socket_s)
+            return
+        data2send = text_file_process(user_input, encrypt, buffer_size, cipher, codec, level)
+        content_type = protocol.CONTENT_TEXT
+        flags = protocol.FLAG_ENCRYPTED | cipher if encrypt else protocol.FLAG_NONE
+        flags |= codec
+    elif user_input[-4:]=='.xml' and os.path.isfile(user_input):
+        # xml documents are decoded by the server record by record
+        stream_file(user_input, socket_s, content_type=protocol.CONTENT_XML, encryption=encrypt,
+                    cipher=cipher, codec=codec, level=level, records=True)
+        return
+    elif os.path.isfile(user_input):
+        # any other file is sent as it is, byte for byte
+        if encrypt or codec != protocol.CODEC_NONE:
+            stream_file(user_input, socket_s, content_type=protocol.CONTENT_BINARY,
+                        encryption=encrypt, cipher=cipher, codec=codec, level=level)
+        else:
+            send_file(user_input, socket_s, protocol.CONTENT_BINARY)
+        return
     else:
         try:
             isdictionary = ast.literal_eval(user_input)
         except Exception:
-            print('Error: Input must be a txt file or a dictionary.')
+            print('Error: Input must be a file or a dictionary.')
             sys.exit()
+        if isinstance(isdictionary, dict) and data_format == 'jsonl':
+            # large dictionaries are streamed one item per line
+            stream_records(isdictionary, socket_s, encryption=encrypt, cipher=cipher,
+                           codec=codec, level=level, budget=budget)
+            return
         if isinstance(isdictionary, dict):
-            data2send = dictionary_process(user_input, data_format)
-    send_to_server(data2send, socket_s)
+            data2send, flags = compress_data(dictionary_process(isdictionary, data_format),
+                                             codec, level, threshold, budget)
+            content_type = dictionary_content_type(data_format)
+    send_to_server(data2send, socket_s, content_type, flags)
 
 if __name__ == "__main__":
+    # settings given on the command line override configfile.ini
+    settings.configure()
     main_function()
@@ -9,12 +9,32 @@ Code version: 1.7
 Description:
 Python3 file for Server receiving data from Client.
 It keeps looping without closing server as default.
+In multi mode it keeps running and serves many clients concurrently
+with an asyncio event loop, decoding the received data in a pool
+of worker processes or threads.
 It can perform deserialisation if the data is deserialised.
 It can perform decryption if the data is encrypted.
+The client declares the type of the data, so it is decoded once
+with the matching decoder.
 It has configurable option to print received data to screen
 and or to save received data to file.
 The format of file to be saved can be one of the following:
 txt, pickle, JSON and XML.
+Streamed files are written to disk chunk by chunk as they arrive,
+with os.splice where the platform supports it. Binary files such as
+images are saved byte for byte.
+Large XML documents and JSON Lines sent as record streams are parsed
+incrementally, each record is saved as soon as it is complete.
+A long running server can append the messages to one file in batches
+instead of writing a new file for every message, or to files per client
+and format which are rotated by size or age and optionally gzipped.
+With more than one process the multi mode server is a supervisor forking
+worker processes, each serving clients on the same port with its own
+event loop, restarting them gracefully on SIGHUP and reporting their
+statistics on SIGUSR1.
+Clients on the same host may connect through a Unix domain socket instead
+of TCP, with the same frames, or hand their messages over in a shared
+memory ring where the server decodes them without copying them out.
 
 Modification(s):
 1. Renaming some variables.
@@ -23,16 +43,77 @@ Modification(s):
 import sys
 import os
 import socket
-import configparser
+import asyncio
+import functools
+import concurrent.futures
 import codecs
 import json
 import pickle
 import ast
+import builtins
+import io
+import time
+import gzip
+import shutil
+import threading
+import queue
+import signal
+import select
+import stat
+import collections
+import xml.etree.ElementTree
 from dict2xml import dict2xml
 import xmltodict
 from cryptography.fernet import Fernet
+import protocol
+import settings
+import ring
 
 
+# statistics of the clients served by this process
+stats = collections.Counter()
+
+
+class RestrictedUnpickler(pickle.Unpickler):
+    """
+    unpickler which only rebuilds plain data types,
+    so a received pickle can not import and run arbitrary code
+    """
+    safe_builtins = {'bytearray', 'bytes', 'complex', 'frozenset', 'range', 'set', 'slice'}
+
+    def find_class(self, module, name):
+        if module == 'builtins' and name in self.safe_builtins:
+            return getattr(builtins, name)
+        raise pickle.UnpicklingError('{}.{} is not allowed in received data.'.format(module, name))
+
+def restricted_loads(data, buffers=()):
+    """
+    function to deserialise a pickle with the restricted unpickler
+    """
+    return RestrictedUnpickler(io.BytesIO(data), buffers=buffers).load()
+
+def unpickle_data(payload):
+    """
+    function to deserialise a binary pickle payload
+    the out-of-band buffers are used in place without copying
+    """
+    parts = protocol.unpack_parts(payload)
+    return restricted_loads(parts[0], parts[1:])
+
+def detach_buffers(data):
+    """
+    function to copy the out-of-band buffers of unpickled data into bytes
+    memoryviews can not be pickled, so this is needed before decoded data
+    leaves a worker process or is saved as a pickle
+    """
+    if isinstance(data, memoryview):
+        return data.tobytes()
+    if isinstance(data, dict):
+        return {key: detach_buffers(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple, set, frozenset)):
+        return type(data)(detach_buffers(value) for value in data)
+    return data
+
 def is_dictionary_stream(stream):
     """
     function to check if the data is dictionary
@@ -48,7 +129,7 @@ def is_pickle_stream(stream):
     function to check if the data is in pickle format
     """
     try:
-        data = pickle.loads(ast.literal_eval(stream))
+        data = restricted_loads(ast.literal_eval(stream))
         if data is not None:
             return True
     except Exception:
@@ -65,71 +146,113 @@ def is_json_stream(stream):
     except Exception:
         return False
 
-def is_xml_stream(stream):
+def load_xml(stream):
     """
-    function to check if the data is in xml format
+    function to parse xml data
+    returns None if the data is not in xml format
     """
     try:
-        data = xmltodict.parse(stream)
-        if data is not None:
-            return True
+        return xmltodict.parse(stream)
     except Exception:
-        return False
+        return None
+
+def is_xml_stream(stream):
+    """
+    function to check if the data is in xml format
+    """
+    return load_xml(stream) is not None
 
 def reading_config():
     """
     function to read configfile.ini file
+    the file is only parsed again when it has changed
     """
-    config_obj = configparser.ConfigParser()
     try:
-        filename = 'configfile.ini'
-        dir_path = os.path.dirname(os.path.realpath(filename))
-        # get file path
-        filepath = dir_path+"\\"+filename
         # check if file exists
         # get the file size
-        filesize = os.path.getsize(filepath)
+        filesize = os.path.getsize(settings.state['file'])
         # continue if file exists
         if filesize > 0:
-            config_obj.read(filepath)
-            param = config_obj["setting"]
-            server_host = param["host"]
-            server_port = int(param["port"])
-            buffer_size = int(param["buffer"])
-            user_input = config_obj["server"]
-            enable_print = ast.literal_eval(user_input["print"])
-            enable_save = ast.literal_eval(user_input["save"])
-            file_format = user_input["file"]
+            settings.reload_settings()
+            current = settings.get_settings()
             print('The config file exists and all the parameters have been assigned.')
-            return server_host, server_port, buffer_size, enable_print, enable_save, file_format
+            return (current.host, current.port, current.buffer_size, current.enable_print,
+                    current.enable_save, current.file)
+    except ValueError:
+        # the wrong setting is already reported
+        sys.exit()
     except Exception:
         # prevent input file which does not exist
         print('Error: The config file does not exist')
         sys.exit()
 
-def create_socket():
+def create_socket(options=None, family=socket.AF_INET):
     """
     function to create a server socket
+    options are the socket options of protocol.tune_socket,
+    the accepted connections inherit them
+    family socket.AF_UNIX creates a Unix domain socket
     """
     try:
-        socket_s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        socket_s = socket.socket(family, socket.SOCK_STREAM)
+        if options:
+            protocol.tune_socket(socket_s, **options)
         print("The server socket is created. Waiting for connection.")
         return socket_s
     except Exception:
         print('Error: Fail to create server socket.')
         sys.exit()
 
-def connect_client(socket_s, server_host, server_port):
+def remove_socket_file(path):
+    """
+    function to remove the file of a Unix domain socket no server listens on
+    """
+    try:
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            return
+    except OSError:
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+    except OSError:
+        pass
+    finally:
+        probe.close()
+
+def bind_socket(socket_s, server_host, server_port):
+    """
+    function to bind a server socket to its address
+    the host of a Unix domain socket is its path, a file left
+    by a server which has stopped is removed first
+    """
+    address = protocol.socket_address(socket_s, server_host, server_port)
+    if isinstance(address, str):
+        remove_socket_file(address)
+    socket_s.bind(address)
+
+def address_text(socket_s, server_host, server_port):
+    """
+    function to get the address of a server socket for messages
+    """
+    address = protocol.socket_address(socket_s, server_host, server_port)
+    if isinstance(address, str):
+        return address
+    return '{}:{}'.format(*address)
+
+def connect_client(socket_s, server_host, server_port, backlog=5):
     """
     function to connect to the client
     """
     try:
         # bind the socket to our local address
-        socket_s.bind((server_host, server_port))
+        bind_socket(socket_s, server_host, server_port)
         # enabling our server to accept connections
         # The amount of unaccepted connections that the system
-        # will tolerate before rejecting additional connections is 5
-        socket_s.listen(5)
+        # will tolerate before rejecting additional connections is backlog
+        socket_s.listen(backlog)
         # accept any connection
         client_socket = socket_s.accept()[0]
         print('Connected to client.')
@@ -138,9 +261,187 @@ def connect_client(socket_s, server_host, server_port):
         print('Error: Fail to connect to the client.')
         sys.exit()
 
-def data_decryption(data):
+def receive_header(client_socket, max_frame=protocol.MAX_FRAME_SIZE):
+    """
+    function to receive the header of the next frame from the client
+    returns None when the client has closed the connection
+    frames longer than max_frame bytes are refused
+    """
+    try:
+        return protocol.recv_header(client_socket, max_frame)
+    except Exception:
+        print('Error: Fail to receive data from the client.')
+        sys.exit()
+
+def receive_payload(client_socket, length):
+    """
+    function to receive one framed payload from the client
+    the header gives the payload length, so the whole payload
+    is read whatever its size
+    """
+    try:
+        return protocol.recv_exactly(client_socket, length)
+    except Exception:
+        print('Error: Fail to receive data from the client.')
+        sys.exit()
+
+class StreamDecryptor:
+    """
+    decryptor for the chunks of an encrypted stream
+    checks that the chunks arrive in order and that the stream is complete
+    """
+
+    def __init__(self, key, cipher=protocol.CIPHER_FERNET):
+        self.cipher = protocol.make_cipher(cipher, key)
+        self.sequence = 0
+        self.finished = False
+
+    def decrypt(self, token):
+        """
+        function to decrypt the next chunk of the stream
+        """
+        message = self.cipher.decrypt(bytes(token))
+        sequence, last = protocol.CHUNK_PREFIX.unpack_from(message)
+        if self.finished or sequence != self.sequence:
+            raise ValueError('Encrypted chunk {} is out of order.'.format(sequence))
+        self.sequence += 1
+        self.finished = bool(last)
+        return memoryview(message)[protocol.CHUNK_PREFIX.size:]
+
+    def check_complete(self):
+        """
+        function to check that the last chunk of the stream has arrived
+        """
+        if not self.finished:
+            raise ValueError('Encrypted stream ended before its last chunk.')
+
+def stream_chunks(client_socket, flags, length, max_frame=protocol.MAX_FRAME_SIZE):
+    """
+    generator of the chunks of a stream sent as many frames
+    encrypted and compressed chunks are decrypted and decompressed,
+    so the caller gets the original data chunk by chunk
+    """
+    decryptor = None
+    if flags & protocol.FLAG_ENCRYPTED:
+        # the first frame of an encrypted stream holds the key
+        decryptor = StreamDecryptor(protocol.recv_exactly(client_socket, length),
+                                    flags & protocol.CIPHER_MASK)
+    else:
+        yield protocol.decompress(protocol.recv_exactly(client_socket, length),
+                                  flags & protocol.CODEC_MASK)
+    while flags & protocol.FLAG_MORE:
+        header = protocol.recv_header(client_socket, max_frame)
+        if header is None:
+            raise ConnectionError('Connection closed in the middle of the stream.')
+        flags, _, length = header
+        chunk = protocol.recv_exactly(client_socket, length)
+        if decryptor is not None:
+            chunk = decryptor.decrypt(chunk)
+        yield protocol.decompress(chunk, flags & protocol.CODEC_MASK)
+    if decryptor is not None:
+        decryptor.check_complete()
+
+def write_chunks(chunks, myfile):
+    """
+    function to write the chunks of a stream to a file as they arrive
+    """
+    total = 0
+    for chunk in chunks:
+        myfile.write(chunk)
+        total += len(chunk)
+    return total
+
+def receive_file(client_socket, flags, length, file, enable_save, buffer_size,
+                 max_frame=protocol.MAX_FRAME_SIZE):
+    """
+    function to receive a streamed file from the client
+    every chunk is written to disk as soon as it arrives,
+    so memory use does not depend on the file size
+    os.splice is used where available so the chunks stay in the kernel
+    """
+    if flags & protocol.FLAG_ENCRYPTED:
+        try:
+            with open(file if enable_save else os.devnull, 'wb') as myfile:
+                total = write_chunks(stream_chunks(client_socket, flags, length, max_frame),
+                                     myfile)
+            print('Encrypted file of {} bytes is received and decrypted.'.format(total))
+            return total
+        except Exception:
+            print('Error: Fail to receive the encrypted file.')
+            sys.exit()
+    if flags & protocol.CODEC_MASK:
+        try:
+            with open(file if enable_save else os.devnull, 'wb') as myfile:
+                total = write_chunks(stream_chunks(client_socket, flags, length, max_frame),
+                                     myfile)
+            print('Compressed file of {} bytes is received and decompressed.'.format(total))
+            return total
+        except Exception:
+            print('Error: Fail to receive the compressed file.')
+            sys.exit()
+    try:
+        buffer = bytearray(buffer_size)
+        total = 0
+        # the chunks are still read when saving is disabled
+        with open(file if enable_save else os.devnull, 'wb') as myfile:
+            while True:
+                if protocol.SPLICE_SUPPORTED:
+                    total += protocol.splice_into_file(client_socket, length, myfile)
+                else:
+                    total += protocol.recv_into_file(client_socket, length, myfile, buffer)
+                if not flags & protocol.FLAG_MORE:
+                    break
+                header = protocol.recv_header(client_socket, max_frame)
+                if header is None:
+                    raise ConnectionError('Connection closed in the middle of the file.')
+                flags, _, length = header
+        print('Streamed file of {} bytes is received.'.format(total))
+        return total
+    except Exception:
+        print('Error: Fail to receive the streamed file.')
+        sys.exit()
+
+def record_parser(content_type):
+    """
+    function to create the incremental parser for a record stream
+    """
+    if content_type == protocol.CONTENT_XML:
+        return XmlRecordParser()
+    if content_type == protocol.CONTENT_JSONL:
+        return JsonLinesParser()
+    raise ValueError('Records of content type {} can not be streamed.'.format(content_type))
+
+def receive_records(client_socket, flags, content_type, length, file, enable_print, enable_save,
+                    batch_writer=None, address=None, max_frame=protocol.MAX_FRAME_SIZE):
+    """
+    function to receive a record stream from the client
+    the records are decoded as the chunks arrive and each one
+    is printed and or saved as soon as it is complete,
+    the whole document is never held in memory
+    with a batch writer every record is appended to its file as a message
+    """
+    try:
+        parser = record_parser(content_type)
+        writer = RecordWriter(file) if enable_save and batch_writer is None else None
+        try:
+            count = 0
+            for chunk in stream_chunks(client_socket, flags, length, max_frame):
+                count += deliver_records(parser.feed(chunk), enable_print, writer,
+                                         batch_writer, address)
+            count += deliver_records(parser.close(), enable_print, writer, batch_writer, address)
+        finally:
+            if writer is not None:
+                writer.close()
+        print('Record stream of {} records is received.'.format(count))
+        return count
+    except Exception:
+        print('Error: Fail to receive the record stream.')
+        sys.exit()
+
+def data_decryption(data, raw=False):
     """
     function to perform decryption
+    with raw the decrypted bytes are returned without decoding them
     """
     try:
         # encryption label
@@ -152,7 +453,7 @@ def data_decryption(data):
             fernet = Fernet(key)
             # use the key to decrypt message
             dec_message = fernet.decrypt(message)
-            data_received = dec_message.decode()
+            data_received = dec_message if raw else dec_message.decode()
             print('Received data is decrypted.')
         else:
             data_received = data
@@ -161,28 +462,264 @@ def data_decryption(data):
         print('Error: Fail to decrypt data.')
         sys.exit()
 
-def receive_from_client(received, socket_s):
+def accept_handshake(public_key, psk=b''):
     """
-    function to receive data from client
+    function to answer the session handshake of a client
+    returns the public key to send back and the session key
     """
-    # check if the data is received
-    if len(received) > 0:
-        print('Data is received.')
-        # check the type of received data and perform deserialisation/decryption
-        if is_dictionary_stream(received):
+    private_key, server_public_key = protocol.generate_handshake_key()
+    session_key = protocol.derive_session_key(private_key, public_key, psk)
+    print('Session key is established.')
+    return server_public_key, session_key
+
+@functools.lru_cache(maxsize=128)
+def session_cipher(session_key, cipher=protocol.CIPHER_FERNET):
+    """
+    function to get the cipher of a session
+    the cipher is created once per session and reused for every message
+    """
+    return protocol.make_session_cipher(cipher, session_key)
+
+def session_decryption(data, session_key, cipher=protocol.CIPHER_FERNET):
+    """
+    function to perform decryption with the session key of the connection
+    """
+    try:
+        data_received = session_cipher(session_key, cipher).decrypt(bytes(data))
+        print('Received data is decrypted.')
+        return data_received
+    except Exception:
+        print('Error: Fail to decrypt data.')
+        sys.exit()
+
+def cipher_decryption(data, cipher):
+    """
+    function to perform decryption with an AEAD cipher
+    the raw key is followed by the raw ciphertext
+    """
+    try:
+        view = memoryview(data)
+        key, message = view[:protocol.AEAD_KEY_SIZE], view[protocol.AEAD_KEY_SIZE:]
+        data_received = protocol.make_cipher(cipher, key).decrypt(message)
+        print('Received data is decrypted.')
+        return data_received
+    except Exception:
+        print('Error: Fail to decrypt data.')
+        sys.exit()
+
+def decompress_data(data, codec):
+    """
+    function to decompress received data after it is decrypted
+    """
+    try:
+        data_received = protocol.decompress(bytes(data), codec)
+        print('Received data is decompressed.')
+        return data_received
+    except Exception:
+        print('Error: Fail to decompress data.')
+        sys.exit()
+
+def element_to_dict(element):
+    """
+    function to convert an xml element to a dictionary
+    the same way xmltodict does: attributes start with @, text next to
+    attributes or children is #text and repeated children become a list
+    """
+    result = {'@' + name: value for name, value in element.attrib.items()}
+    for child in element:
+        value = element_to_dict(child)
+        if child.tag not in result:
+            result[child.tag] = value
+        elif isinstance(result[child.tag], list):
+            result[child.tag].append(value)
+        else:
+            result[child.tag] = [result[child.tag], value]
+    text = (element.text or '').strip()
+    if text and not result:
+        return text
+    if text:
+        result['#text'] = text
+    return result or None
+
+class XmlRecordParser:
+    """
+    incremental parser for xml documents made of repeating records
+    the document is fed chunk by chunk as it arrives and every child of
+    the root element is returned as a dictionary as soon as it is complete,
+    then dropped, so memory use depends on the size of one record only
+    """
+
+    def __init__(self):
+        self.parser = xml.etree.ElementTree.XMLPullParser(events=('start', 'end'))
+        self.root = None
+        self.depth = 0
+
+    def feed(self, chunk):
+        """
+        function to parse the next chunk of the document
+        returns the records completed by the chunk
+        """
+        self.parser.feed(bytes(chunk))
+        return self.read_records()
+
+    def close(self):
+        """
+        function to finish the document
+        returns the last records and fails if the document is incomplete
+        """
+        self.parser.close()
+        records = self.read_records()
+        if self.root is None:
+            raise ValueError('The xml document is empty.')
+        return records
+
+    def read_records(self):
+        """
+        function to collect the records completed since the last call
+        """
+        records = []
+        for event, element in self.parser.read_events():
+            if event == 'start':
+                if self.root is None:
+                    self.root = element
+                self.depth += 1
+                continue
+            self.depth -= 1
+            if self.depth == 1:
+                records.append({element.tag: element_to_dict(element)})
+                self.root.remove(element)
+        return records
+
+class JsonLinesParser:
+    """
+    incremental parser for json lines, one json document per line
+    every complete line is decoded as soon as it arrives,
+    only the unfinished last line is kept between chunks
+    """
+
+    def __init__(self):
+        self.pending = bytearray()
+
+    def feed(self, chunk):
+        """
+        function to parse the next chunk of the stream
+        returns the records of the lines completed by the chunk
+        """
+        self.pending += chunk
+        end = self.pending.rfind(b'\n')
+        if end < 0:
+            return []
+        lines = self.pending[:end].split(b'\n')
+        del self.pending[:end + 1]
+        return [json.loads(line) for line in lines if line.strip()]
+
+    def close(self):
+        """
+        function to finish the stream
+        returns the record of a last line without a line break
+        """
+        records = [json.loads(self.pending)] if self.pending.strip() else []
+        self.pending.clear()
+        return records
+
+def sniff_data(received):
+    """
+    function to find the type of received data by trying each format
+    and perform deserialisation/decryption
+    only used for data sent without a content type
+    """
+    if is_dictionary_stream(received):
+        print('Received data is a dictionary.')
+        data_received = ast.literal_eval(received)
+    elif is_pickle_stream(received):
+        print('Received data is pickled.')
+        data_received = restricted_loads(ast.literal_eval(received))
+    elif is_json_stream(received):
+        print('Received data is in JSON format')
+        data_received = json.loads(received)
+    else:
+        # parsed once, the document is used if it is xml
+        document = load_xml(received)
+        if document is not None:
+            print('Received data is in XML format')
+            data_received = document
+        else:
+            data_received = str(data_decryption(received))
+    return data_received
+
+def decode_data(received, content_type=protocol.CONTENT_UNKNOWN, encrypted=False, sniff=True,
+                session_key=None, cipher=protocol.CIPHER_FERNET, codec=protocol.CODEC_NONE):
+    """
+    function to perform decryption/deserialisation of received data
+    the content type declared by the client selects the decoder,
+    data without a content type is sniffed when sniffing is enabled
+    and handled as text otherwise
+    encrypted data is decrypted with the session key when one is given,
+    otherwise the key is expected in front of the message
+    compressed data is decompressed after it is decrypted
+    binary data and pickles are kept as bytes, everything else is decoded to text
+    the decoded objects are returned as they are, not as strings
+    """
+    if encrypted and session_key is not None:
+        received = session_decryption(received, session_key, cipher)
+        encrypted = False
+    elif encrypted and cipher != protocol.CIPHER_FERNET:
+        received = cipher_decryption(received, cipher)
+        encrypted = False
+    elif encrypted and codec != protocol.CODEC_NONE:
+        if isinstance(received, (bytes, bytearray)):
+            received = received.decode()
+        received = data_decryption(received, raw=True)
+        encrypted = False
+    if codec != protocol.CODEC_NONE:
+        received = decompress_data(received, codec)
+    if isinstance(received, (bytes, bytearray, memoryview)) and \
+            content_type not in (protocol.CONTENT_PICKLE, protocol.CONTENT_BINARY):
+        received = str(received, 'utf-8')
+    if content_type == protocol.CONTENT_UNKNOWN:
+        if sniff:
+            return sniff_data(received)
+        content_type = protocol.CONTENT_TEXT
+    if encrypted:
+        received = data_decryption(received)
+    try:
+        if content_type == protocol.CONTENT_DICT:
             print('Received data is a dictionary.')
-            data_received = str(received)
-        elif is_pickle_stream(received):
+            data_received = ast.literal_eval(received)
+        elif content_type == protocol.CONTENT_PICKLE:
             print('Received data is pickled.')
-            data_received = str(pickle.loads(ast.literal_eval(received)))
-        elif is_json_stream(received):
+            data_received = unpickle_data(received)
+        elif content_type == protocol.CONTENT_JSON:
             print('Received data is in JSON format')
-            data_received = str(json.loads(received))
-        elif is_xml_stream(received):
+            data_received = json.loads(received)
+        elif content_type == protocol.CONTENT_XML:
             print('Received data is in XML format')
-            data_received = str(xmltodict.parse(received))
+            data_received = xmltodict.parse(received)
+        elif content_type == protocol.CONTENT_JSONL:
+            print('Received data is in JSON Lines format')
+            data_received = [json.loads(line) for line in received.splitlines() if line.strip()]
+        elif content_type == protocol.CONTENT_TEXT:
+            data_received = str(received)
+        elif content_type == protocol.CONTENT_BINARY:
+            print('Received data is binary.')
+            data_received = bytes(received)
         else:
-            data_received = str(data_decryption(received))
+            raise ValueError('Unknown content type: {}'.format(content_type))
+        return data_received
+    except Exception:
+        print('Error: Fail to decode data.')
+        sys.exit()
+
+def receive_from_client(received, socket_s, content_type=protocol.CONTENT_UNKNOWN,
+                        encrypted=False, sniff=True):
+    """
+    function to receive data from client
+    """
+    # check if the data is received
+    if len(received) > 0:
+        print('Data is received.')
+        # perform deserialisation/decryption for the type of received data
+        data_received = decode_data(received, content_type, encrypted, sniff)
         # close the socket
         socket_s.close()
         print("The task is completed. And the connection is closed.")
@@ -194,31 +731,54 @@ def receive_from_client(received, socket_s):
 def printing_data(data_received):
     """
     function to print received data to screen
+    decoded objects are only formatted here, for printing
+    binary data is summarised instead of printed
+    """
+    if isinstance(data_received, bytes):
+        print('The received data: {} bytes of binary data'.format(len(data_received)))
+    else:
+        print('The received data: {}'.format(data_received))
+
+def json_text(data_received):
+    """
+    function to turn decoded data into json text
+    values json has no type for, such as sets, are saved as text,
+    data json can not hold at all, such as tuple keys, is saved as its text
     """
-    print('The received data: ' + data_received)
+    try:
+        return json.dumps(data_received, default=str)
+    except (TypeError, ValueError):
+        return json.dumps(str(data_received))
 
 def save_file(data_received, file):
     """
     function to save data content to text file
     format can be txt, pickle, JSON or XML
+    decoded objects are saved with their own structure,
+    binary data is written as it is, whatever the format
     """
+    if isinstance(data_received, bytes):
+        with open(file, 'wb') as myfile:
+            myfile.write(data_received)
+            print('The file in binary format is created.')
+        return
     # get the file name and file format
     file_format = str(file).split('.')[1]
     if file_format in ['txt','pickle','json','xml']:
         if file_format == 'txt':
             # save data to txt file
             with open(file, 'w') as myfile:
-                myfile.write(data_received)
+                myfile.write(str(data_received))
                 print('The text file in txt format is created.')
         elif file_format == 'pickle':
             # save data to pickle file
             with open(file, 'wb') as myfile:
-                pickle.dump(data_received, myfile)
+                pickle.dump(detach_buffers(data_received), myfile)
                 print('The text file in pickle format is created.')
         elif file_format == 'json':
             # save data to json file
             with codecs.open(file, 'w', encoding='utf-8') as myfile:
-                json.dump(data_received, myfile)
+                myfile.write(json_text(data_received))
                 print('The text file in json format is created.')
         elif file_format == 'xml':
             # save data to xml file
@@ -231,23 +791,1083 @@ def save_file(data_received, file):
         print('Error: Please select one of the format: txt, Pickle, JSON or XML.')
         sys.exit()
 
+def serialise_record(record, file_format, wrap=None):
+    """
+    function to turn one record into the bytes written to a file
+    txt and JSON records take one line, an XML record is wrapped in
+    the wrap element if given and binary data is kept as it is
+    """
+    if isinstance(record, bytes):
+        return record
+    if file_format == 'txt':
+        return (str(record) + '\n').encode('utf-8')
+    if file_format == 'pickle':
+        return pickle.dumps(detach_buffers(record))
+    if file_format == 'json':
+        return (json_text(record) + '\n').encode('utf-8')
+    return (dict2xml(record, wrap=wrap, indent=' ') + '\n').encode('utf-8')
+
+class RecordWriter:
+    """
+    writer saving the records of a record stream one after the other
+    format can be txt, pickle, JSON or XML, like save_file:
+    txt and JSON files get one record per line, an XML file gets
+    one root element around all records and a pickle file one pickle
+    per record
+    """
+
+    def __init__(self, file):
+        self.file_format = str(file).split('.')[1]
+        if self.file_format not in ['txt', 'pickle', 'json', 'xml']:
+            raise ValueError('Unsupported file format: {}'.format(self.file_format))
+        self.myfile = open(file, 'wb')
+        if self.file_format == 'xml':
+            self.myfile.write(b'<root>\n')
+
+    def write(self, records):
+        """
+        function to append records to the file
+        """
+        for record in records:
+            self.myfile.write(serialise_record(record, self.file_format))
+
+    def close(self):
+        """
+        function to finish and close the file
+        """
+        if self.file_format == 'xml':
+            self.myfile.write(b'</root>\n')
+        self.myfile.close()
+        print('The records are saved in {} format.'.format(self.file_format))
+
+class DiskWriter:
+    """
+    thread doing the blocking writes and syncs of the batch writers,
+    so the event loop of the multi mode server never waits for the disk
+    the jobs run one after the other in the order they were given
+    """
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, function, *args):
+        """
+        function to give a job to the thread
+        """
+        self.jobs.put((function, args))
+
+    def run(self):
+        """
+        function to run the jobs until the writer is closed
+        """
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            function, args = job
+            try:
+                function(*args)
+            except OSError:
+                print('Error: Fail to write the messages to the disk.')
+
+    def close(self):
+        """
+        function to wait for the jobs given so far and stop the thread
+        """
+        self.jobs.put(None)
+        self.thread.join()
+
+class BatchWriter:
+    """
+    writer appending the messages of a long running server to one file
+    messages are kept in memory and written together once batch_size
+    bytes are waiting or the oldest one waits for batch_time seconds
+    fsync can be none (left to the operating system), batch (after
+    every write of a batch) or message (every message written at once)
+    the batches are written by a disk writer thread, its own one unless
+    one is shared with other writers
+    txt and JSON files get one message per line, an XML file one root
+    element per message and a pickle file one pickle per message
+    """
+
+    def __init__(self, file, batch_size=65536, batch_time=1.0, fsync='none', disk=None):
+        self.file_format = os.path.splitext(str(file))[1][1:]
+        if self.file_format not in ['txt', 'pickle', 'json', 'xml']:
+            raise ValueError('Unsupported file format: {}'.format(self.file_format))
+        if fsync not in ['none', 'batch', 'message']:
+            raise ValueError('Unsupported fsync policy: {}'.format(fsync))
+        self.batch_size = batch_size
+        self.batch_time = batch_time
+        self.fsync = fsync
+        self.myfile = open(file, 'ab')
+        # bytes in the file including the waiting messages
+        self.size = self.myfile.tell()
+        self.buffer = bytearray()
+        self.messages = 0
+        self.oldest = None
+        self.own_disk = disk is None
+        self.disk = DiskWriter() if disk is None else disk
+
+    def write(self, data_received, address=None):
+        """
+        function to add one message to the batch
+        the batch is written when it is full or old enough
+        the client address is not used, all messages go to one file
+        """
+        record = serialise_record(data_received, self.file_format, 'root')
+        self.buffer += record
+        self.size += len(record)
+        self.messages += 1
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+        if self.fsync == 'message' or len(self.buffer) >= self.batch_size or self.due():
+            self.flush()
+
+    def due(self):
+        """
+        function to tell whether the waiting messages are batch_time old
+        """
+        return self.oldest is not None and time.monotonic() - self.oldest >= self.batch_time
+
+    def flush(self):
+        """
+        function to hand the waiting messages over to the disk writer
+        """
+        if not self.buffer:
+            return
+        self.disk.submit(self.write_batch, self.buffer, self.messages)
+        self.buffer = bytearray()
+        self.messages = 0
+        self.oldest = None
+
+    def write_batch(self, batch, messages):
+        """
+        function to write one batch to the file, run by the disk writer
+        """
+        self.myfile.write(batch)
+        self.myfile.flush()
+        if self.fsync != 'none':
+            os.fsync(self.myfile.fileno())
+        print('{} messages are saved in {} format.'.format(messages, self.file_format))
+
+    def close(self):
+        """
+        function to write the last batch and close the file
+        waits for the disk writer unless it is shared
+        """
+        self.flush()
+        self.disk.submit(self.myfile.close)
+        if self.own_disk:
+            self.disk.close()
+
+def compress_segment(segment):
+    """
+    function to replace a closed segment by its gzip file
+    """
+    try:
+        with open(segment, 'rb') as source, gzip.open(segment + '.gz', 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.remove(segment)
+    except OSError:
+        print('Error: Fail to compress {}.'.format(segment))
+
+def partition_name(address):
+    """
+    function to get the directory name of a client address
+    """
+    if isinstance(address, tuple):
+        address = address[0]
+    if not address:
+        return 'local'
+    return str(address).replace(':', '_').replace(os.sep, '_')
+
+class RotatingSink:
+    """
+    writer appending messages to segment files partitioned by format and client
+    address, directory/format/client/name-time-process-number.format,
+    so concurrent clients do not share one file
+    a segment is closed once it holds rotate_size bytes or is rotate_time
+    seconds old (0 never rotates) and gzipped in the background if compress
+    messages are batched within a segment like with BatchWriter
+    """
+
+    def __init__(self, directory, file, rotate_size=64 * 1024 * 1024, rotate_time=3600.0,
+                 compress=False, batch_size=65536, batch_time=1.0, fsync='none'):
+        self.name, extension = os.path.splitext(os.path.basename(str(file)))
+        self.file_format = extension[1:]
+        if self.file_format not in ['txt', 'pickle', 'json', 'xml']:
+            raise ValueError('Unsupported file format: {}'.format(self.file_format))
+        if fsync not in ['none', 'batch', 'message']:
+            raise ValueError('Unsupported fsync policy: {}'.format(fsync))
+        self.directory = directory
+        self.rotate_size = rotate_size
+        self.rotate_time = rotate_time
+        self.batch_size = batch_size
+        self.batch_time = batch_time
+        self.fsync = fsync
+        # partition -> (writer of the open segment, time it was opened)
+        self.segments = {}
+        self.counter = 0
+        # one thread gzips the closed segments one after the other
+        self.compressor = concurrent.futures.ThreadPoolExecutor(1) if compress else None
+        self.disk = DiskWriter()
+
+    def open_segment(self, partition):
+        """
+        function to start a new segment file in the partition
+        """
+        folder = os.path.join(self.directory, self.file_format, partition)
+        os.makedirs(folder, exist_ok=True)
+        self.counter += 1
+        # worker processes of the supervisor write to the same partitions
+        segment = os.path.join(folder, '{}-{}-{}-{}.{}'.format(
+            self.name, time.strftime('%Y%m%d-%H%M%S'), os.getpid(), self.counter,
+            self.file_format))
+        writer = BatchWriter(segment, self.batch_size, self.batch_time, self.fsync, self.disk)
+        self.segments[partition] = (writer, time.monotonic())
+        return writer
+
+    def close_segment(self, partition):
+        """
+        function to close the segment of the partition and compress it
+        """
+        writer = self.segments.pop(partition)[0]
+        writer.close()
+        if self.compressor is not None:
+            # the segment is only compressed once the disk writer has closed it
+            self.disk.submit(self.compressor.submit, compress_segment, writer.myfile.name)
+
+    def expired(self, partition):
+        """
+        function to tell whether the segment of the partition is to be rotated
+        """
+        writer, opened = self.segments[partition]
+        if self.rotate_size and writer.size >= self.rotate_size:
+            return True
+        return bool(self.rotate_time) and time.monotonic() - opened >= self.rotate_time
+
+    def write(self, data_received, address=None):
+        """
+        function to add one message to the segment of the client
+        """
+        partition = partition_name(address)
+        if partition in self.segments and self.expired(partition):
+            self.close_segment(partition)
+        if partition in self.segments:
+            writer = self.segments[partition][0]
+        else:
+            writer = self.open_segment(partition)
+        writer.write(data_received)
+
+    def due(self):
+        """
+        function to tell whether a batch is to be written or a segment rotated
+        """
+        return any(writer.due() or self.expired(partition)
+                   for partition, (writer, _) in self.segments.items())
+
+    def flush(self):
+        """
+        function to write the due batches and close the segments to be rotated
+        """
+        for partition in list(self.segments):
+            if self.expired(partition):
+                self.close_segment(partition)
+            elif self.segments[partition][0].due():
+                self.segments[partition][0].flush()
+
+    def close(self):
+        """
+        function to close all segments and wait for their compression
+        """
+        for partition in list(self.segments):
+            self.close_segment(partition)
+        self.disk.close()
+        if self.compressor is not None:
+            self.compressor.shutdown(wait=True)
+
+def create_batch_writer(file, enable_save):
+    """
+    function to create the batch writer or rotating sink configured for the server
+    returns None if every message is saved to its own file
+    """
+    current = settings.get_settings()
+    if not enable_save or current.writer == 'file':
+        return None
+    try:
+        if current.writer == 'batch':
+            return BatchWriter(file, current.batch_size, current.batch_time, current.fsync)
+        return RotatingSink(current.directory, file, current.rotate_size, current.rotate_time,
+                            current.rotate_compress, current.batch_size, current.batch_time,
+                            current.fsync)
+    except ValueError:
+        print('Error: Please check the options of the {} writer.'.format(current.writer))
+        sys.exit()
+
+def deliver_records(records, enable_print, writer, batch_writer=None, address=None):
+    """
+    function to print and or save the records decoded so far
+    with a batch writer every record is saved like a message
+    """
+    if enable_print:
+        for record in records:
+            printing_data(record)
+    if writer is not None:
+        writer.write(records)
+    elif batch_writer is not None:
+        for record in records:
+            batch_writer.write(record, address)
+    return len(records)
+
+def stream_file(file, batch_writer):
+    """
+    function to get the file a streamed file is saved to
+    the batch writer keeps its file open for appending, so with one
+    configured the streamed file is saved next to it, name-stream.format
+    """
+    if batch_writer is None:
+        return file
+    name, extension = os.path.splitext(str(file))
+    return '{}-stream{}'.format(name, extension)
+
+def deliver_data(data_received, enable_print, enable_save, file_format, batch_writer=None,
+                 address=None):
+    """
+    function to print and or save received data as configured
+    with a batch writer the data is appended to its file,
+    a rotating sink picks the file by the client address
+    """
+    if enable_print:
+        printing_data(data_received)
+    if enable_save:
+        if batch_writer is not None:
+            batch_writer.write(data_received, address)
+        else:
+            save_file(data_received, file_format)
+
+def create_pool(pool_type, workers):
+    """
+    function to create the worker pool that decodes received data
+    pool type can be process, thread or none
+    """
+    if pool_type == 'process':
+        return concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    if pool_type == 'thread':
+        return concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    if pool_type == 'none':
+        return None
+    # prevent unexpected input of pool type
+    print('Error: Please select one of the pools: process, thread or none.')
+    sys.exit()
+
+def decode_in_process(*args):
+    """
+    function to run decode_data in a worker process
+    the result is pickled back, so its buffers are copied first
+    """
+    return detach_buffers(decode_data(*args))
+
+async def decode_in_pool(pool, limit, *args):
+    """
+    coroutine to run decode_data with the given arguments in the worker pool
+    waiting for a free slot stops the connection from reading more,
+    which pushes back on the client when the workers are saturated
+    """
+    if pool is None:
+        return decode_data(*args)
+    if isinstance(pool, concurrent.futures.ProcessPoolExecutor):
+        function = decode_in_process
+    else:
+        function = decode_data
+    async with limit:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, function, *args)
+
+async def async_read_header(reader, max_frame=protocol.MAX_FRAME_SIZE):
+    """
+    coroutine to read the header of the next frame
+    returns None when the client has closed the connection
+    frames longer than max_frame bytes are refused before they are read
+    """
+    try:
+        header = await reader.readexactly(protocol.HEADER.size)
+    except asyncio.IncompleteReadError as error:
+        if error.partial:
+            raise
+        return None
+    return protocol.unpack_header(header, max_frame)
+
+async def async_receive_plain_file(reader, flags, length, myfile, buffer_size,
+                                   max_frame=protocol.MAX_FRAME_SIZE):
+    """
+    coroutine to receive an unencrypted stream into a file
+    each chunk is written as soon as it arrives
+    """
+    total = 0
+    while True:
+        remaining = length
+        while remaining > 0:
+            chunk = await reader.read(min(remaining, buffer_size))
+            if not chunk:
+                raise ConnectionError('Connection closed with {} bytes missing.'.format(remaining))
+            myfile.write(chunk)
+            remaining -= len(chunk)
+        total += length
+        if not flags & protocol.FLAG_MORE:
+            return total
+        header = await async_read_header(reader, max_frame)
+        if header is None:
+            raise ConnectionError('Connection closed in the middle of the file.')
+        flags, _, length = header
+
+async def async_stream_chunks(reader, flags, length, max_frame=protocol.MAX_FRAME_SIZE):
+    """
+    asynchronous generator of the chunks of a stream sent as many frames
+    encrypted and compressed chunks are decrypted and decompressed,
+    so the caller gets the original data chunk by chunk
+    """
+    decryptor = None
+    if flags & protocol.FLAG_ENCRYPTED:
+        # the first frame of an encrypted stream holds the key
+        decryptor = StreamDecryptor(await reader.readexactly(length), flags & protocol.CIPHER_MASK)
+    else:
+        yield protocol.decompress(await reader.readexactly(length), flags & protocol.CODEC_MASK)
+    while flags & protocol.FLAG_MORE:
+        header = await async_read_header(reader, max_frame)
+        if header is None:
+            raise ConnectionError('Connection closed in the middle of the stream.')
+        flags, _, length = header
+        chunk = await reader.readexactly(length)
+        if decryptor is not None:
+            chunk = decryptor.decrypt(chunk)
+        yield protocol.decompress(chunk, flags & protocol.CODEC_MASK)
+    if decryptor is not None:
+        decryptor.check_complete()
+
+def part_name(file, reader):
+    """
+    function to get the name of the temporary file a stream is received into
+    the workers are forked from one process and may give their readers the
+    same id, so the name holds the process id as well
+    """
+    return '{}.part{}.{}'.format(file, os.getpid(), id(reader))
+
+async def async_receive_records(reader, flags, content_type, length, file, enable_print,
+                                enable_save, batch_writer=None, address=None,
+                                max_frame=protocol.MAX_FRAME_SIZE):
+    """
+    coroutine to receive a record stream from a client of the multi mode server
+    the records go to a temporary file which replaces the output file
+    once the stream is complete, or with a batch writer to its file
+    """
+    part = part_name(file, reader)
+    parser = record_parser(content_type)
+    writer = RecordWriter(part) if enable_save and batch_writer is None else None
+    try:
+        count = 0
+        async for chunk in async_stream_chunks(reader, flags, length, max_frame):
+            count += deliver_records(parser.feed(chunk), enable_print, writer,
+                                     batch_writer, address)
+        count += deliver_records(parser.close(), enable_print, writer, batch_writer, address)
+        if writer is not None:
+            writer.close()
+            os.replace(part, file)
+    except BaseException:
+        # do not leave an incomplete file behind
+        if writer is not None:
+            writer.myfile.close()
+            os.remove(part)
+        raise
+    print('Record stream of {} records is received.'.format(count))
+    return count
+
+async def async_receive_file(reader, flags, length, file, enable_save, buffer_size,
+                             max_frame=protocol.MAX_FRAME_SIZE):
+    """
+    coroutine to receive a streamed file from a client of the multi mode server
+    the chunks go to a temporary file which replaces the output file
+    once complete, so concurrent transfers do not mix their chunks
+    """
+    part = part_name(file, reader)
+    try:
+        with open(part if enable_save else os.devnull, 'wb') as myfile:
+            if flags & (protocol.FLAG_ENCRYPTED | protocol.CODEC_MASK):
+                total = 0
+                async for chunk in async_stream_chunks(reader, flags, length, max_frame):
+                    myfile.write(chunk)
+                    total += len(chunk)
+            else:
+                total = await async_receive_plain_file(reader, flags, length, myfile, buffer_size,
+                                                       max_frame)
+        if enable_save:
+            os.replace(part, file)
+    except BaseException:
+        # do not leave an incomplete file behind
+        if enable_save and os.path.exists(part):
+            os.remove(part)
+        raise
+    print('Streamed file of {} bytes is received.'.format(total))
+    return total
+
+async def handle_client(reader, writer, buffer_size, enable_print, enable_save, file_format,
+                        pool=None, limit=None, sniff=False, psk=b'', batch_writer=None,
+                        max_frame=protocol.MAX_FRAME_SIZE):
+    """
+    coroutine to serve one client connection of the multi mode server
+    the client may send any number of messages on the connection
+    errors only end this connection, the server keeps running
+    a frame longer than max_frame bytes ends the connection before it is read
+    """
+    # clients of a Unix domain socket have no address
+    address = writer.get_extra_info('peername') or 'local'
+    print('Connected to client {}.'.format(address))
+    stats['connections'] += 1
+    session_key = None
+    try:
+        header = await async_read_header(reader, max_frame)
+        while header is not None:
+            flags, content_type, length = header
+            if content_type != protocol.CONTENT_HANDSHAKE:
+                stats['messages'] += 1
+                stats['bytes'] += length
+            if content_type == protocol.CONTENT_HANDSHAKE:
+                public_key, session_key = accept_handshake(await reader.readexactly(length), psk)
+                writer.write(protocol.pack_header(len(public_key), content_type=content_type)
+                             + public_key)
+                await writer.drain()
+            elif flags & protocol.FLAG_FILE:
+                await async_receive_file(reader, flags, length,
+                                         stream_file(file_format, batch_writer), enable_save,
+                                         buffer_size, max_frame)
+            elif flags & protocol.FLAG_MORE:
+                await async_receive_records(reader, flags, content_type, length, file_format,
+                                            enable_print, enable_save, batch_writer, address,
+                                            max_frame)
+            else:
+                received = await reader.readexactly(length)
+                if len(received) > 0:
+                    print('Data is received.')
+                    try:
+                        data_received = await decode_in_pool(
+                            pool, limit, received, content_type,
+                            bool(flags & protocol.FLAG_ENCRYPTED), sniff,
+                            session_key if flags & protocol.FLAG_SESSION else None,
+                            flags & protocol.CIPHER_MASK, flags & protocol.CODEC_MASK)
+                        deliver_data(data_received, enable_print, enable_save, file_format,
+                                     batch_writer, address)
+                    except SystemExit:
+                        # the processing functions exit on bad data, skip this message
+                        stats['errors'] += 1
+                        print('Error: Fail to process data from client {}.'.format(address))
+                else:
+                    print('Error: Received no data from client {}.'.format(address))
+            header = await async_read_header(reader, max_frame)
+    except Exception:
+        stats['errors'] += 1
+        print('Error: Fail to receive data from client {}.'.format(address))
+    finally:
+        writer.close()
+        print('The connection to client {} is closed.'.format(address))
+
+async def flush_batches(batch_writer):
+    """
+    coroutine to write batches which are due while no message arrives
+    """
+    while True:
+        await asyncio.sleep(batch_writer.batch_time)
+        if batch_writer.due():
+            batch_writer.flush()
+
+async def watch_settings(options, interval):
+    """
+    coroutine to apply changes of configfile.ini to the clients connecting next
+    buffer size, printing, sniffing, psk, the frame limit and the worker pool are reloaded,
+    a replaced pool is kept until the clients using it have disconnected
+    """
+    while True:
+        await asyncio.sleep(interval)
+        if not settings.reload_settings():
+            continue
+        current = settings.get_settings()
+        options.update(buffer_size=current.buffer_size, enable_print=current.enable_print,
+                       sniff=current.sniff, psk=current.psk.encode(),
+                       max_frame=current.max_frame)
+        if (current.pool, current.workers, current.queue) != options['pool_setting']:
+            old_pool = options['pool']
+            options['pool'] = create_pool(current.pool, current.workers)
+            options['limit'] = asyncio.Semaphore(current.queue or 2 * current.workers)
+            options['pool_setting'] = (current.pool, current.workers, current.queue)
+            if old_pool is not None and not options['users'][old_pool]:
+                # payloads already given to the old pool are still decoded
+                old_pool.shutdown(wait=False)
+        print('The settings are reloaded.')
+
+def create_listener(server_host, server_port, backlog=128, options=None, family=socket.AF_INET):
+    """
+    function to create the listening socket of the multi mode server
+    """
+    socket_s = create_socket(options, family)
+    try:
+        bind_socket(socket_s, server_host, server_port)
+        socket_s.listen(backlog)
+        socket_s.setblocking(False)
+        return socket_s
+    except Exception:
+        print('Error: Fail to listen on {}.'.format(address_text(socket_s, server_host,
+                                                                  server_port)))
+        socket_s.close()
+        sys.exit()
+
+def write_ready(stats_file, worker):
+    """
+    function to tell the supervisor that this worker process accepts clients
+    """
+    stats_file.write(json.dumps({'ready': True, 'worker': worker, 'pid': os.getpid()}) + '\n')
+    stats_file.flush()
+
+def write_stats(stats_file, worker):
+    """
+    function to send the statistics of this worker process to the supervisor
+    """
+    line = dict(stats, worker=worker, pid=os.getpid())
+    stats_file.write(json.dumps(line) + '\n')
+    stats_file.flush()
+
+async def report_stats(stats_file, worker, interval):
+    """
+    coroutine to send the statistics to the supervisor every interval seconds
+    """
+    while True:
+        await asyncio.sleep(interval)
+        write_stats(stats_file, worker)
+
+async def serve(server_host, server_port, buffer_size, enable_print, enable_save, file_format,
+                pool=None, queue_size=1, sniff=False, psk=b'', batch_writer=None,
+                reload_interval=0, backlog=128, socket_options=None, listener=None, grace=10.0,
+                family=socket.AF_INET, ready=None):
+    """
+    coroutine to accept and serve clients until the server is stopped
+    at most queue_size received payloads wait for or use the workers
+    with reload_interval configfile.ini is checked for changes that often
+    listener is a listening socket to serve, e.g. one shared by worker processes,
+    otherwise one of the family is created
+    ready is called once the server accepts clients
+    on SIGTERM no new clients are accepted and the connected ones are given
+    grace seconds to finish
+    """
+    current = settings.get_settings()
+    options = {'buffer_size': buffer_size, 'enable_print': enable_print, 'sniff': sniff,
+               'psk': psk, 'max_frame': current.max_frame, 'pool': pool,
+               'limit': asyncio.Semaphore(queue_size),
+               'pool_setting': (current.pool, current.workers, current.queue),
+               'users': collections.Counter()}
+
+    connections = set()
+
+    async def handler(reader, writer):
+        # the options are read when the client connects, so reloads apply
+        connections.add(asyncio.current_task())
+        client_pool = options['pool']
+        options['users'][client_pool] += 1
+        try:
+            await handle_client(reader, writer, options['buffer_size'], options['enable_print'],
+                                enable_save, file_format, client_pool, options['limit'],
+                                options['sniff'], options['psk'], batch_writer,
+                                options['max_frame'])
+        finally:
+            connections.discard(asyncio.current_task())
+            options['users'][client_pool] -= 1
+            if not options['users'][client_pool]:
+                del options['users'][client_pool]
+                if client_pool is not None and client_pool is not options['pool']:
+                    # the last client of a replaced pool has disconnected
+                    client_pool.shutdown(wait=False)
+
+    own_listener = listener is None
+    if own_listener:
+        listener = create_listener(server_host, server_port, backlog, socket_options, family)
+    address = address_text(listener, server_host, server_port)
+    server = await asyncio.start_server(handler, sock=listener)
+    print('The server is listening on {}.'.format(address))
+    if ready is not None:
+        ready()
+    stopping = asyncio.Event()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopping.set)
+    except (NotImplementedError, RuntimeError, ValueError):
+        # no signal handlers on Windows or outside the main thread
+        pass
+    tasks = []
+    if batch_writer is not None:
+        tasks.append(asyncio.create_task(flush_batches(batch_writer)))
+    if reload_interval:
+        tasks.append(asyncio.create_task(watch_settings(options, reload_interval)))
+    try:
+        await stopping.wait()
+    finally:
+        server.close()
+        if connections:
+            print('Waiting for {} clients to finish.'.format(len(connections)))
+            await asyncio.wait(connections, timeout=grace)
+        if options['pool'] is not pool and options['pool'] is not None:
+            options['pool'].shutdown()
+        if own_listener and family != socket.AF_INET:
+            remove_socket_file(server_host)
+
+async def serve_worker(server, worker, stats_file):
+    """
+    coroutine to run the server coroutine in a worker process of the
+    supervisor and report its statistics until it is stopped
+    """
+    interval = settings.get_settings().stats_interval
+    reporter = asyncio.create_task(report_stats(stats_file, worker, interval)) if interval else None
+    try:
+        await server
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+
+def run_server(server_host, server_port, buffer_size, enable_print, enable_save, file_format,
+               listener=None, worker=None, stats_file=None, family=socket.AF_INET):
+    """
+    function to run the multi mode server until it is interrupted or stopped
+    in a worker process of the supervisor it serves the listener, if any,
+    and sends its statistics to stats_file
+    """
+    current = settings.get_settings()
+    pool = create_pool(current.pool, current.workers)
+    batch_writer = create_batch_writer(file_format, enable_save)
+    socket_options = settings.socket_options(current, listening=True)
+    if worker is not None:
+        # the workers share the port
+        socket_options['reuseport'] = True
+    server = serve(server_host, server_port, buffer_size, enable_print,
+                   enable_save, file_format, pool, current.queue or 2 * current.workers,
+                   current.sniff, current.psk.encode(), batch_writer, current.reload,
+                   current.backlog, socket_options, listener, current.grace, family,
+                   None if worker is None else functools.partial(write_ready, stats_file, worker))
+    if worker is not None:
+        server = serve_worker(server, worker, stats_file)
+    try:
+        asyncio.run(server)
+        print('The server is stopped.')
+    except KeyboardInterrupt:
+        print('The server is stopped.')
+    except Exception:
+        print('Error: Fail to run the server.')
+        sys.exit()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if batch_writer is not None:
+            batch_writer.close()
+        if stats_file is not None:
+            write_stats(stats_file, worker)
+
+def start_worker(worker, listener, server_args):
+    """
+    function to fork a worker process of the supervisor
+    returns its pid and the pipe its statistics arrive on,
+    the worker writes a ready line on it once it accepts clients
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # worker process: Ctrl+C is for the supervisor, which stops the workers
+        os.close(read_fd)
+        for signum in (signal.SIGHUP, signal.SIGUSR1):
+            signal.signal(signum, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        code = 0
+        try:
+            with os.fdopen(write_fd, 'w') as stats_file:
+                run_server(*server_args, listener=listener, worker=worker, stats_file=stats_file)
+        except BaseException:
+            code = 1
+        finally:
+            os._exit(code)
+    os.close(write_fd)
+    return pid, read_fd
+
+def print_stats(worker_stats):
+    """
+    function to print the statistics of the worker processes
+    """
+    for pid, line in sorted(worker_stats.items()):
+        print('Worker {} (pid {}): {} connections, {} messages, {} bytes, {} errors.'.format(
+            line['worker'], pid, line.get('connections', 0), line.get('messages', 0),
+            line.get('bytes', 0), line.get('errors', 0)))
+
+def run_supervisor(server_host, server_port, buffer_size, enable_print, enable_save, file_format,
+                   family=socket.AF_INET):
+    """
+    function to run the multi mode server in several worker processes
+    the workers listen on the same port with SO_REUSEPORT, or share the
+    listening socket of the supervisor, and each runs its own event loop
+    a worker which dies is started again, SIGHUP replaces all workers one by
+    one without refusing clients, an old worker is only stopped once its
+    replacement accepts clients, SIGUSR1 prints the statistics of the
+    workers and SIGTERM or Ctrl+C stops them gracefully
+    the workers always share the listening socket of a Unix domain socket
+    """
+    current = settings.get_settings()
+    if not hasattr(os, 'fork'):
+        print('Error: Worker processes need os.fork, please set processes to 1.')
+        sys.exit()
+    listener = None
+    if (current.sharding == 'inherit' or not protocol.REUSEPORT_SUPPORTED
+            or family != socket.AF_INET):
+        listener = create_listener(server_host, server_port, current.backlog,
+                                   settings.socket_options(current, listening=True), family)
+    server_args = (server_host, server_port, buffer_size, enable_print, enable_save, file_format)
+    # pid -> worker number, stats pipe -> (pid, unfinished line), pid -> statistics,
+    # pid of a new worker -> pid of the worker it replaces once it is ready
+    workers = {}
+    pipes = {}
+    worker_stats = {}
+    started = {}
+    retiring = set()
+    replacing = {}
+    requests = collections.deque()
+
+    def start(worker):
+        pid, read_fd = start_worker(worker, listener, server_args)
+        workers[pid] = worker
+        pipes[read_fd] = (pid, b'')
+        started[pid] = time.monotonic()
+        return pid
+
+    signal.signal(signal.SIGHUP, lambda *_: requests.append('restart'))
+    signal.signal(signal.SIGUSR1, lambda *_: requests.append('stats'))
+    signal.signal(signal.SIGTERM, lambda *_: requests.append('stop'))
+    signal.signal(signal.SIGINT, lambda *_: requests.append('stop'))
+    for worker in range(current.processes):
+        start(worker)
+    print('The supervisor runs {} workers on {}.'.format(
+        current.processes, server_host if family != socket.AF_INET
+        else '{}:{}'.format(server_host, server_port)))
+    stopping = False
+    while workers or pipes:
+        for read_fd in select.select(list(pipes), [], [], 0.5)[0]:
+            pid, rest = pipes[read_fd]
+            data = os.read(read_fd, 65536)
+            if not data:
+                os.close(read_fd)
+                del pipes[read_fd]
+                continue
+            *lines, rest = (rest + data).split(b'\n')
+            pipes[read_fd] = (pid, rest)
+            for line in lines:
+                line = json.loads(line)
+                if not line.get('ready'):
+                    worker_stats[pid] = line
+                elif replacing.get(pid) in workers and not stopping:
+                    # the new worker accepts clients, the old one may stop now
+                    old = replacing.pop(pid)
+                    retiring.add(old)
+                    os.kill(old, signal.SIGTERM)
+        while workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            worker = workers.pop(pid, None)
+            # a worker exiting cleanly was stopped on purpose, e.g. by a service manager
+            failed = os.waitstatus_to_exitcode(status) != 0
+            if pid in replacing:
+                # the old worker keeps serving, the next SIGHUP tries again
+                print('Error: Worker {} fails to restart, pid {} keeps running.'.format(
+                    worker, replacing.pop(pid)))
+            elif pid in replacing.values():
+                # its replacement is already starting
+                for new, old in list(replacing.items()):
+                    if old == pid:
+                        del replacing[new]
+            elif worker is not None and failed and not stopping and pid not in retiring:
+                if time.monotonic() - started[pid] < 1:
+                    # a worker failing at once would fail again, e.g. on a port in use
+                    print('Error: Worker {} fails to start, the server is stopped.'.format(worker))
+                    requests.append('stop')
+                else:
+                    print('Worker {} (pid {}) has stopped, it is started again.'.format(worker, pid))
+                    start(worker)
+            retiring.discard(pid)
+            started.pop(pid, None)
+        while requests:
+            request = requests.popleft()
+            if request == 'stats':
+                print_stats(worker_stats)
+            elif request == 'restart' and not stopping:
+                print('The workers are restarted.')
+                for pid, worker in list(workers.items()):
+                    if pid not in retiring and pid not in replacing \
+                            and pid not in replacing.values():
+                        # the old worker is stopped once the new one is ready
+                        replacing[start(worker)] = pid
+            elif request == 'stop' and not stopping:
+                stopping = True
+                replacing.clear()
+                for pid in workers:
+                    os.kill(pid, signal.SIGTERM)
+    print_stats(worker_stats)
+    if listener is not None:
+        listener.close()
+        if family != socket.AF_INET:
+            remove_socket_file(server_host)
+    print('The server is stopped.')
+
+class ServerStopped(Exception):
+    """
+    raised by the SIGTERM handler of the ring server to leave the
+    blocking wait for the doorbell, so a stop is not taken for bad data
+    """
+
+def stop_server(signum, frame):
+    """
+    function to handle SIGTERM by stopping the ring server
+    """
+    raise ServerStopped()
+
+def serve_ring(ring_s, enable_print, enable_save, file_format, sniff=False,
+               batch_writer=None, forever=False):
+    """
+    function to decode the messages written into the shared memory ring
+    the payloads are decoded where they are in the ring, only encrypted
+    payloads are copied out first
+    a message which can not be decoded is skipped, the next ones are served
+    """
+    frames = ring_s.frames(forever)
+    try:
+        for flags, content_type, payload in frames:
+            if flags & (protocol.FLAG_MORE | protocol.FLAG_FILE | protocol.FLAG_SESSION) or \
+                    content_type == protocol.CONTENT_HANDSHAKE:
+                print('Error: Streams and sessions can not be sent through the ring.')
+                stats['errors'] += 1
+                continue
+            if len(payload) == 0:
+                print('Error: Received no data. Probably, the input file is empty.')
+                continue
+            print('Data is received.')
+            stats['messages'] += 1
+            stats['bytes'] += len(payload)
+            encrypted = bool(flags & protocol.FLAG_ENCRYPTED)
+            try:
+                data_received = decode_data(bytes(payload) if encrypted else payload,
+                                            content_type, encrypted, sniff, None,
+                                            flags & protocol.CIPHER_MASK,
+                                            flags & protocol.CODEC_MASK)
+                # nothing may point into the ring once the frame is given back
+                deliver_data(detach_buffers(data_received), enable_print, enable_save,
+                             file_format, batch_writer, 'ring')
+            except SystemExit:
+                # the processing functions exit on bad data, skip this message
+                stats['errors'] += 1
+                print('Error: Fail to process data from the ring.')
+    finally:
+        # gives the last frame back before the ring is closed
+        frames.close()
+
+def run_ring(current, enable_print, enable_save, file_format):
+    """
+    function to serve the clients on the same host through a shared memory ring
+    one client in single mode, one client after the other in multi mode
+    until the server is stopped
+    """
+    try:
+        ring_s = ring.RingReader(current.ring, current.doorbell, current.ring_size)
+    except FileExistsError:
+        print('Error: The ring {} is used by another server.'.format(current.ring))
+        sys.exit()
+    except OSError:
+        print('Error: The shared memory ring can not be created.')
+        sys.exit()
+    print('The server ring {} is ready. Waiting for messages.'.format(current.ring))
+    batch_writer = create_batch_writer(file_format, enable_save)
+    # the ring and the doorbell are removed on SIGTERM as well
+    signal.signal(signal.SIGTERM, stop_server)
+    try:
+        serve_ring(ring_s, enable_print, enable_save, file_format, current.sniff,
+                   batch_writer, current.mode == 'multi')
+    except (KeyboardInterrupt, ServerStopped):
+        pass
+    finally:
+        if batch_writer is not None:
+            batch_writer.close()
+        ring_s.close()
+    print('The server is stopped.')
+
 def main_function():
     """
     main function to receive data from client
     """
     #Read configfile.ini file
     server_host, server_port, buffer_size, enable_print, enable_save, file_format = reading_config()
+    current = settings.get_settings()
+    family = socket.AF_INET
+    if current.transport == 'unix':
+        # the address of a Unix domain socket is its path
+        family, server_host = socket.AF_UNIX, current.path
+    elif current.transport == 'shm':
+        run_ring(current, enable_print, enable_save, file_format)
+        return
+    # Keep serving clients in multi mode, in several processes if configured
+    if current.mode == 'multi':
+        if current.processes > 1:
+            run_supervisor(server_host, server_port, buffer_size, enable_print,
+                           enable_save, file_format, family)
+        else:
+            run_server(server_host, server_port, buffer_size, enable_print,
+                       enable_save, file_format, family=family)
+        return
     # Create a client socket
-    socket_s = create_socket()
+    socket_s = create_socket(settings.socket_options(current, listening=True), family)
     # Connect to the client
-    client_socket = connect_client(socket_s, server_host, server_port)
+    client_socket = connect_client(socket_s, server_host, server_port, current.backlog)
+    sniff = current.sniff
+    psk = current.psk.encode()
+    batch_writer = create_batch_writer(file_format, enable_save)
+    session_key = None
     # receive data using client socket, not server socket
-    received = client_socket.recv(buffer_size).decode()
-    data_received = receive_from_client(received, socket_s)
-    if enable_print:
-        printing_data(data_received)
-    if enable_save:
-        save_file(data_received, file_format)
+    # one message after the other until the client closes the connection
+    header = receive_header(client_socket, current.max_frame)
+    while header is not None:
+        flags, content_type, length = header
+        if content_type == protocol.CONTENT_HANDSHAKE:
+            public_key, session_key = accept_handshake(receive_payload(client_socket, length), psk)
+            protocol.send_frame(client_socket, public_key, content_type=content_type)
+        elif flags & protocol.FLAG_FILE:
+            receive_file(client_socket, flags, length, stream_file(file_format, batch_writer),
+                         enable_save, buffer_size, current.max_frame)
+        elif flags & protocol.FLAG_MORE:
+            receive_records(client_socket, flags, content_type, length, file_format,
+                            enable_print, enable_save, batch_writer, client_socket.getpeername(),
+                            current.max_frame)
+        else:
+            received = receive_payload(client_socket, length)
+            if len(received) > 0:
+                print('Data is received.')
+                data_received = decode_data(received, content_type,
+                                            bool(flags & protocol.FLAG_ENCRYPTED), sniff,
+                                            session_key if flags & protocol.FLAG_SESSION else None,
+                                            flags & protocol.CIPHER_MASK,
+                                            flags & protocol.CODEC_MASK)
+                deliver_data(data_received, enable_print, enable_save, file_format,
+                             batch_writer, client_socket.getpeername())
+            else:
+                print('Error: Received no data. Probably, the input file is empty.')
+        header = receive_header(client_socket, current.max_frame)
+    if batch_writer is not None:
+        batch_writer.close()
+    # close the sockets
+    client_socket.close()
+    socket_s.close()
+    if family != socket.AF_INET:
+        remove_socket_file(server_host)
+    print("The task is completed. And the connection is closed.")
 
 if __name__ == "__main__":
+    # settings given on the command line override configfile.ini
+    settings.configure()
     main_function()